@@ -0,0 +1,61 @@
+# bench/bench_catalogo.py
+"""
+Mide el armado y las búsquedas del índice en memoria del catálogo con N SKUs sintéticos.
+No usa la BD: el índice se arma directo con IndiceCatalogo.
+
+    python bench/bench_catalogo.py --skus 100000
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import catalogo  # noqa: E402
+
+TIPOS = ["Martillo", "Tornillo", "Clavo", "Taladro", "Llave", "Destornillador", "Sierra", "Alicate",
+         "Brocha", "Pintura", "Cinta", "Perno", "Tuerca", "Lija", "Manguera", "Candado", "Bisagra"]
+DETALLES = ["carpintero", "acero", "galvanizado", "inoxidable", "madera", "cruz", "paleta", "percutor",
+            "inalámbrico", "esmalte", "látex", "aislante", "hexagonal", "autoperforante", "jardín"]
+MEDIDAS = ['1/4"', '3/8"', '1/2"', '2"', '3"', "6mm", "8mm", "10mm", "1L", "4L", "20m", "50m"]
+CONSULTAS = ["ma", "mart", "martillo carp", "torn", "galv", "inox 8mm", "llave hex", "pintura 4l",
+             "autoperf", "cinta aisl", "zzz", "bisagra acero", "acero 999"]
+
+
+def _productos(n: int, rnd: random.Random):
+    for i in range(n):
+        nombre = f"{rnd.choice(TIPOS)} {rnd.choice(DETALLES)} {rnd.choice(MEDIDAS)} {rnd.randint(1, 999)}"
+        yield {"sku": f"{nombre[:4].upper()}-{i:06d}", "nombre": nombre, "precio": float(rnd.randint(5, 500) * 100)}
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--skus", type=int, default=100_000)
+    ap.add_argument("--repeticiones", type=int, default=200)
+    args = ap.parse_args()
+
+    rnd = random.Random(7)
+    productos = list(_productos(args.skus, rnd))
+    t0 = time.perf_counter()
+    idx = catalogo.IndiceCatalogo(productos)
+    print(f"{args.skus} SKUs, índice armado en {1000 * (time.perf_counter() - t0):.0f} ms")
+
+    consultas = CONSULTAS + [productos[123]["sku"]]  # SKU exacto
+    print(f"{'consulta':<16}{'p50 ms':>9}{'p99 ms':>9}{'resultados':>12}")
+    for q in consultas:
+        tiempos = []
+        for _ in range(args.repeticiones):
+            t = time.perf_counter()
+            res = idx.buscar(q, 10)
+            tiempos.append(1000 * (time.perf_counter() - t))
+        tiempos.sort()
+        p99 = tiempos[min(len(tiempos) - 1, int(len(tiempos) * 0.99))]
+        print(f"{q:<16}{statistics.median(tiempos):>9.3f}{p99:>9.3f}{len(res):>12}")
+
+
+if __name__ == "__main__":
+    main()
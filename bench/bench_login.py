@@ -0,0 +1,84 @@
+# bench/bench_login.py
+"""
+Latencia de login según el costo del KDF, con N logins simultáneos.
+
+Para cada configuración mide una verificación aislada y luego --concurrentes
+hilos verificando contraseñas a la vez durante --segundos (como en un peak de
+inicio de turno). Marca las que dejan el p99 bajo --objetivo-ms. No usa la BD:
+el costo del login es el KDF, la consulta del usuario es despreciable.
+
+    python bench/bench_login.py --concurrentes 16 --objetivo-ms 500
+    python bench/bench_login.py --pbkdf2 100000,600000 --scrypt 16384
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.join(ROOT, "src"))
+
+import hashing  # noqa: E402
+
+
+def _configurar(algoritmo: str, costo: int) -> str:
+    hashing.ALGORITMO = algoritmo
+    if algoritmo == "pbkdf2":
+        hashing.PBKDF2_ITERACIONES = costo
+        return f"pbkdf2 it={costo}"
+    hashing.SCRYPT_N = costo
+    return f"scrypt n={costo} r={hashing.SCRYPT_R} p={hashing.SCRYPT_P}"
+
+
+def _medir(almacenado: str, concurrentes: int, segundos: float):
+    fin = time.perf_counter() + segundos
+    latencias = []
+    lock = threading.Lock()
+
+    def cliente():
+        lat = []
+        while time.perf_counter() < fin:
+            t = time.perf_counter()
+            hashing.verificar("clave-de-prueba", almacenado)
+            lat.append(time.perf_counter() - t)
+        with lock:
+            latencias.extend(lat)
+
+    hilos = [threading.Thread(target=cliente) for _ in range(concurrentes)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    latencias.sort()
+    p = lambda q: 1000 * latencias[min(len(latencias) - 1, int(len(latencias) * q))]
+    return len(latencias) / segundos, p(0.5), p(0.99)
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--pbkdf2", default="100000,200000,600000", help="iteraciones a probar")
+    ap.add_argument("--scrypt", default="16384,32768", help="valores de n a probar")
+    ap.add_argument("--concurrentes", type=int, default=16)
+    ap.add_argument("--segundos", type=float, default=3.0)
+    ap.add_argument("--objetivo-ms", type=float, default=500.0, help="p99 máximo aceptable")
+    args = ap.parse_args()
+
+    configs = [("pbkdf2", int(c)) for c in args.pbkdf2.split(",") if c]
+    configs += [("scrypt", int(c)) for c in args.scrypt.split(",") if c]
+
+    print(f"{os.cpu_count()} CPUs, {args.concurrentes} logins simultáneos, objetivo p99 < {args.objetivo_ms:.0f} ms")
+    print(f"{'configuración':<28}{'1 login ms':>11}{'logins/s':>10}{'p50 ms':>9}{'p99 ms':>9}  cumple")
+    for algoritmo, costo in configs:
+        nombre = _configurar(algoritmo, costo)
+        almacenado = hashing.hash_password("clave-de-prueba")
+        t = time.perf_counter()
+        hashing.verificar("clave-de-prueba", almacenado)
+        aislado = 1000 * (time.perf_counter() - t)
+        por_s, p50, p99 = _medir(almacenado, args.concurrentes, args.segundos)
+        print(f"{nombre:<28}{aislado:>11.1f}{por_s:>10.1f}{p50:>9.1f}{p99:>9.1f}  "
+              f"{'sí' if p99 < args.objetivo_ms else 'no'}")
+
+
+if __name__ == "__main__":
+    main()
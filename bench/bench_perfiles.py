@@ -0,0 +1,106 @@
+# bench/bench_perfiles.py
+"""
+Compara el throughput de lectura/escritura concurrente entre perfiles SQLite.
+
+Cada perfil corre en un subproceso propio (db.py lee DB_SQLITE_PROFILE al
+importarse) contra una base temporal con datos precargados: N hilos escriben
+con agregar_orden mientras M hilos leen con listar_ordenes.
+
+    python bench/bench_perfiles.py --segundos 5 --escritores 2 --lectores 4
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SRC = os.path.join(ROOT, "src")
+
+ITEMS = [{"producto": "Martillo", "precio": 4990, "cantidad": 2},
+         {"producto": "Clavos 2\"", "precio": 1290, "cantidad": 5}]
+
+
+def _worker(args):
+    # Corre dentro del subproceso, con DB_SQLITE_PATH/DB_SQLITE_PROFILE ya fijados
+    sys.path.insert(0, SRC)
+    import db
+    import migraciones
+    import orden_compra as oc
+
+    migraciones.asegurar_schema()
+    for _ in range(args.precarga):
+        oc.agregar_orden("Cliente", "Dir 1", "+56912345678", "Santiago", "RM", ITEMS, user_id=1)
+
+    fin = time.perf_counter() + args.segundos
+    cuentas = {"escrituras": 0, "lecturas": 0, "errores": 0}
+    lock = threading.Lock()
+
+    def escritor():
+        n = e = 0
+        while time.perf_counter() < fin:
+            ok, _, _ = oc.agregar_orden("Cliente", "Dir 1", "+56912345678", "Santiago", "RM", ITEMS, user_id=1)
+            n, e = n + ok, e + (not ok)
+        with lock:
+            cuentas["escrituras"] += n
+            cuentas["errores"] += e
+
+    def lector():
+        n = 0
+        while time.perf_counter() < fin:
+            oc.listar_ordenes(limit=50, user_id=1)
+            n += 1
+        with lock:
+            cuentas["lecturas"] += n
+
+    hilos = [threading.Thread(target=escritor) for _ in range(args.escritores)]
+    hilos += [threading.Thread(target=lector) for _ in range(args.lectores)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    print(json.dumps({
+        "perfil": db.PERFIL_SQLITE,
+        "escrituras_s": round(cuentas["escrituras"] / args.segundos, 1),
+        "lecturas_s": round(cuentas["lecturas"] / args.segundos, 1),
+        "errores": cuentas["errores"],
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--perfiles", default="clasico,wal,seguro")
+    ap.add_argument("--segundos", type=float, default=5.0)
+    ap.add_argument("--escritores", type=int, default=2)
+    ap.add_argument("--lectores", type=int, default=4)
+    ap.add_argument("--precarga", type=int, default=2000)
+    ap.add_argument("--worker", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.worker:
+        _worker(args)
+        return
+
+    print(f"{'perfil':<10}{'escrituras/s':>14}{'lecturas/s':>12}{'errores':>9}")
+    for perfil in args.perfiles.split(","):
+        with tempfile.TemporaryDirectory() as tmp:
+            # APP_CACHE_TTL=0: se mide la BD, no la caché de lecturas
+            env = dict(os.environ, DB_SQLITE_PATH=os.path.join(tmp, "bench.db"),
+                       DB_SQLITE_PROFILE=perfil, DB_POOL_SIZE=str(args.escritores + args.lectores),
+                       APP_CACHE_TTL="0")
+            out = subprocess.run(
+                [sys.executable, __file__, "--worker", "--segundos", str(args.segundos),
+                 "--escritores", str(args.escritores), "--lectores", str(args.lectores),
+                 "--precarga", str(args.precarga)],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+        r = json.loads(out)
+        print(f"{r['perfil']:<10}{r['escrituras_s']:>14}{r['lecturas_s']:>12}{r['errores']:>9}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,123 @@
+# bench/bench_stock.py
+"""
+Contención del descuento de stock: N vendedores concurrentes guardando órdenes con SKU.
+
+Escenarios (cada uno en un subproceso con base temporal propia):
+  - caliente:  todos venden el mismo SKU, con stock limitado (se agota y debe rechazar)
+  - repartido: cada orden elige al azar entre --skus productos
+
+Al final verifica que ningún stock quedó negativo y que stock inicial - vendido = stock final.
+
+    python bench/bench_stock.py --segundos 5 --vendedores 8
+"""
+import argparse
+import json
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SRC = os.path.join(ROOT, "src")
+
+
+def _worker(args):
+    sys.path.insert(0, SRC)
+    import catalogo
+    import db
+    import migraciones
+    import orden_compra as oc
+
+    migraciones.asegurar_schema()
+    n_skus = 1 if args.escenario == "caliente" else args.skus
+    stock_inicial = args.stock if args.escenario == "caliente" else 10 ** 6
+    catalogo.cargar({"sku": f"SKU-{i:05d}", "nombre": f"Producto {i}", "precio": 990, "stock": stock_inicial}
+                    for i in range(n_skus))
+
+    fin = time.perf_counter() + args.segundos
+    cuentas = {"ok": 0, "sin_stock": 0, "errores": 0, "vendido": 0}
+    latencias = []
+    lock = threading.Lock()
+
+    def vendedor(semilla):
+        rnd = random.Random(semilla)
+        loc = {"ok": 0, "sin_stock": 0, "errores": 0, "vendido": 0}
+        lat = []
+        while time.perf_counter() < fin:
+            cant = rnd.randint(1, 3)
+            item = {"producto": "x", "precio": 990, "cantidad": cant, "sku": f"SKU-{rnd.randrange(n_skus):05d}"}
+            t = time.perf_counter()
+            ok, msg, _ = oc.agregar_orden("Cliente", "Dir 1", "+56912345678", "Santiago", "RM", [item], user_id=1)
+            lat.append(time.perf_counter() - t)
+            if ok:
+                loc["ok"] += 1
+                loc["vendido"] += cant
+            elif "Stock insuficiente" in msg:
+                loc["sin_stock"] += 1
+            else:
+                loc["errores"] += 1
+        with lock:
+            for k, v in loc.items():
+                cuentas[k] += v
+            latencias.extend(lat)
+
+    hilos = [threading.Thread(target=vendedor, args=(i,)) for i in range(args.vendedores)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT COALESCE(SUM(stock), 0), COALESCE(MIN(stock), 0) FROM productos")
+        total_final, minimo = cur.fetchone()
+        cur.execute("SELECT COALESCE(-SUM(cantidad), 0) FROM movimientos_stock WHERE motivo = 'venta'")
+        vendido_libro = cur.fetchone()[0]
+
+    latencias.sort()
+    p = lambda q: round(1000 * latencias[min(len(latencias) - 1, int(len(latencias) * q))], 2) if latencias else 0
+    print(json.dumps({
+        "escenario": args.escenario,
+        "ordenes_s": round(cuentas["ok"] / args.segundos, 1),
+        "sin_stock": cuentas["sin_stock"],
+        "errores": cuentas["errores"],
+        "p50_ms": p(0.5), "p99_ms": p(0.99),
+        "consistente": (minimo >= 0 and vendido_libro == cuentas["vendido"]
+                        and total_final == n_skus * stock_inicial - cuentas["vendido"]),
+    }))
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--escenarios", default="caliente,repartido")
+    ap.add_argument("--segundos", type=float, default=5.0)
+    ap.add_argument("--vendedores", type=int, default=8)
+    ap.add_argument("--skus", type=int, default=1000)
+    ap.add_argument("--stock", type=int, default=2000, help="stock del SKU caliente")
+    ap.add_argument("--escenario", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.escenario:
+        _worker(args)
+        return
+
+    print(f"{'escenario':<11}{'órdenes/s':>10}{'sin stock':>10}{'errores':>9}{'p50 ms':>8}{'p99 ms':>8}  consistente")
+    for esc in args.escenarios.split(","):
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, DB_SQLITE_PATH=os.path.join(tmp, "bench.db"),
+                       DB_POOL_SIZE=str(args.vendedores), APP_CACHE_TTL="0")
+            out = subprocess.run(
+                [sys.executable, __file__, "--escenario", esc, "--segundos", str(args.segundos),
+                 "--vendedores", str(args.vendedores), "--skus", str(args.skus), "--stock", str(args.stock)],
+                env=env, capture_output=True, text=True, check=True,
+            ).stdout.strip().splitlines()[-1]
+        r = json.loads(out)
+        print(f"{r['escenario']:<11}{r['ordenes_s']:>10}{r['sin_stock']:>10}{r['errores']:>9}"
+              f"{r['p50_ms']:>8}{r['p99_ms']:>8}  {'sí' if r['consistente'] else 'NO'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,296 @@
+# bench/bench_suite.py
+"""
+Suite de rendimiento de la capa de datos: órdenes, boletas, listados y login.
+
+Por cada tamaño (--tamanos 10k,100k,1m) genera una base SQLite temporal con
+órdenes sintéticas (vía importador, la mitad con boleta vía emision_lote) y
+corre cada escenario en un subproceso propio sobre una copia de esa base:
+
+  - agregar_orden:   --escritores hilos guardando órdenes
+  - crear_boleta:    --escritores hilos emitiendo boletas de órdenes pendientes
+  - listar_ordenes:  --lectores hilos leyendo la primera página (global y por usuario)
+  - verify_login:    --lectores hilos iniciando sesión (costo de hashing vigente)
+  - mixto:           escritores + lectores a la vez
+
+La caché de lecturas va apagada (APP_CACHE_TTL=0) para medir la BD. Imprime
+ops/s y percentiles por operación; con --salida guarda un JSON (con el commit
+actual) que luego se compara con --comparar.
+
+    python bench/bench_suite.py --tamanos 10k,100k --segundos 5 --salida hoy.json
+    python bench/bench_suite.py --comparar antes.json hoy.json
+"""
+import argparse
+import datetime as dt
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), ".."))
+SRC = os.path.join(ROOT, "src")
+
+ESCENARIOS = ["agregar_orden", "crear_boleta", "listar_ordenes", "verify_login", "mixto"]
+USUARIOS = 20
+CLAVE = "bench-clave"
+PRODUCTOS = [("Martillo carpintero", 4990), ("Clavos 2\"", 1290), ("Tornillo 8mm", 90),
+             ("Pintura látex 4L", 15990), ("Cinta aisladora", 890), ("Llave inglesa", 7490)]
+COMUNAS = [("Santiago", "RM"), ("Providencia", "RM"), ("Valparaíso", "Valparaíso"),
+           ("Concepción", "Biobío"), ("Temuco", "Araucanía")]
+
+
+def _tamano(txt: str) -> int:
+    txt = txt.strip().lower()
+    mult = {"k": 1_000, "m": 1_000_000}.get(txt[-1:], 1)
+    return int(float(txt.rstrip("km")) * mult)
+
+
+def _orden(rnd: random.Random, user_id: int) -> dict:
+    comuna, region = rnd.choice(COMUNAS)
+    items = [{"producto": p, "precio": precio, "cantidad": rnd.randint(1, 5)}
+             for p, precio in rnd.sample(PRODUCTOS, rnd.randint(1, 3))]
+    return {"cliente": f"Cliente {rnd.randrange(10 ** 6)}", "direccion": f"Calle {rnd.randint(1, 9999)}",
+            "telefono": "+56912345678", "comuna": comuna, "region": region,
+            "user_id": user_id, "items": items}
+
+
+def _percentiles(lat):
+    lat = sorted(lat)
+    if not lat:
+        return {}
+    p = lambda q: round(1000 * lat[min(len(lat) - 1, int(len(lat) * q))], 3)
+    return {"p50_ms": p(0.5), "p90_ms": p(0.9), "p99_ms": p(0.99), "max_ms": round(1000 * lat[-1], 3)}
+
+
+# ----------------- SUBPROCESO: GENERACIÓN -----------------
+def _generar(args):
+    sys.path.insert(0, SRC)
+    import emision_lote
+    import importador
+    import login
+    import migraciones
+
+    login.create_tables()
+    for u in range(USUARIOS):
+        login.register_user(f"bench{u:02d}", CLAVE, f"Usuario {u}")
+    ids = [login.get_user_by_username(f"bench{u:02d}")["id"] for u in range(USUARIOS)]
+
+    rnd = random.Random(args.semilla)
+    t0 = time.perf_counter()
+    r = importador.importar_registros(
+        ((n, _orden(rnd, rnd.choice(ids))) for n in range(1, args.generar + 1)), chunk=2000)
+    t1 = time.perf_counter()
+    b = emision_lote.emitir_pendientes(chunk=5000, limite=args.generar // 2)
+    t2 = time.perf_counter()
+    conn = sqlite3.connect(os.environ["DB_SQLITE_PATH"])
+    conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
+    conn.execute("ANALYZE;")
+    conn.close()
+    print(json.dumps({"ordenes": r["importadas"], "boletas": b["emitidas"],
+                      "ordenes_s": round(r["importadas"] / (t1 - t0), 1),
+                      "boletas_s": round(b["emitidas"] / (t2 - t1), 1) if t2 > t1 else 0}))
+
+
+# ----------------- SUBPROCESO: ESCENARIO -----------------
+def _correr(args):
+    sys.path.insert(0, SRC)
+    import db
+    import login
+    import orden_compra as oc
+
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT id FROM usuarios WHERE username LIKE 'bench%' ORDER BY id")
+        ids = [r[0] for r in cur.fetchall()]
+        pendientes = []
+        if args.escenario == "crear_boleta":
+            cur.execute("""
+                SELECT o.numero_orden FROM ordenes_compra o
+                WHERE NOT EXISTS (SELECT 1 FROM boletas b WHERE b.numero_orden = o.numero_orden)
+                ORDER BY o.id DESC LIMIT 200000
+            """)
+            pendientes = [r[0] for r in cur.fetchall()]
+
+    lock = threading.Lock()
+    medidas = {}  # operación -> {"lat": [...], "errores": n}
+    fin = time.perf_counter() + args.segundos
+
+    def bucle(op, semilla, paso):
+        rnd = random.Random(semilla)
+        lat, errores = [], 0
+        while time.perf_counter() < fin:
+            t = time.perf_counter()
+            ok = paso(rnd)
+            if ok is None:  # sin más trabajo
+                break
+            lat.append(time.perf_counter() - t)
+            errores += not ok
+        with lock:
+            m = medidas.setdefault(op, {"lat": [], "errores": 0})
+            m["lat"].extend(lat)
+            m["errores"] += errores
+
+    def agregar(rnd):
+        o = _orden(rnd, rnd.choice(ids))
+        return oc.agregar_orden(o["cliente"], o["direccion"], o["telefono"], o["comuna"],
+                                o["region"], o["items"], user_id=o["user_id"])[0]
+
+    def boleta(rnd):
+        with lock:
+            if not pendientes:
+                return None
+            numero = pendientes.pop()
+        return oc.crear_boleta_para_orden(numero)[0]
+
+    def listar(rnd):
+        if rnd.random() < 0.5:
+            return bool(oc.listar_ordenes(limit=50)) or True
+        return bool(oc.listar_ordenes(limit=50, user_id=rnd.choice(ids))) or True
+
+    def ingresar(rnd):
+        return login.verify_login(f"bench{rnd.randrange(USUARIOS):02d}", CLAVE) is not None
+
+    hilos = []
+    nuevo = lambda op, paso, n: hilos.extend(
+        threading.Thread(target=bucle, args=(op, f"{op}{k}", paso)) for k in range(n))
+    if args.escenario in ("agregar_orden", "mixto"):
+        nuevo("agregar_orden", agregar, args.escritores)
+    if args.escenario == "crear_boleta":
+        nuevo("crear_boleta", boleta, args.escritores)
+    if args.escenario in ("listar_ordenes", "mixto"):
+        nuevo("listar_ordenes", listar, args.lectores)
+    if args.escenario == "verify_login":
+        nuevo("verify_login", ingresar, args.lectores)
+
+    t0 = time.perf_counter()
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    duracion = time.perf_counter() - t0
+
+    ops = {}
+    for op, m in medidas.items():
+        ops[op] = {"n": len(m["lat"]), "ops_s": round(len(m["lat"]) / duracion, 1),
+                   "errores": m["errores"], **_percentiles(m["lat"])}
+    print(json.dumps({"escenario": args.escenario, "segundos": round(duracion, 2), "ops": ops}))
+
+
+# ----------------- ORQUESTADOR -----------------
+def _sub(env, *extra):
+    out = subprocess.run([sys.executable, __file__, *extra], env=env,
+                         capture_output=True, text=True, check=True).stdout
+    return json.loads(out.strip().splitlines()[-1])
+
+
+def _meta(args):
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                                capture_output=True, text=True).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {"commit": commit, "fecha": dt.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "sqlite": sqlite3.sqlite_version,
+            "cpus": os.cpu_count(), "segundos": args.segundos,
+            "escritores": args.escritores, "lectores": args.lectores, "semilla": args.semilla}
+
+
+def _imprimir(tamano, r):
+    for op, m in r["ops"].items():
+        print(f"{tamano:>9}  {r['escenario']:<15}{op:<16}{m['ops_s']:>9}{m.get('p50_ms', 0):>9}"
+              f"{m.get('p90_ms', 0):>9}{m.get('p99_ms', 0):>9}{m['errores']:>8}")
+
+
+def _comparar(antes_ruta, despues_ruta) -> int:
+    with open(antes_ruta, encoding="utf-8") as f:
+        antes = json.load(f)
+    with open(despues_ruta, encoding="utf-8") as f:
+        despues = json.load(f)
+    idx = {(t["tamano"], e["escenario"], op): m
+           for t in antes["resultados"] for e in t["escenarios"] for op, m in e["ops"].items()}
+    print(f"{antes['meta'].get('commit')} -> {despues['meta'].get('commit')}")
+    print(f"{'tamaño':>9}  {'escenario':<15}{'operación':<16}{'ops/s':>16}{'p99 ms':>18}")
+    delta = lambda a, b: f"{(b - a) / a * 100:+.0f}%" if a else "  -"
+    for t in despues["resultados"]:
+        for e in t["escenarios"]:
+            for op, m in e["ops"].items():
+                a = idx.get((t["tamano"], e["escenario"], op))
+                if a is None:
+                    continue
+                print(f"{t['tamano']:>9}  {e['escenario']:<15}{op:<16}"
+                      f"{m['ops_s']:>9} {delta(a['ops_s'], m['ops_s']):>6}"
+                      f"{m.get('p99_ms', 0):>11} {delta(a.get('p99_ms', 0), m.get('p99_ms', 0)):>6}")
+    return 0
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--tamanos", default="10k", help="órdenes sintéticas, p. ej. 10k,100k,1m")
+    ap.add_argument("--escenarios", default=",".join(ESCENARIOS))
+    ap.add_argument("--segundos", type=float, default=5.0)
+    ap.add_argument("--escritores", type=int, default=2)
+    ap.add_argument("--lectores", type=int, default=4)
+    ap.add_argument("--semilla", type=int, default=42)
+    ap.add_argument("--salida", help="guardar resultados en JSON")
+    ap.add_argument("--comparar", nargs=2, metavar=("ANTES", "DESPUES"), help="compara dos JSON de --salida")
+    ap.add_argument("--generar", type=int, help=argparse.SUPPRESS)
+    ap.add_argument("--escenario", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.generar is not None:
+        _generar(args)
+        return 0
+    if args.escenario:
+        _correr(args)
+        return 0
+    if args.comparar:
+        return _comparar(*args.comparar)
+
+    escenarios = [e for e in args.escenarios.split(",") if e]
+    desconocidos = set(escenarios) - set(ESCENARIOS)
+    if desconocidos:
+        ap.error(f"escenarios desconocidos: {', '.join(sorted(desconocidos))}")
+
+    comunes = ["--segundos", str(args.segundos), "--escritores", str(args.escritores),
+               "--lectores", str(args.lectores), "--semilla", str(args.semilla)]
+    resultados = []
+    print(f"{'tamaño':>9}  {'escenario':<15}{'operación':<16}{'ops/s':>9}{'p50 ms':>9}"
+          f"{'p90 ms':>9}{'p99 ms':>9}{'errores':>8}")
+    for txt in args.tamanos.split(","):
+        n = _tamano(txt)
+        with tempfile.TemporaryDirectory() as tmp:
+            base = os.path.join(tmp, "base.db")
+            env = dict(os.environ, DB_SQLITE_PATH=base, APP_CACHE_TTL="0",
+                       DB_POOL_SIZE=str(args.escritores + args.lectores + 1))
+            t = time.perf_counter()
+            gen = _sub(env, "--generar", str(n), *comunes)
+            gen["segundos"] = round(time.perf_counter() - t, 1)
+            print(f"{n:>9}  base: {gen['ordenes']} órdenes ({gen['ordenes_s']}/s), "
+                  f"{gen['boletas']} boletas ({gen['boletas_s']}/s) en {gen['segundos']} s")
+            fila = {"tamano": n, "generacion": gen, "escenarios": []}
+            for esc in escenarios:
+                copia = os.path.join(tmp, f"{esc}.db")
+                shutil.copyfile(base, copia)
+                r = _sub(dict(env, DB_SQLITE_PATH=copia), "--escenario", esc, *comunes)
+                _imprimir(n, r)
+                fila["escenarios"].append(r)
+                for sufijo in ("", "-wal", "-shm"):
+                    if os.path.exists(copia + sufijo):
+                        os.remove(copia + sufijo)
+            resultados.append(fila)
+
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            json.dump({"meta": _meta(args), "resultados": resultados}, f, ensure_ascii=False, indent=2)
+        print(f"Resultados en {args.salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,10 +1,18 @@
 import streamlit as st
 import pandas as pd
+import catalogo
+import db
+import hashing
+import instrumentacion
+import inventario
 import login as auth
 import menu
 import orden_compra as oc
+import perfilado
+import reportes
+import sesiones
 
-# Inicializa DB / schema y usuario admin
+# Inicializa DB / schema (migraciones, una vez por proceso) y usuario admin
 auth.create_tables()
 
 st.set_page_config(page_title="Ferretería — Órdenes de Compra",
@@ -15,11 +23,61 @@ for k, v in [("auth_ok", False), ("user_id", None), ("username", None), ("nombre
     if k not in st.session_state:
         st.session_state[k] = v
 
+
+def _iniciar_sesion(user):
+    st.session_state["auth_ok"] = True
+    st.session_state["user_id"] = user["id"]
+    st.session_state["username"] = user["username"]
+    st.session_state["nombre"] = user.get("nombre")
+    st.session_state["role"] = user["role"]
+
+
+# El token de sesión viaja en una cookie y nunca en la URL (historial, enlaces
+# compartidos, Referer y logs de proxies). Streamlit solo la lee al conectar
+# (st.context.cookies); se escribe/borra con un script en la página.
+COOKIE_SESION = "ferreteria_sesion"
+
+
+def _cookie_sesion():
+    # Fuera de un navegador (AppTest, modo bare) st.context no trae cookies reales
+    valor = st.context.cookies.get(COOKIE_SESION)
+    return valor if isinstance(valor, str) else None
+
+
+def _programar_cookie(token: str):
+    # Se escribe en el próximo rerun: el actual termina con st.rerun()
+    st.session_state["cookie_pendiente"] = token
+
+
+def _enviar_cookie():
+    if "cookie_pendiente" not in st.session_state:
+        return
+    token = st.session_state.pop("cookie_pendiente")
+    edad = int(sesiones.SESION_TTL) if token else 0
+    st.html(
+        f"<script>document.cookie = '{COOKIE_SESION}={token}; path=/; max-age={edad}; SameSite=Strict'"
+        " + (location.protocol === 'https:' ? '; Secure' : '');</script>",
+        unsafe_allow_javascript=True,
+    )
+
+
+# Refresco del navegador: se retoma la sesión de la cookie sin pedir la clave
+if not st.session_state["auth_ok"] and not st.session_state.get("cookie_revisada"):
+    st.session_state["cookie_revisada"] = True
+    _token = _cookie_sesion()
+    _user = auth.reanudar_sesion(_token) if _token else None
+    if _user:
+        _iniciar_sesion(_user)
+        st.session_state["token_sesion"] = _token
+    elif _token:
+        _programar_cookie("")
+
 # -------------------------------
 # Vistas auxiliares
 # -------------------------------
 
 
+@perfilado.medir()
 def login_view():
     st.title("🔐 Login — Ferretería")
     tab_login, tab_register = st.tabs(["Ingresar", "Registrarme"])
@@ -31,13 +89,22 @@ def login_view():
         col1, col2 = st.columns([1, 1])
         with col1:
             if st.button("Ingresar", type="primary", use_container_width=True):
-                user = auth.verify_login(username, password)
-                if user:
-                    st.session_state["auth_ok"] = True
-                    st.session_state["user_id"] = user["id"]
-                    st.session_state["username"] = user["username"]
-                    st.session_state["nombre"] = user.get("nombre")
-                    st.session_state["role"] = user["role"]
+                ip = getattr(st.context, "ip_address", None)
+                try:
+                    user = auth.verify_login(username, password, ip=ip)
+                except hashing.HashOcupado as e:
+                    st.warning(str(e))
+                    st.stop()
+                espera = 0 if user else auth.espera_login(username, ip)
+                if espera:
+                    st.error(f"Demasiados intentos fallidos. Intenta de nuevo en {espera} s.")
+                elif user:
+                    _iniciar_sesion(user)
+                    # Token nuevo en cada login; el anterior de este navegador se revoca
+                    sesiones.cerrar(st.session_state.get("token_sesion")
+                                    or _cookie_sesion())
+                    st.session_state["token_sesion"] = sesiones.crear(user["id"])
+                    _programar_cookie(st.session_state["token_sesion"])
                     st.success("Acceso concedido")
                     st.rerun()
                 else:
@@ -67,9 +134,11 @@ def login_view():
 
 
 def logout():
-    for k in ["auth_ok", "user_id", "username", "nombre", "role"]:
+    sesiones.cerrar(st.session_state.get("token_sesion"))
+    for k in ["auth_ok", "user_id", "username", "nombre", "role", "token_sesion"]:
         if k in st.session_state:
             del st.session_state[k]
+    _programar_cookie("")
     st.success("Sesión cerrada")
     st.rerun()
 
@@ -78,6 +147,7 @@ def logout():
 # -------------------------------
 
 
+@perfilado.medir()
 def admin_users_view():
     st.header("👥 Usuarios registrados")
 
@@ -158,15 +228,190 @@ def admin_users_view():
         else:
             st.error(msg)
 
+    st.markdown("---")
+    with st.expander("⏱️ Pool de hashing de contraseñas"):
+        m = hashing.metricas()
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("En cola", m["en_cola"], help=f"Máximo observado: {m['max_cola']} de {m['capacidad_cola']}")
+        c2.metric("En curso", m["en_curso"], help=f"{m['hilos']} hilos")
+        c3.metric("Espera media", f"{m['espera_media_ms']} ms", help=f"Cálculo medio: {m['calculo_medio_ms']} ms")
+        c4.metric("Rechazadas / timeouts", f"{m['rechazadas']} / {m['timeouts']}")
+
+# -------------------------------
+# Vista de administración: reportes de ventas (solo lee el rollup ventas_diarias)
+# -------------------------------
+
+
+@perfilado.medir()
+def admin_reportes_view():
+    import datetime as dt
+
+    st.header("📊 Reportes de ventas")
+    hoy = dt.date.today()
+    c1, c2 = st.columns(2)
+    with c1:
+        desde = st.date_input("Desde", value=hoy - dt.timedelta(days=30), key="rep_desde")
+    with c2:
+        hasta = st.date_input("Hasta", value=hoy, key="rep_hasta")
+
+    r = reportes.resumen(desde, hasta)
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Órdenes", f"{r['ordenes']:,}".replace(",", "."))
+    m2.metric("Boletas", f"{r['boletas']:,}".replace(",", "."))
+    m3.metric("Neto boletas", oc._fmt_chl(r["neto"]))
+    m4.metric("Total con IVA", oc._fmt_chl(r["total"]))
+    st.caption(f"IVA acumulado: {oc._fmt_chl(r['iva'])} — Neto en órdenes: {oc._fmt_chl(r['neto_ordenes'])}")
+
+    por_dia = reportes.agrupado("dia", desde, hasta)
+    if not por_dia:
+        st.info("Sin ventas en el rango seleccionado.")
+        return
+    st.subheader("Ventas por día")
+    st.bar_chart(pd.DataFrame(por_dia).set_index("dia")[["neto", "iva"]])
+
+    nombres = {u["id"]: u["username"] for u in auth.list_users()}
+    columnas = {"ordenes": "Órdenes", "neto_ordenes": "Neto órdenes", "boletas": "Boletas",
+                "neto": "Neto", "iva": "IVA", "total": "Total"}
+    for dimension, titulo in [("region", "Región"), ("comuna", "Comuna"), ("user_id", "Usuario")]:
+        st.subheader(f"Por {titulo.lower()}")
+        df = pd.DataFrame(reportes.agrupado(dimension, desde, hasta))
+        if dimension == "user_id":
+            df["user_id"] = df["user_id"].map(
+                lambda u: "(sin usuario)" if u == reportes.SIN_USUARIO else nombres.get(u, f"id {u}"))
+        st.dataframe(df.rename(columns={dimension: titulo, **columnas}),
+                     width="stretch", hide_index=True)
+
+# -------------------------------
+# Vista de administración: catálogo de productos
+# -------------------------------
+
+
+@perfilado.medir()
+def admin_productos_view():
+    st.header("📦 Catálogo de productos")
+
+    q = st.text_input("Buscar", placeholder="Nombre o SKU", key="ap_q").strip()
+    if q:
+        res = catalogo.buscar(q, 50)
+        if res:
+            stock = inventario.stock_de(tuple(p["sku"] for p in res))
+            df = pd.DataFrame(res, columns=["sku", "nombre", "precio"])
+            df["stock"] = df["sku"].map(stock)
+            st.dataframe(df, width="stretch", hide_index=True)
+        else:
+            st.info("Sin coincidencias.")
+    st.caption(f"{len(catalogo.indice().productos)} productos en catálogo.")
+
+    st.markdown("---")
+    st.subheader("➕ Crear / actualizar producto")
+    c1, c2, c3, c4 = st.columns(4)
+    with c1:
+        sku = st.text_input("SKU", key="ap_sku")
+    with c2:
+        nombre = st.text_input("Nombre", key="ap_nombre")
+    with c3:
+        precio = st.number_input("Precio", min_value=0.0, step=100.0, key="ap_precio")
+    # El stock de un SKU existente solo cambia por "Ajustar stock" (queda en el libro)
+    existente = catalogo.obtener(sku) is not None
+    with c4:
+        stock = st.number_input("Stock inicial", min_value=0, step=1, key="ap_stock", disabled=existente,
+                                help="Solo para un SKU nuevo")
+    if st.button("Guardar producto", type="primary"):
+        ok, msg = catalogo.guardar_producto(sku, nombre, precio, None if existente else int(stock))
+        if ok:
+            st.success(msg)
+        else:
+            st.error(msg)
+
+    st.markdown("---")
+    st.subheader("📦 Ajustar stock")
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        aj_sku = st.text_input("SKU", key="aj_sku")
+    with c2:
+        aj_delta = st.number_input("Cantidad (+ reposición / − merma)", step=1, value=0, key="aj_delta")
+    with c3:
+        aj_motivo = st.text_input("Motivo", value="reposición", key="aj_motivo")
+    if st.button("Aplicar ajuste"):
+        ok, msg = inventario.ajustar(aj_sku, int(aj_delta), aj_motivo)
+        if ok:
+            st.success(msg)
+        else:
+            st.error(msg)
+    if aj_sku.strip():
+        movs = inventario.movimientos(aj_sku)
+        if movs:
+            st.caption("Últimos movimientos")
+            st.dataframe(pd.DataFrame(movs), width="stretch", hide_index=True)
+
+    st.markdown("---")
+    st.subheader("📥 Carga masiva (CSV sku,nombre,precio[,stock])")
+    archivo = st.file_uploader("Archivo CSV", type=["csv"], key="ap_csv")
+    if archivo is not None and st.button("Cargar catálogo"):
+        import csv
+        import io
+        r = catalogo.cargar(csv.DictReader(io.TextIOWrapper(archivo, encoding="utf-8")))
+        st.success(f"{r['guardados']} productos guardados ({r['nuevos']} nuevos; el stock solo se carga en los nuevos).")
+        if r["rechazados"]:
+            st.warning(f"{len(r['rechazados'])} filas rechazadas.")
+            st.dataframe(pd.DataFrame(r["rechazados"]), width="stretch", hide_index=True)
+
+# -------------------------------
+# Vista de administración: tiempos de consultas a la BD (instrumentacion.py)
+# -------------------------------
+
+
+@perfilado.medir()
+def admin_rendimiento_view():
+    import datetime as dt
+    st.header("🐢 Rendimiento de la BD")
+    if not instrumentacion.ACTIVA:
+        st.info("La medición de consultas está apagada (DB_INSTRUMENTAR=0).")
+        return
+
+    r = instrumentacion.registro.resumen()
+    desde = dt.datetime.fromtimestamp(r["desde"]).strftime("%d-%m-%Y %H:%M")
+    m1, m2, m3, m4 = st.columns(4)
+    m1.metric("Consultas", f"{r['consultas']:,}".replace(",", "."))
+    m2.metric("Tiempo total", f"{r['total_ms'] / 1000:.1f} s")
+    m3.metric(f"Lentas (≥ {instrumentacion.LENTA_MS:g} ms)", len(r["lentas"]))
+    m4.metric("Errores", r["errores"])
+    st.caption(f"Desde {desde} en este proceso; {r['distintas']} consultas distintas.")
+
+    st.subheader("Histograma de latencias")
+    st.bar_chart(pd.DataFrame({"consultas": r["histograma"]}, index=instrumentacion.etiquetas_cubetas()))
+
+    st.subheader("Consultas más costosas")
+    criterios = {"Tiempo total": "total_ms", "Peor caso": "max_ms", "Más llamadas": "llamadas",
+                 "Más filas": "filas", "Errores": "errores"}
+    por = criterios[st.selectbox("Ordenar por", list(criterios))]
+    top = instrumentacion.registro.top(25, por=por)
+    if top:
+        df = pd.DataFrame(top)[["llamador", "llamadas", "total_ms", "media_ms", "max_ms", "filas", "errores", "sql"]]
+        st.dataframe(df.round(2), width="stretch", hide_index=True)
+
+    st.subheader("Bitácora de consultas lentas")
+    if r["lentas"]:
+        lentas = pd.DataFrame(reversed(r["lentas"]))
+        lentas["momento"] = pd.to_datetime(lentas["momento"], unit="s")
+        st.dataframe(lentas, width="stretch", hide_index=True)
+    else:
+        st.caption("Sin consultas lentas.")
+
+    if st.button("Reiniciar contadores"):
+        instrumentacion.registro.limpiar()
+        st.rerun()
+
 # -------------------------------
 # Usuario normal
 # -------------------------------
 
 
+@perfilado.medir()
 def my_orders_view():
     st.header("🧾 Mis Órdenes")
     uid = st.session_state.get("user_id")
-    data = oc.listar_ordenes(limit=200, user_id=uid)
+    data, siguiente = menu.pagina_ordenes("mis_ordenes", user_id=uid)
     if not data:
         st.info("Aún no tienes órdenes registradas.")
         return
@@ -179,12 +424,28 @@ def my_orders_view():
             "Fecha": d["creado_en"],
         })
     st.dataframe(pd.DataFrame(rows), use_container_width=True, hide_index=True)
+    menu.controles_pagina("mis_ordenes", siguiente)
 
 # -------------------------------
 # Main
 # -------------------------------
 
 
+def panel_perfilado():
+    with st.sidebar.expander("⏱️ Perfil de reruns"):
+        ultimo = st.session_state.get("_perfil_ultimo") or {}
+        if ultimo:
+            st.caption(f"Rerun anterior ({ultimo['vista']}): {ultimo['ms']:.0f} ms, BD {ultimo['bd_ms']:.0f} ms")
+            st.dataframe(pd.DataFrame(ultimo["secciones"]), hide_index=True)
+        filas = perfilado.resumen()
+        if filas:
+            st.caption("Acumulado del proceso por vista y sección")
+            df = pd.DataFrame(filas)[["vista", "seccion", "llamadas", "media_ms", "p95_ms", "max_ms", "bd_pct"]]
+            st.dataframe(df.round(1), hide_index=True)
+        if st.button("Reiniciar perfil", key="perfil_reset"):
+            perfilado.limpiar()
+
+
 def main_view():
     st.sidebar.title("Menú")
     is_admin = st.session_state.get("role") == "admin"
@@ -195,7 +456,8 @@ def main_view():
         st.session_state["nav_choice"] = req
 
     # items del menú
-    admin_items = ["Home", "Usuarios registrados", "Cerrar sesión"]
+    admin_items = ["Home", "Usuarios registrados", "Productos", "Reportes", "Exportar historial",
+                   "Rendimiento BD", "Cerrar sesión"]
     user_items = ["Home", "Registrar Orden", "Mis Órdenes", "Cerrar sesión"]
     options = admin_items if is_admin else user_items
 
@@ -203,14 +465,23 @@ def main_view():
     if "nav_choice" not in st.session_state:
         st.session_state["nav_choice"] = "Home"
 
-    # crea el radio con key fija
-    choice = st.sidebar.radio("Navegación", options, key="nav_choice")
-
-    st.sidebar.divider()
-    st.sidebar.caption(
-        f"Conectado como: **{st.session_state.get('username', '')}** "
-        f"({st.session_state.get('role', '')})"
-    )
+    with perfilado.seccion("sidebar"):
+        # crea el radio con key fija
+        choice = st.sidebar.radio("Navegación", options, key="nav_choice")
+
+        st.sidebar.divider()
+        st.sidebar.caption(
+            f"Conectado como: **{st.session_state.get('username', '')}** "
+            f"({st.session_state.get('role', '')})"
+        )
+        if is_admin:
+            ps = db.estadisticas_pool()
+            st.sidebar.caption(
+                f"Pool BD: {ps['hits']} reusos / {ps['misses']} conexiones nuevas "
+                f"({ps['creadas']}/{ps['max_size']} abiertas)"
+            )
+        if perfilado.ACTIVO:
+            panel_perfilado()
 
     if choice == "Home":
         menu.home()
@@ -220,11 +491,30 @@ def main_view():
         menu.listar_ordenes(user_id=st.session_state.get("user_id"))
     elif choice == "Usuarios registrados":
         admin_users_view()
+    elif choice == "Productos":
+        admin_productos_view()
+    elif choice == "Reportes":
+        admin_reportes_view()
+    elif choice == "Exportar historial":
+        st.header("📤 Exportar historial")
+        menu.exportar_historial()
+        st.markdown("---")
+        st.subheader("🖨️ Impresión de boletas")
+        menu.imprimir_boletas_del_dia()
+        menu.boton_volver()
+    elif choice == "Rendimiento BD":
+        admin_rendimiento_view()
     elif choice == "Cerrar sesión":
         logout()
 
 
-if st.session_state["auth_ok"]:
-    main_view()
-else:
-    login_view()
+# APP_PERFILAR=1: cada rerun se mide por sección (ver perfilado.py y el panel del sidebar)
+_vista = (st.session_state.get("request_nav") or st.session_state.get("nav_choice") or "Home"
+          if st.session_state["auth_ok"] else "Login")
+_perfil = st.session_state.setdefault("_perfil_ultimo", {}) if perfilado.ACTIVO else None
+_enviar_cookie()
+with perfilado.rerun(_vista, _perfil):
+    if st.session_state["auth_ok"]:
+        main_view()
+    else:
+        login_view()
@@ -0,0 +1,245 @@
+# src/boleta_html.py
+"""
+Boletas en HTML imprimible.
+
+Las plantillas se compilan una vez al importar el módulo (string.Template) y
+todo texto que viene del usuario pasa por html.escape. Una boleta emitida no
+cambia, así que su fragmento HTML se guarda en `boletas_html` con clave
+numero_boleta + VERSION de la plantilla (al cambiar la plantilla se sube
+VERSION y los fragmentos viejos se regeneran al pedirlos).
+
+El documento de una boleta y el lote del día usan el mismo fragmento; el lote
+pone cada boleta en su propia hoja (listo para imprimir o "Guardar como PDF").
+
+    python src/boleta_html.py BL-0001 -o BL-0001.html
+    python src/boleta_html.py --dia 2025-10-17 -o cierre.html
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import sys
+from html import escape
+from itertools import groupby
+from string import Template
+from typing import Any, Dict, Iterable, List, Optional
+
+try:
+    import cache
+    import db
+    import orden_compra as oc
+except ImportError:
+    from . import cache
+    from . import db
+    from . import orden_compra as oc
+
+# Subir al cambiar _CUERPO o _FILA: invalida los fragmentos guardados
+VERSION = 1
+
+_ESTILO = """
+  body { font-family: Arial, sans-serif; margin: 24px; }
+  h1 { margin-bottom: 4px; }
+  .small { color: #555; }
+  table { width: 100%; border-collapse: collapse; margin-top: 16px; }
+  th, td { border-bottom: 1px solid #eee; padding: 8px; }
+  tfoot td { border-top: 2px solid #333; font-weight: bold; }
+  .num { text-align: right; }
+  @page { size: A4; margin: 15mm; }
+  @media print {
+    body { margin: 0; }
+    .boleta { page-break-after: always; break-after: page; }
+    .boleta:last-child { page-break-after: auto; break-after: auto; }
+  }
+"""
+
+_DOCUMENTO = Template("""<!doctype html>
+<html><head>
+<meta charset="utf-8">
+<title>$titulo</title>
+<style>$estilo</style>
+</head><body>
+$cuerpo
+</body></html>""")
+
+_CUERPO = Template("""<section class="boleta">
+  <h1>Boleta $numero_boleta</h1>
+  <div class="small">Orden: $numero_orden &nbsp;&nbsp;|&nbsp;&nbsp; Fecha: $creado_en</div>
+  <p><strong>Cliente:</strong> $cliente<br>
+     <strong>Dirección:</strong> $direccion, $comuna, $region<br>
+     <strong>Teléfono:</strong> $telefono</p>
+  <table>
+    <thead>
+      <tr><th>Producto</th><th class="num">Cant.</th><th class="num">Precio</th></tr>
+    </thead>
+    <tbody>
+$filas
+    </tbody>
+    <tfoot>
+      <tr><td colspan="2" class="num">Neto</td><td class="num">$neto</td></tr>
+      <tr><td colspan="2" class="num">IVA 19%</td><td class="num">$iva</td></tr>
+      <tr><td colspan="2" class="num">Total a pagar</td><td class="num">$total</td></tr>
+    </tfoot>
+  </table>
+</section>""")
+
+_FILA = Template("""      <tr><td>$producto</td><td class="num">$cantidad</td><td class="num">$precio</td></tr>""")
+_SIN_ITEMS = """      <tr><td colspan="3">(Sin ítems)</td></tr>"""
+
+# Boletas de un día con sus líneas, en orden de emisión
+_SQL_BOLETAS_DIA = oc._SQL_BOLETA + """
+    WHERE b.creado_en >= ? AND b.creado_en < ?
+    ORDER BY b.id, i.linea
+"""
+_SQL_NUMEROS_DIA = """
+    SELECT numero_boleta FROM boletas
+    WHERE creado_en >= ? AND creado_en < ?
+    ORDER BY id
+"""
+_SQL_GUARDAR = db.dialecto().upsert(
+    "boletas_html", ("numero_boleta", "version", "cuerpo"), ("numero_boleta",),
+    {"version": "{nuevo}.version", "cuerpo": "{nuevo}.cuerpo"})
+# Máximo de parámetros por IN (...)
+_LOTE_IN = 500
+
+
+def _texto(v: Any) -> str:
+    return escape("" if v is None else str(v))
+
+
+# ----------------- RENDER -----------------
+def cuerpo(boleta: Dict[str, Any]) -> str:
+    """Fragmento <section> de una boleta (sin <html>), con todo el texto escapado."""
+    filas = "\n".join(
+        _FILA.substitute(
+            producto=_texto(it.get("producto", "")),
+            cantidad=int(it.get("cantidad", 0)),
+            precio=oc._fmt_chl(it.get("precio", 0)),
+        )
+        for it in boleta.get("items", [])
+    ) or _SIN_ITEMS
+    return _CUERPO.substitute(
+        numero_boleta=_texto(boleta["numero_boleta"]),
+        numero_orden=_texto(boleta["numero_orden"]),
+        creado_en=_texto(boleta["creado_en"]),
+        cliente=_texto(boleta["cliente"]),
+        direccion=_texto(boleta["direccion"]),
+        comuna=_texto(boleta["comuna"]),
+        region=_texto(boleta["region"]),
+        telefono=_texto(boleta["telefono"]),
+        filas=filas,
+        neto=oc._fmt_chl(boleta["neto"]),
+        iva=oc._fmt_chl(boleta["iva"]),
+        total=oc._fmt_chl(boleta["total"]),
+    )
+
+
+def documento(cuerpos: Iterable[str], titulo: str) -> str:
+    return _DOCUMENTO.substitute(titulo=_texto(titulo), estilo=_ESTILO, cuerpo="\n".join(cuerpos))
+
+
+# ----------------- CACHÉ EN TABLA -----------------
+def _guardados(cur, numeros: List[str]) -> Dict[str, str]:
+    out: Dict[str, str] = {}
+    for i in range(0, len(numeros), _LOTE_IN):
+        parte = numeros[i:i + _LOTE_IN]
+        cur.execute(
+            f"SELECT numero_boleta, cuerpo FROM boletas_html "
+            f"WHERE version = ? AND numero_boleta IN ({','.join('?' * len(parte))})",
+            (VERSION, *parte),
+        )
+        out.update(cur.fetchall())
+    return out
+
+
+def _guardar(conn, nuevos: Dict[str, str]):
+    # Es solo caché: si la BD está ocupada se sigue sin guardar
+    if not nuevos:
+        return
+    try:
+        cur = conn.cursor()
+        db.iniciar_escritura(cur)
+        cur.executemany(_SQL_GUARDAR, [(n, VERSION, c) for n, c in nuevos.items()])
+        conn.commit()
+    except db.ErrorBD:
+        conn.rollback()
+
+
+@cache.cacheado("boletas")
+def html_boleta(numero_boleta: str) -> Optional[str]:
+    """Documento imprimible de una boleta; None si no existe."""
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        frag = _guardados(cur, [numero_boleta]).get(numero_boleta)
+        if frag is None:
+            # Mismo cursor: pedir otra conexión del pool mientras se tiene esta puede trabarse
+            cur.execute(oc._SQL_BOLETA_POR_NUMERO, (numero_boleta,))
+            boleta = oc._boleta_desde_filas(cur.fetchall())
+            if boleta is None:
+                return None
+            frag = cuerpo(boleta)
+            _guardar(conn, {numero_boleta: frag})
+    return documento([frag], f"Boleta {numero_boleta}")
+
+
+def _rango_dia(dia: dt.date):
+    # `dia` es el día local de la tienda; creado_en puede estar en UTC (ver dialectos.inicio_dia)
+    d = db.dialecto()
+    return d.inicio_dia(dia), d.inicio_dia(dia + dt.timedelta(days=1))
+
+
+def lote_del_dia(dia: dt.date) -> tuple[str, int]:
+    """
+    (documento, cantidad) con todas las boletas emitidas `dia`, una por hoja.
+    Las que no estaban en la tabla se arman con una sola consulta y se guardan.
+    """
+    desde, hasta = _rango_dia(dia)
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(_SQL_NUMEROS_DIA, (desde, hasta))
+        numeros = [r[0] for r in cur.fetchall()]
+        fragmentos = _guardados(cur, numeros)
+        nuevos: Dict[str, str] = {}
+        if len(fragmentos) < len(numeros):
+            cur.execute(_SQL_BOLETAS_DIA, (desde, hasta))
+            for numero, filas in groupby(cur.fetchall(), key=lambda r: r[0]):
+                if numero not in fragmentos:
+                    nuevos[numero] = cuerpo(oc._boleta_desde_filas(list(filas)))
+            _guardar(conn, nuevos)
+    fragmentos.update(nuevos)
+    doc = documento((fragmentos[n] for n in numeros if n in fragmentos), f"Boletas del {dia:%d-%m-%Y}")
+    return doc, len(numeros)
+
+
+# ----------------- CLI -----------------
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("numero_boleta", nargs="?")
+    ap.add_argument("--dia", type=dt.date.fromisoformat, help="todas las boletas de ese día (AAAA-MM-DD)")
+    ap.add_argument("-o", "--salida", help="archivo de salida (por defecto stdout)")
+    args = ap.parse_args(argv)
+    if bool(args.numero_boleta) == bool(args.dia):
+        ap.error("indica un número de boleta o --dia")
+
+    try:
+        import migraciones
+    except ImportError:
+        from . import migraciones
+    migraciones.asegurar_schema()
+    if args.dia:
+        doc, n = lote_del_dia(args.dia)
+        print(f"{n} boletas", file=sys.stderr)
+    else:
+        doc = html_boleta(args.numero_boleta)
+        if doc is None:
+            print(f"No existe la boleta {args.numero_boleta}", file=sys.stderr)
+            return 1
+    if args.salida:
+        with open(args.salida, "w", encoding="utf-8") as f:
+            f.write(doc)
+    else:
+        sys.stdout.write(doc)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,110 @@
+# src/cache.py
+"""
+Caché en memoria del proceso para lecturas frecuentes (TTL + invalidación explícita).
+
+Streamlit re-ejecuta el script completo en cada interacción; con esto las
+lecturas repetidas se sirven desde memoria y solo las escrituras tocan la BD.
+Cada función cacheada pertenece a un grupo ("ordenes", "boletas", "usuarios") y
+las funciones que escriben invalidan su grupo apenas confirman el commit.
+
+Los valores se comparten entre sesiones: quien los recibe no debe modificarlos.
+"""
+from __future__ import annotations
+
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Tuple
+
+# Segundos de vida por defecto; APP_CACHE_TTL=0 desactiva la caché
+TTL = float(os.getenv("APP_CACHE_TTL", "30"))
+MAX_ENTRADAS = int(os.getenv("APP_CACHE_MAX", "256"))
+
+
+class CacheTTL:
+    def __init__(self, ttl: float = TTL, max_entradas: int = MAX_ENTRADAS):
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self._datos: "OrderedDict[Any, Tuple[float, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        # Sube con cada invalidación: una lectura que empezó antes no se guarda
+        self.generacion = 0
+
+    def obtener(self, clave) -> Tuple[bool, Any]:
+        with self._lock:
+            entrada = self._datos.get(clave)
+            if entrada is None or entrada[0] < time.monotonic():
+                self.misses += 1
+                return False, None
+            self._datos.move_to_end(clave)
+            self.hits += 1
+            return True, entrada[1]
+
+    def guardar(self, clave, valor, ttl: float | None = None, generacion: int | None = None):
+        with self._lock:
+            if generacion is not None and generacion != self.generacion:
+                return
+            self._datos[clave] = (time.monotonic() + (self.ttl if ttl is None else ttl), valor)
+            self._datos.move_to_end(clave)
+            while len(self._datos) > self.max_entradas:
+                self._datos.popitem(last=False)
+
+    def limpiar(self):
+        with self._lock:
+            self._datos.clear()
+            self.generacion += 1
+
+
+_grupos: Dict[str, CacheTTL] = {}
+_grupos_lock = threading.Lock()
+
+
+def grupo(nombre: str) -> CacheTTL:
+    with _grupos_lock:
+        if nombre not in _grupos:
+            _grupos[nombre] = CacheTTL()
+        return _grupos[nombre]
+
+
+def cacheado(nombre_grupo: str, ttl: float | None = None) -> Callable:
+    """
+    Decorador: memoriza el resultado por argumentos dentro de `nombre_grupo`.
+    La función original queda disponible como `.sin_cache`.
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            c = grupo(nombre_grupo)
+            vida = c.ttl if ttl is None else ttl
+            if vida <= 0:
+                return fn(*args, **kwargs)
+            clave = (fn.__qualname__, args, tuple(sorted(kwargs.items())))
+            generacion = c.generacion
+            ok, valor = c.obtener(clave)
+            if ok:
+                return valor
+            valor = fn(*args, **kwargs)
+            c.guardar(clave, valor, vida, generacion)
+            return valor
+        wrapper.sin_cache = fn
+        return wrapper
+    return deco
+
+
+def invalidar(*nombres: str):
+    """Descarta las entradas de los grupos indicados (tras una escritura)."""
+    for n in nombres:
+        grupo(n).limpiar()
+
+
+def estadisticas() -> Dict[str, Dict[str, int]]:
+    with _grupos_lock:
+        grupos = dict(_grupos)
+    return {
+        n: {"entradas": len(c._datos), "hits": c.hits, "misses": c.misses}
+        for n, c in grupos.items()
+    }
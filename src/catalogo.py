@@ -0,0 +1,301 @@
+# src/catalogo.py
+"""
+Catálogo de productos (SKU, nombre, precio, stock) y búsqueda para autocompletar.
+
+La tabla `productos` es la fuente de verdad; cada proceso arma una copia en
+memoria con nombres normalizados ordenados (prefijo por bisect) y un índice
+invertido de trigramas (subcadena). Cada escritura sube la versión 'catalogo'
+en `secuencias`; el índice la revisa a lo más cada CATALOGO_REFRESCO segundos
+y se rearma solo si cambió.
+
+El stock de un SKU nuevo entra como movimiento "carga inicial" del libro
+(inventario.registrar_ajuste); en uno existente el catálogo solo cambia nombre
+y precio, y el stock se mueve con inventario.ajustar.
+
+    python src/catalogo.py cargar productos.csv     # encabezado sku,nombre,precio[,stock]
+    python src/catalogo.py buscar "martillo carp"
+"""
+from __future__ import annotations
+
+import argparse
+import bisect
+import csv
+import math
+import os
+import sys
+import threading
+import time
+import unicodedata
+from collections import defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import cache
+    import db
+    import inventario
+    import secuencias as seq
+except ImportError:
+    from . import cache
+    from . import db
+    from . import inventario
+    from . import secuencias as seq
+
+SEQ_VERSION = "catalogo"
+# Segundos entre revisiones de la versión del catálogo en la BD
+REFRESCO = float(os.getenv("CATALOGO_REFRESCO", "1"))
+
+_SQL_ACTUALIZAR = "UPDATE productos SET nombre = ?, precio = ?, actualizado_en = CURRENT_TIMESTAMP WHERE sku = ?"
+_SQL_NUEVO = "INSERT INTO productos (sku, nombre, precio, stock) VALUES (?, ?, ?, 0)"
+MOTIVO_CARGA = "carga inicial"
+
+
+def normalizar(texto: str) -> str:
+    """Minúsculas, sin tildes y con espacios simples: 'Tornillo  Ñandú' -> 'tornillo nandu'."""
+    t = unicodedata.normalize("NFKD", texto or "")
+    t = "".join(c for c in t if not unicodedata.combining(c))
+    return " ".join(t.lower().split())
+
+
+def _trigramas(t: str) -> Iterable[str]:
+    return {t[i:i + 3] for i in range(len(t) - 2)}
+
+
+# ----------------- ÍNDICE EN MEMORIA -----------------
+class IndiceCatalogo:
+    """
+    Snapshot inmutable del catálogo. buscar() no toca la BD:
+    SKU exacto, luego prefijo del nombre, luego todas las palabras como subcadena.
+    """
+
+    def __init__(self, productos: List[Dict[str, Any]], version: int = 0):
+        self.version = version
+        self.por_sku = {p["sku"]: p for p in productos}
+        # Todo se guarda por posición en orden alfabético: las listas de trigramas
+        # quedan ordenadas por nombre y la búsqueda corta apenas junta `limite`.
+        norm = [normalizar(p["nombre"]) for p in productos]
+        orden = sorted(range(len(productos)), key=norm.__getitem__)
+        self.productos = [productos[i] for i in orden]
+        self._claves = [norm[i] for i in orden]
+        self._pos_sku = {p["sku"]: k for k, p in enumerate(self.productos)}
+        self._trigramas: Dict[str, List[int]] = defaultdict(list)
+        for k, nombre in enumerate(self._claves):
+            for tg in _trigramas(nombre):
+                self._trigramas[tg].append(k)
+
+    def buscar(self, texto: str, limite: int = 10) -> List[Dict[str, Any]]:
+        q = normalizar(texto)
+        if not q:
+            return []
+        out: List[int] = []
+        exacto = self._pos_sku.get((texto or "").strip().upper())
+        if exacto is not None:
+            out.append(exacto)
+
+        # Prefijo: tramo contiguo de la lista ordenada
+        k = bisect.bisect_left(self._claves, q)
+        while k < len(self._claves) and len(out) < limite and self._claves[k].startswith(q):
+            if k not in out:
+                out.append(k)
+            k += 1
+
+        # Subcadena: se recorre la lista de trigramas más corta (ya en orden
+        # alfabético) verificando que estén todas las palabras
+        palabras = q.split()
+        tgs = {tg for p in palabras for tg in _trigramas(p)}
+        if len(out) < limite and tgs:
+            menor = min((self._trigramas.get(tg, ()) for tg in tgs), key=len)
+            ya = set(out)
+            for k in menor:
+                if k not in ya and all(p in self._claves[k] for p in palabras):
+                    out.append(k)
+                    if len(out) >= limite:
+                        break
+        return [self.productos[k] for k in out]
+
+
+_indice: Optional[IndiceCatalogo] = None
+_revisado_en = 0.0
+_lock = threading.Lock()
+
+
+def _cargar() -> IndiceCatalogo:
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        version = seq.actual(cur, SEQ_VERSION)
+        cur.execute("SELECT sku, nombre, precio FROM productos")
+        productos = [{"sku": r[0], "nombre": r[1], "precio": float(r[2])} for r in cur.fetchall()]
+    return IndiceCatalogo(productos, version)
+
+
+def indice() -> IndiceCatalogo:
+    """Índice vigente; rearmado si otro proceso (o este) cambió el catálogo."""
+    global _indice, _revisado_en
+    ahora = time.monotonic()
+    if _indice is not None and ahora - _revisado_en < REFRESCO:
+        return _indice
+    with _lock:
+        if _indice is not None and ahora - _revisado_en < REFRESCO:
+            return _indice
+        if _indice is not None:
+            with db.conexion() as conn:
+                version = seq.actual(conn.cursor(), SEQ_VERSION)
+            # mientras se rearma, los demás hilos siguen con el snapshot anterior
+            _revisado_en = ahora
+            if version == _indice.version:
+                return _indice
+        _indice = _cargar()
+        _revisado_en = ahora
+        return _indice
+
+
+def _marcar_cambio():
+    # La próxima búsqueda revisa la versión sin esperar REFRESCO
+    global _revisado_en
+    _revisado_en = 0.0
+
+
+def buscar(texto: str, limite: int = 10) -> List[Dict[str, Any]]:
+    """Hasta `limite` productos {"sku", "nombre", "precio"} que calzan con `texto`."""
+    return indice().buscar(texto, limite)
+
+
+def obtener(sku: str) -> Optional[Dict[str, Any]]:
+    return indice().por_sku.get((sku or "").strip().upper())
+
+
+# ----------------- ESCRITURA -----------------
+def _validar(sku: Any, nombre: Any, precio: Any, stock: Any) -> Tuple[Optional[tuple], str]:
+    sku = str(sku or "").strip().upper()
+    nombre = " ".join(str(nombre or "").split())
+    if not sku or not nombre:
+        return None, "SKU y nombre son obligatorios."
+    try:
+        precio = float(precio)
+        stock = None if stock in (None, "") else int(stock)
+    except (TypeError, ValueError, OverflowError):
+        return None, "Precio o stock no numéricos."
+    # NaN pasa cualquier comparación (NaN <= 0 es falso) e inf no es un precio
+    if not math.isfinite(precio) or precio <= 0:
+        return None, "El precio debe ser un número > 0."
+    if stock is not None and stock < 0:
+        return None, "El stock no puede ser negativo."
+    return (sku, nombre, precio, stock), ""
+
+
+def _guardar(cur, sku: str, nombre: str, precio: float, stock: Optional[int]) -> bool:
+    """Actualiza nombre/precio o crea el SKU con su stock inicial en el libro. True si era nuevo."""
+    cur.execute(_SQL_ACTUALIZAR, (nombre, precio, sku))
+    if cur.rowcount:
+        return False
+    cur.execute(_SQL_NUEVO, (sku, nombre, precio))
+    if stock:
+        inventario.registrar_ajuste(cur, sku, stock, MOTIVO_CARGA)
+    return True
+
+
+def guardar_producto(sku: str, nombre: str, precio: float,
+                     stock: Optional[int] = None) -> Tuple[bool, str]:
+    """
+    Crea o actualiza un producto. `stock` es el inicial de un SKU nuevo; en uno
+    existente no se toca (reposiciones y mermas van por inventario.ajustar).
+    """
+    fila, error = _validar(sku, nombre, precio, stock)
+    if fila is None:
+        return False, error
+    try:
+        with db.conexion() as conn:
+            cur = conn.cursor()
+            db.iniciar_escritura(cur)
+            nuevo = _guardar(cur, *fila)
+            seq.siguiente(cur, SEQ_VERSION)
+            conn.commit()
+        _marcar_cambio()
+        cache.invalidar("stock")
+        if nuevo:
+            return True, f"Producto {fila[0]} creado con stock {fila[3] or 0}."
+        if fila[3] is not None:
+            return True, f"Producto {fila[0]} actualizado; el stock no cambia (usa \"Ajustar stock\")."
+        return True, f"Producto {fila[0]} actualizado."
+    except Exception as e:
+        return False, f"Error al guardar producto: {e}"
+
+
+def cargar(filas: Iterable[Dict[str, Any]]) -> Dict[str, Any]:
+    """
+    Carga masiva en una sola transacción: SKU nuevos con su stock inicial,
+    existentes solo nombre y precio (igual que guardar_producto). Una fila que
+    la BD rechaza se deshace hasta su punto de guardado y las demás siguen.
+    Retorna {"guardados", "nuevos", "rechazados": [{"linea", "motivo"}]}.
+    """
+    validas, rechazados = [], []
+    for n, f in enumerate(filas, start=2):  # línea 1 = encabezado
+        fila, error = _validar(f.get("sku"), f.get("nombre"), f.get("precio"), f.get("stock"))
+        if fila is None:
+            rechazados.append({"linea": n, "motivo": error})
+        else:
+            validas.append((n, fila))
+    guardados = nuevos = 0
+    if validas:
+        d = db.dialecto()
+        try:
+            with db.conexion() as conn:
+                cur = conn.cursor()
+                db.iniciar_escritura(cur)
+                for n, fila in validas:
+                    cur.execute(d.punto_guardado("fila_catalogo"))
+                    try:
+                        nuevos += _guardar(cur, *fila)
+                        guardados += 1
+                    except db.ErrorBD as e:
+                        cur.execute(d.volver_a_punto("fila_catalogo"))
+                        rechazados.append({"linea": n, "motivo": f"Error al guardar: {e}"})
+                seq.siguiente(cur, SEQ_VERSION)
+                conn.commit()
+        except db.ErrorBD as e:
+            # Falló la transacción entera (BD ocupada, commit): no quedó nada guardado
+            rechazados.extend({"linea": n, "motivo": f"Error al guardar: {e}"} for n, _ in validas)
+            guardados = nuevos = 0
+        rechazados.sort(key=lambda r: r["linea"])
+        if guardados:
+            _marcar_cambio()
+            cache.invalidar("stock")
+    return {"guardados": guardados, "nuevos": nuevos, "rechazados": rechazados}
+
+
+# ----------------- CLI -----------------
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("cargar", help="upsert desde CSV sku,nombre,precio[,stock]")
+    c.add_argument("archivo")
+    b = sub.add_parser("buscar")
+    b.add_argument("texto")
+    b.add_argument("--limite", type=int, default=10)
+    args = ap.parse_args(argv)
+
+    try:
+        import migraciones
+    except ImportError:
+        from . import migraciones
+    migraciones.asegurar_schema()
+    if args.cmd == "cargar":
+        with open(args.archivo, newline="", encoding="utf-8") as f:
+            r = cargar(csv.DictReader(f))
+        print(f"Guardados: {r['guardados']} ({r['nuevos']} nuevos)  Rechazados: {len(r['rechazados'])}")
+        for rej in r["rechazados"][:20]:
+            print(f"  línea {rej['linea']}: {rej['motivo']}")
+        return 0 if not r["rechazados"] else 1
+    t0 = time.perf_counter()
+    idx = indice()
+    t1 = time.perf_counter()
+    res = idx.buscar(args.texto, args.limite)
+    t2 = time.perf_counter()
+    for p in res:
+        print(f"{p['sku']:<14}{p['precio']:>12.0f}  {p['nombre']}")
+    print(f"({len(idx.productos)} productos; índice {1000 * (t1 - t0):.0f} ms, búsqueda {1000 * (t2 - t1):.2f} ms)",
+          file=sys.stderr)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
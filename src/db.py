@@ -1,18 +1,98 @@
 # src/db.py
 import os
+import queue
 import sqlite3
+import threading
+from contextlib import contextmanager
 
-# sqlite | sqlserver | oracle
+try:
+    import dialectos
+    import instrumentacion
+except ImportError:
+    from . import dialectos
+    from . import instrumentacion
+
+# sqlite | sqlserver | oracle | falso (SQLite detrás de driver_falso.py, para probar la portabilidad)
 ENGINE = os.getenv("DB_ENGINE", "sqlite").lower()
 
+# Ruta del archivo SQLite (DB_SQLITE_PATH permite apuntar a otra base, p. ej. en pruebas)
+DB_PATH = os.path.abspath(os.getenv("DB_SQLITE_PATH") or os.path.join(
+    os.path.dirname(__file__), "..", "database", "proyecto.db"))
+
+# Tamaño máximo del pool y espera máxima (segundos) cuando todas están en uso
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "10"))
+
+# Perfiles de almacenamiento SQLite, elegidos con DB_SQLITE_PROFILE.
+# - wal:     lectores no esperan a los escritores (BEGIN IMMEDIATE) y fsync solo en checkpoint
+# - seguro:  WAL pero con fsync en cada commit
+# - clasico: comportamiento por defecto de SQLite (rollback journal)
+# DB_SQLITE_PRAGMAS permite ajustar pragmas sueltos sobre el perfil,
+# p. ej. "cache_size=-64000,mmap_size=0".
+PERFILES_SQLITE = {
+    "wal": {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "cache_size": -20000,        # ~20 MB
+        "mmap_size": 268435456,      # 256 MB
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+    },
+    "seguro": {
+        "journal_mode": "WAL",
+        "synchronous": "FULL",
+        "cache_size": -20000,
+        "busy_timeout": 5000,
+        "temp_store": "MEMORY",
+    },
+    "clasico": {
+        "journal_mode": "DELETE",
+        "synchronous": "FULL",
+        "busy_timeout": 5000,
+    },
+}
+PERFIL_SQLITE = os.getenv("DB_SQLITE_PROFILE", "wal").lower()
+
+
+def perfil_sqlite() -> dict:
+    if PERFIL_SQLITE not in PERFILES_SQLITE:
+        raise RuntimeError(
+            f"DB_SQLITE_PROFILE no soportado: {PERFIL_SQLITE} (opciones: {', '.join(PERFILES_SQLITE)})")
+    pragmas = dict(PERFILES_SQLITE[PERFIL_SQLITE])
+    for par in filter(None, os.getenv("DB_SQLITE_PRAGMAS", "").split(",")):
+        clave, _, valor = par.partition("=")
+        clave, valor = clave.strip().lower(), valor.strip()
+        if not clave.isidentifier() or not valor.replace("-", "").isalnum():
+            raise RuntimeError(f"DB_SQLITE_PRAGMAS inválido: {par!r}")
+        pragmas[clave] = valor
+    return pragmas
+
+
+def _aplicar_perfil(conn: sqlite3.Connection):
+    # journal_mode primero: cambiarlo requiere que no haya otra transacción en curso
+    pragmas = perfil_sqlite()
+    orden = ["journal_mode"] + [k for k in pragmas if k != "journal_mode"]
+    for clave in orden:
+        if clave in pragmas:
+            conn.execute(f"PRAGMA {clave} = {pragmas[clave]};")
+
 
 def get_conn():
+    """
+    Abre una conexión física nueva (instrumentada, ver instrumentacion.py, y con
+    los marcadores `?` traducidos si el driver usa otros, ver dialectos.py).
+    El código de la app debe usar `conexion()`.
+    """
+    return instrumentacion.envolver(dialectos.adaptar(_conectar(), _dialecto))
+
+
+def _conectar():
     if ENGINE == "sqlite":
-        base_dir = os.path.abspath(os.path.join(
-            os.path.dirname(__file__), "..", "database"))
-        os.makedirs(base_dir, exist_ok=True)
-        db_path = os.path.join(base_dir, "proyecto.db")
-        return sqlite3.connect(db_path, check_same_thread=False)
+        os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
+        conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+        conn.execute("PRAGMA foreign_keys = ON;")
+        _aplicar_perfil(conn)
+        return conn
 
     elif ENGINE == "sqlserver":
         # Solo importamos si realmente vamos a usar SQL Server
@@ -60,5 +140,190 @@ def get_conn():
         dsn = f"{host}:{port}/{service}"  # formato host:port/service
         return oracledb.connect(user=user, password=pwd, dsn=dsn)
 
+    elif ENGINE == "falso":
+        try:
+            import driver_falso
+        except ImportError:
+            from . import driver_falso
+        return driver_falso.connect(DB_PATH)
+
     else:
-        raise RuntimeError(f"DB_ENGINE no soportado: {ENGINE}")
\ No newline at end of file
+        raise RuntimeError(f"DB_ENGINE no soportado: {ENGINE}")
+
+
+# -------------------------------
+# Dialecto y excepciones del motor
+# -------------------------------
+
+_dialecto = dialectos.para(ENGINE)
+
+
+def dialecto() -> dialectos.Dialecto:
+    """SQL propio del motor en uso (paginación, upsert, id generado...)."""
+    return _dialecto
+
+
+def iniciar_escritura(cur):
+    """Abre la transacción de escritura como la necesita el motor (BEGIN IMMEDIATE en SQLite)."""
+    if _dialecto.inicio_escritura:
+        cur.execute(_dialecto.inicio_escritura)
+
+
+def _modulo_driver():
+    # Todo driver DB-API expone Error e IntegrityError; si el de servidor no
+    # está instalado, _conectar avisará al abrir la primera conexión
+    try:
+        if ENGINE == "sqlserver":
+            import pyodbc
+            return pyodbc
+        if ENGINE == "oracle":
+            import oracledb
+            return oracledb
+        if ENGINE == "falso":
+            try:
+                import driver_falso
+            except ImportError:
+                from . import driver_falso
+            return driver_falso
+    except ImportError:
+        pass
+    return sqlite3
+
+
+_driver = _modulo_driver()
+# Para los except de la app: `except db.ErrorIntegridad:` en vez de sqlite3.IntegrityError
+ErrorBD = _driver.Error
+ErrorIntegridad = _driver.IntegrityError
+
+
+# -------------------------------
+# Pool de conexiones
+# -------------------------------
+
+class PoolConexiones:
+    """
+    Pool acotado de conexiones reutilizables, seguro entre hilos.
+    Cada conexión se entrega en exclusiva a quien la toma y vuelve al pool al
+    salir del `with`; así los hilos de Streamlit no comparten una conexión a la vez.
+    """
+
+    def __init__(self, fabrica=None, max_size: int = POOL_SIZE, timeout: float = POOL_TIMEOUT):
+        self._fabrica = fabrica or get_conn
+        self._max_size = max(1, int(max_size))
+        self._timeout = timeout
+        self._libres = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._creadas = 0
+        self._hits = 0
+        self._misses = 0
+        self._esperas = 0
+        self._descartadas = 0
+
+    def _tomar(self):
+        try:
+            conn = self._libres.get_nowait()
+            with self._lock:
+                self._hits += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            crear = self._creadas < self._max_size
+            if crear:
+                self._creadas += 1
+                self._misses += 1
+            else:
+                self._esperas += 1
+        if crear:
+            try:
+                return self._fabrica()
+            except Exception:
+                with self._lock:
+                    self._creadas -= 1
+                raise
+
+        try:
+            conn = self._libres.get(timeout=self._timeout)
+        except queue.Empty:
+            raise RuntimeError(
+                f"Pool de conexiones agotado ({self._max_size} en uso por más de {self._timeout}s)")
+        with self._lock:
+            self._hits += 1
+        return conn
+
+    def _devolver(self, conn):
+        # Nunca devolver una conexión con una transacción a medio camino
+        try:
+            conn.rollback()
+        except Exception:
+            self._descartar(conn)
+            return
+        self._libres.put(conn)
+
+    def _descartar(self, conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+        with self._lock:
+            self._creadas -= 1
+            self._descartadas += 1
+
+    @contextmanager
+    def conexion(self):
+        conn = self._tomar()
+        try:
+            yield conn
+        finally:
+            self._devolver(conn)
+
+    def estadisticas(self) -> dict:
+        with self._lock:
+            total = self._hits + self._misses
+            return {
+                "engine": ENGINE,
+                "max_size": self._max_size,
+                "creadas": self._creadas,
+                "libres": self._libres.qsize(),
+                "hits": self._hits,
+                "misses": self._misses,
+                "esperas": self._esperas,
+                "descartadas": self._descartadas,
+                "hit_ratio": (self._hits / total) if total else 0.0,
+            }
+
+    def cerrar(self):
+        while True:
+            try:
+                conn = self._libres.get_nowait()
+            except queue.Empty:
+                break
+            self._descartar(conn)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def pool() -> PoolConexiones:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                _pool = PoolConexiones()
+    return _pool
+
+
+def conexion():
+    """
+    Toma una conexión del pool compartido:
+
+        with db.conexion() as conn:
+            conn.execute(...)
+    """
+    return pool().conexion()
+
+
+def estadisticas_pool() -> dict:
+    return pool().estadisticas()
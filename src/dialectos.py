@@ -0,0 +1,286 @@
+# src/dialectos.py
+"""
+Lo que cambia en el SQL de un motor a otro (DB_ENGINE), para que orden_compra,
+login, reportes, etc. escriban cada consulta una sola vez.
+
+Las consultas se escriben con marcadores `?` y solo pasan por el dialecto en lo
+que no es igual en todos los motores:
+
+  - marcadores: con drivers de paramstyle numeric (oracledb, driver_falso) la
+    conexión traduce `?` a `:1, :2...` (ver adaptar); el resto no se toca
+  - transacción de escritura: SQLite toma el lock con BEGIN IMMEDIATE; en
+    SQL Server/Oracle la transacción es implícita y cada UPDATE bloquea su fila
+  - paginación: LIMIT ? / OFFSET 0 ROWS FETCH NEXT ? ROWS ONLY
+  - cursor (a, b) < (?, ?): SQL Server y Oracle no comparan tuplas
+  - upsert: INSERT ... ON CONFLICT / MERGE
+  - punto de guardado dentro de una transacción: SAVEPOINT / SAVE TRANSACTION
+  - id generado: lastrowid / OUTPUT INSERTED.id / RETURNING
+  - día de un timestamp, suma que da 0 sin filas (TOTAL) y número con prefijo
+  - hora de los timestamps: CURRENT_TIMESTAMP es UTC en SQLite y hora local
+    del servidor en SQL Server/Oracle; los rangos por día se arman con inicio_dia
+
+Los numeradores OC/BL siguen en la tabla `secuencias`: un UPDATE por clave
+primaria ya es portable y, a diferencia de un SEQUENCE nativo, no deja huecos
+cuando la transacción se revierte.
+"""
+from __future__ import annotations
+
+import datetime as dt
+import functools
+import re
+from typing import Dict, List, Optional, Sequence
+
+_RE_LITERAL = re.compile(r"('(?:[^']|'')*')")
+
+
+class Dialecto:
+    """SQLite, la base de desarrollo. Los demás motores sobrescriben lo que cambia."""
+
+    nombre = "sqlite"
+    paramstyle = "qmark"
+    # Sentencia que abre una transacción de escritura (None: implícita al primer DML)
+    inicio_escritura: Optional[str] = "BEGIN IMMEDIATE;"
+    # migraciones.py crea y actualiza el esquema (en servidor lo administra el DBA)
+    migra_esquema = True
+    # Búsqueda de órdenes con ordenes_fts (FTS5)
+    texto_completo = True
+
+    # ----------------- FRAGMENTOS -----------------
+    def limite(self) -> str:
+        """Cláusula final que deja las primeras `?` filas (el marcador va al final de los parámetros)."""
+        return "LIMIT ?"
+
+    def tupla_menor(self, columnas: Sequence[str]) -> str:
+        """Condición (c1, c2, ...) < (?, ?, ...); los parámetros se arman con params_tupla."""
+        return f"({', '.join(columnas)}) < ({', '.join('?' * len(columnas))})"
+
+    def params_tupla(self, valores: Sequence) -> List:
+        return list(valores)
+
+    def dia(self, columna: str) -> str:
+        """Día local 'AAAA-MM-DD' de un timestamp guardado con CURRENT_TIMESTAMP."""
+        # En SQLite está en UTC; 'localtime' usa la zona horaria del proceso
+        return f"date({columna}, 'localtime')"
+
+    def inicio_dia(self, dia: dt.date) -> str:
+        """Valor de un timestamp (creado_en) en que empieza el día local `dia`: límite para rangos."""
+        # CURRENT_TIMESTAMP de SQLite es UTC: la medianoche local se pasa a UTC
+        local = dt.datetime.combine(dia, dt.time())
+        return f"{local.astimezone(dt.timezone.utc):%Y-%m-%d %H:%M:%S}"
+
+    def suma(self, expr: str) -> str:
+        """SUM que da 0 (y no NULL) sin filas o con todo NULL."""
+        return f"TOTAL({expr})"
+
+    def numero_con_prefijo(self, prefijo: str, columna: str) -> str:
+        """prefijo + entero con al menos 4 dígitos, como secuencias.formatear ('BL-0042')."""
+        return f"{prefijo} || printf('%04d', {columna})"
+
+    def upsert(self, tabla: str, columnas: Sequence[str], claves: Sequence[str],
+               actualizar: Dict[str, str], origen: Optional[str] = None) -> str:
+        """
+        INSERT de `columnas` en `tabla` que, si ya hay una fila con las mismas
+        `claves`, aplica `actualizar` {columna: expresión}. En las expresiones
+        {actual}.x es el valor guardado y {nuevo}.x el que se intentó insertar.
+        `origen` es un SELECT que entrega `columnas` en orden y con esos mismos
+        alias; por defecto una fila de marcadores.
+        """
+        origen = origen or f"VALUES ({', '.join('?' * len(columnas))})"
+        sets = ", ".join(f"{c} = {e.format(actual=tabla, nuevo='excluded')}" for c, e in actualizar.items())
+        return (f"INSERT INTO {tabla} ({', '.join(columnas)}) {origen} "
+                f"ON CONFLICT ({', '.join(claves)}) DO UPDATE SET {sets}")
+
+    def punto_guardado(self, nombre: str) -> str:
+        """Marca dentro de la transacción a la que se puede volver sin deshacerla entera."""
+        return f"SAVEPOINT {nombre}"
+
+    def volver_a_punto(self, nombre: str) -> str:
+        return f"ROLLBACK TO SAVEPOINT {nombre}"
+
+    # ----------------- SENTENCIAS -----------------
+    def insertar_con_id(self, cur, sql: str, params: Sequence) -> int:
+        """Ejecuta un INSERT de una fila y retorna el `id` que generó la base."""
+        cur.execute(sql, params)
+        return cur.lastrowid
+
+    def columnas(self, cur, tabla: str) -> set:
+        """Nombres de columna de `tabla` (en minúsculas), sin leer filas."""
+        cur.execute(f"SELECT * FROM {tabla} WHERE 1 = 0")
+        nombres = {d[0].lower() for d in cur.description}
+        cur.fetchall()
+        return nombres
+
+
+class _Servidor(Dialecto):
+    """SQL estándar común a SQL Server y Oracle."""
+
+    inicio_escritura = None
+    migra_esquema = False
+    texto_completo = False
+    # Cómo termina un MERGE y desde dónde se seleccionan marcadores sueltos
+    _fin_merge = ""
+    _desde_nada = ""
+    _bloqueo_merge = ""
+
+    def limite(self) -> str:
+        # Requiere ORDER BY en la misma consulta (todas las paginadas lo tienen)
+        return "OFFSET 0 ROWS FETCH NEXT ? ROWS ONLY"
+
+    def tupla_menor(self, columnas: Sequence[str]) -> str:
+        # (a, b) < (x, y)  ==  a < x OR (a = x AND b < y)
+        partes = []
+        for i, c in enumerate(columnas):
+            iguales = [f"{p} = ?" for p in columnas[:i]]
+            partes.append("(" + " AND ".join(iguales + [f"{c} < ?"]) + ")")
+        return "(" + " OR ".join(partes) + ")"
+
+    def params_tupla(self, valores: Sequence) -> List:
+        out: List = []
+        for i in range(len(valores)):
+            out += list(valores[:i + 1])
+        return out
+
+    def inicio_dia(self, dia: dt.date) -> str:
+        # CURRENT_TIMESTAMP ya es la hora local del servidor
+        return f"{dia:%Y-%m-%d} 00:00:00"
+
+    def suma(self, expr: str) -> str:
+        return f"COALESCE(SUM({expr}), 0)"
+
+    def numero_con_prefijo(self, prefijo: str, columna: str) -> str:
+        return f"{prefijo} || LPAD({columna}, GREATEST(4, LENGTH({columna})), '0')"
+
+    def upsert(self, tabla, columnas, claves, actualizar, origen=None) -> str:
+        origen = origen or ("SELECT " + ", ".join(f"? AS {c}" for c in columnas) + self._desde_nada)
+        sets = ", ".join(f"{c} = {e.format(actual='t', nuevo='s')}" for c, e in actualizar.items())
+        return (f"MERGE INTO {tabla}{self._bloqueo_merge} t USING ({origen}) s "
+                f"ON ({' AND '.join(f't.{k} = s.{k}' for k in claves)}) "
+                f"WHEN MATCHED THEN UPDATE SET {sets} "
+                f"WHEN NOT MATCHED THEN INSERT ({', '.join(columnas)}) "
+                f"VALUES ({', '.join(f's.{c}' for c in columnas)}){self._fin_merge}")
+
+
+class DialectoSQLServer(_Servidor):
+    nombre = "sqlserver"
+    _fin_merge = ";"
+    # Sin HOLDLOCK dos MERGE concurrentes pueden insertar la misma clave
+    _bloqueo_merge = " WITH (HOLDLOCK)"
+
+    def dia(self, columna: str) -> str:
+        return f"CONVERT(char(10), {columna}, 23)"
+
+    def numero_con_prefijo(self, prefijo: str, columna: str) -> str:
+        return f"CONCAT({prefijo}, FORMAT({columna}, '0000'))"
+
+    def punto_guardado(self, nombre: str) -> str:
+        return f"SAVE TRANSACTION {nombre}"
+
+    def volver_a_punto(self, nombre: str) -> str:
+        return f"ROLLBACK TRANSACTION {nombre}"
+
+    def insertar_con_id(self, cur, sql, params) -> int:
+        cur.execute(re.sub(r"\)\s*VALUES\b", ") OUTPUT INSERTED.id VALUES", sql, count=1), params)
+        return int(cur.fetchone()[0])
+
+
+class DialectoOracle(_Servidor):
+    nombre = "oracle"
+    paramstyle = "numeric"
+    _desde_nada = " FROM dual"
+
+    def dia(self, columna: str) -> str:
+        return f"TO_CHAR({columna}, 'YYYY-MM-DD')"
+
+    def insertar_con_id(self, cur, sql, params) -> int:
+        var = cur.var(int)
+        cur.execute(sql + " RETURNING id INTO ?", [*params, var])
+        valor = var.getvalue()
+        return int(valor[0] if isinstance(valor, list) else valor)
+
+
+class DialectoFalso(_Servidor):
+    """
+    driver_falso.py: sintaxis de servidor donde SQLite la puede ejecutar
+    (sin BEGIN IMMEDIATE ni lastrowid, FETCH NEXT, marcadores numéricos) y
+    funciones de SQLite en lo demás.
+    """
+
+    nombre = "falso"
+    paramstyle = "numeric"
+    texto_completo = True
+    dia = Dialecto.dia
+    inicio_dia = Dialecto.inicio_dia
+    suma = Dialecto.suma
+    numero_con_prefijo = Dialecto.numero_con_prefijo
+    upsert = Dialecto.upsert
+
+    def insertar_con_id(self, cur, sql, params) -> int:
+        cur.execute(sql + " RETURNING id", params)
+        return int(cur.fetchone()[0])
+
+
+_DIALECTOS = {d.nombre: d for d in (Dialecto, DialectoSQLServer, DialectoOracle, DialectoFalso)}
+
+
+def para(engine: str) -> Dialecto:
+    """Dialecto de DB_ENGINE (el de SQLite si no se conoce: db.get_conn avisa al conectar)."""
+    return _DIALECTOS.get(engine, Dialecto)()
+
+
+# ----------------- MARCADORES NUMERADOS -----------------
+@functools.lru_cache(maxsize=1024)
+def numerar(sql: str) -> str:
+    """`?` -> `:1, :2, ...` en orden, sin tocar literales entre comillas."""
+    n = 0
+
+    def marca(_):
+        nonlocal n
+        n += 1
+        return f":{n}"
+
+    partes = _RE_LITERAL.split(sql)
+    for i in range(0, len(partes), 2):
+        partes[i] = re.sub(r"\?", marca, partes[i])
+    return "".join(partes)
+
+
+class CursorNumerado:
+    def __init__(self, cur):
+        self._cur = cur
+
+    def __getattr__(self, nombre):
+        return getattr(self._cur, nombre)
+
+    def __iter__(self):
+        return iter(self._cur)
+
+    def execute(self, sql, *args):
+        self._cur.execute(numerar(sql), *args)
+        return self
+
+    def executemany(self, sql, *args):
+        self._cur.executemany(numerar(sql), *args)
+        return self
+
+
+class ConexionNumerada:
+    """Conexión cuyos cursores traducen `?`; agrega conn.execute, que oracledb no tiene."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+    def cursor(self, *args, **kwargs):
+        return CursorNumerado(self._conn.cursor(*args, **kwargs))
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+
+def adaptar(conn, dialecto: Dialecto):
+    return ConexionNumerada(conn) if dialecto.paramstyle == "numeric" else conn
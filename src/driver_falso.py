@@ -0,0 +1,269 @@
+# src/driver_falso.py
+"""
+Driver DB-API de prueba (DB_ENGINE=falso) para ejercitar la capa de datos como
+si la base fuera un servidor, sin tener uno.
+
+Por debajo es el mismo archivo SQLite (DB_SQLITE_PATH), pero se comporta como
+pyodbc/oracledb y rechaza lo que solo funciona en SQLite:
+
+  - paramstyle numeric (:1, :2...): un `?` que no pasó por el dialecto falla
+  - transacción implícita al primer DML; no acepta BEGIN IMMEDIATE
+  - sin cursor.lastrowid: el id se pide con RETURNING
+  - excepciones propias (driver_falso.IntegrityError), no las de sqlite3
+  - rechaza PRAGMA, INSERT OR ... y LIMIT; la paginación va con
+    OFFSET 0 ROWS FETCH NEXT n ROWS ONLY, que aquí se traduce a LIMIT
+
+Las funciones de SQLite (date, TOTAL, MATCH de FTS5) y ON CONFLICT sí pasan:
+se prueba que el código use la capa, no la gramática completa del servidor.
+El esquema lo crea migraciones.py con DB_ENGINE=sqlite antes de usarlo.
+
+    python src/driver_falso.py     # login, catálogo, órdenes, boletas, lotes y reportes sobre una base temporal
+"""
+from __future__ import annotations
+
+import argparse
+import functools
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+from typing import List, Optional
+
+apilevel = "2.0"
+threadsafety = 1
+paramstyle = "numeric"
+
+
+class Error(Exception):
+    pass
+
+
+class DatabaseError(Error):
+    pass
+
+
+class OperationalError(DatabaseError):
+    pass
+
+
+class IntegrityError(DatabaseError):
+    pass
+
+
+class NotSupportedError(DatabaseError):
+    pass
+
+
+_RE_LITERAL = re.compile(r"('(?:[^']|'')*')")
+_PROPIO_SQLITE = re.compile(r"\bBEGIN\s+IMMEDIATE\b|\bPRAGMA\b|\bINSERT\s+OR\b|\bLIMIT\b|\?", re.I)
+_FETCH = re.compile(r"\bOFFSET\s+0\s+ROWS\s+FETCH\s+(?:NEXT|FIRST)\s+(:\d+|\d+)\s+ROWS\s+ONLY\b", re.I)
+_MARCADOR = re.compile(r":(\d+)")
+
+
+@functools.lru_cache(maxsize=1024)
+def _traducir(sql: str) -> str:
+    partes = _RE_LITERAL.split(sql)
+    for i in range(0, len(partes), 2):
+        m = _PROPIO_SQLITE.search(partes[i])
+        if m:
+            raise NotSupportedError(f"SQL propio de SQLite: {m.group(0)!r} en {' '.join(sql.split())[:120]}")
+        partes[i] = _MARCADOR.sub(r"?\1", _FETCH.sub(r"LIMIT \1", partes[i]))
+    return "".join(partes)
+
+
+def _traducir_error(e: sqlite3.Error) -> Error:
+    if isinstance(e, sqlite3.IntegrityError):
+        return IntegrityError(str(e))
+    if isinstance(e, sqlite3.OperationalError):
+        return OperationalError(str(e))
+    return DatabaseError(str(e))
+
+
+class Cursor:
+    arraysize = 1
+
+    def __init__(self, cur: sqlite3.Cursor):
+        self._cur = cur
+
+    @property
+    def description(self):
+        return self._cur.description
+
+    @property
+    def rowcount(self):
+        return self._cur.rowcount
+
+    def _llamar(self, metodo, *args):
+        try:
+            return getattr(self._cur, metodo)(*args)
+        except sqlite3.Error as e:
+            raise _traducir_error(e) from e
+
+    def execute(self, sql, params=()):
+        self._llamar("execute", _traducir(sql), params)
+        return self
+
+    def executemany(self, sql, filas):
+        self._llamar("executemany", _traducir(sql), filas)
+        return self
+
+    def fetchone(self):
+        return self._llamar("fetchone")
+
+    def fetchmany(self, *args):
+        return self._llamar("fetchmany", *args)
+
+    def fetchall(self):
+        return self._llamar("fetchall")
+
+    def __iter__(self):
+        return iter(self.fetchone, None)
+
+    def close(self):
+        self._cur.close()
+
+
+class Conexion:
+    def __init__(self, ruta: str, timeout: float):
+        # isolation_level por defecto: sqlite3 abre la transacción antes del primer DML
+        self._conn = sqlite3.connect(ruta, timeout=timeout, check_same_thread=False)
+        self._conn.execute("PRAGMA foreign_keys = ON;")
+
+    def cursor(self) -> Cursor:
+        return Cursor(self._conn.cursor())
+
+    def commit(self):
+        try:
+            self._conn.commit()
+        except sqlite3.Error as e:
+            raise _traducir_error(e) from e
+
+    def rollback(self):
+        self._conn.rollback()
+
+    def close(self):
+        self._conn.close()
+
+
+def connect(ruta: str, timeout: float = 5.0) -> Conexion:
+    return Conexion(ruta, timeout)
+
+
+# ----------------- RECORRIDO -----------------
+def _escenario() -> List[str]:
+    """Corre con DB_ENGINE=falso; retorna los pasos que fallaron."""
+    import boleta_html
+    import catalogo
+    import db
+    import emision_lote
+    import importador
+    import inventario
+    import login
+    import orden_compra as oc
+    import reportes
+    import sesiones
+
+    fallas: List[str] = []
+
+    def paso(nombre: str, ok: bool, detalle: object = ""):
+        print(f"{'ok' if ok else 'FALLA':<5} {nombre}" + ("" if ok else f"  {detalle}"))
+        if not ok:
+            fallas.append(nombre)
+
+    paso("motor", db.dialecto().nombre == "falso", db.ENGINE)
+    login.create_tables()
+    r = login.register_user("falso", "clave-falsa", "Driver falso")
+    paso("crear usuario", r[0], r)
+    r = login.register_user("falso", "otra", None)
+    paso("usuario repetido -> ErrorIntegridad", r == (False, "El usuario ya existe"), r)
+    user = login.verify_login("falso", "clave-falsa")
+    paso("login", user is not None)
+    paso("login con clave errada", login.verify_login("falso", "mala") is None)
+    token = sesiones.crear(user["id"])
+    paso("sesión", sesiones.validar(token) == user["id"])
+
+    items = [{"producto": "Martillo", "precio": 5990, "cantidad": 2}]
+    datos = ("Cliente Falso", "Calle 1", "+56 9 1111 1111", "Ñuñoa", "Metropolitana")
+    numero, _ = oc.reservar_numero_orden("sesion-falsa")
+    r = oc.agregar_orden(*datos, items, user_id=user["id"], numero_orden_preasignado=numero, sesion="sesion-falsa")
+    paso("orden con número reservado", r[0] and r[2] == numero, r)
+    r = oc.crear_boleta_para_orden(numero)
+    paso("boleta de la orden", r[0], r)
+    r = oc.emitir_orden_con_boleta(*datos, items, user_id=user["id"])
+    paso("orden + boleta en una transacción", r[0], r[:2])
+    paso("boleta por número", oc.obtener_boleta_por_numero(r[2]["numero_boleta"]) is not None)
+    paso("boleta HTML (upsert)", "Cliente Falso" in (boleta_html.html_boleta(r[2]["numero_boleta"]) or ""))
+
+    pagina, siguiente = oc.listar_ordenes_pagina(page_size=1, user_id=user["id"])
+    resto, _ = oc.listar_ordenes_pagina(page_size=1, user_id=user["id"], after=siguiente)
+    paso("listado paginado por cursor",
+         len(pagina) == 1 and len(resto) == 1 and pagina[0]["id"] != resto[0]["id"], (pagina, resto))
+    paso("búsqueda", any(o["numero_orden"] == numero for o in oc.buscar_ordenes("falso")))
+
+    r = catalogo.guardar_producto("FALSO-1", "Martillo falso", 5990, 10)
+    paso("producto nuevo", r[0], r)
+    r = catalogo.cargar([{"sku": "FALSO-1", "nombre": "Martillo falso", "precio": 6490, "stock": 99},
+                         {"sku": "FALSO-2", "nombre": "Serrucho falso", "precio": 8990, "stock": 3}])
+    paso("carga de catálogo", r["guardados"] == 2 and r["nuevos"] == 1, r)
+    paso("búsqueda en catálogo", [p["sku"] for p in catalogo.buscar("serrucho")] == ["FALSO-2"])
+    r = inventario.ajustar("FALSO-1", 5, "reposición")
+    paso("ajuste de stock", r[0], r)
+    con_sku = [{"producto": "Martillo falso", "precio": 6490, "cantidad": 4, "sku": "FALSO-1"}]
+    r = oc.agregar_orden(*datos, con_sku, user_id=user["id"])
+    paso("orden que descuenta stock", r[0] and inventario.stock_de(("FALSO-1",)) == {"FALSO-1": 11}, r)
+    paso("libro de movimientos", sum(m["cantidad"] for m in inventario.movimientos("FALSO-1")) == 11)
+
+    r = importador.importar_registros(
+        ((n, {"cliente": f"Importado {n}", "direccion": "Calle 2", "telefono": "1", "comuna": "Maipú",
+              "region": "Metropolitana", "items": items}) for n in range(1, 8)), chunk=3)
+    paso("importación por lotes", r["importadas"] == 7 and not r["rechazadas"], r)
+    simulado = emision_lote.emitir_pendientes(chunk=4, simular=True)
+    r = emision_lote.emitir_pendientes(chunk=4)
+    paso("emisión de boletas por lote",
+         r["emitidas"] == simulado["emitidas"] >= 7 and r["total"] == simulado["total"], r)
+    paso("boleta del lote", oc.obtener_boleta_por_numero(r["hasta"]) is not None, r["hasta"])
+
+    def rollup():
+        return {k: round(v, 2) for k, v in reportes.resumen().items()}
+
+    antes = rollup()
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        db.iniciar_escritura(cur)
+        reportes.reconstruir(cur)
+        conn.commit()
+    paso("rollup de ventas = reconstrucción", antes == rollup() and antes["boletas"] >= 9, (antes, rollup()))
+    r = login.reset_password(user["id"], "clave-nueva")
+    paso("cambio de contraseña", r[0] and sesiones.validar(token) is None, r)
+    return fallas
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--base", help="copia esta base SQLite en vez de partir de una vacía")
+    ap.add_argument("--escenario", action="store_true", help=argparse.SUPPRESS)
+    args = ap.parse_args(argv)
+    if args.escenario:
+        return 1 if _escenario() else 0
+
+    aqui = os.path.dirname(os.path.abspath(__file__))
+    tmp = tempfile.mkdtemp(prefix="driver_falso_")
+    ruta = os.path.join(tmp, "falso.db")
+    try:
+        if args.base:
+            shutil.copyfile(args.base, ruta)
+        env = dict(os.environ, DB_SQLITE_PATH=ruta, PYTHONPATH=aqui)
+        # El esquema lo pone SQLite; el recorrido corre en otro proceso con el driver falso
+        subprocess.run([sys.executable, "-c", "import migraciones; migraciones.asegurar_schema()"],
+                       env=dict(env, DB_ENGINE="sqlite"), cwd=aqui, check=True)
+        return subprocess.run([sys.executable, os.path.abspath(__file__), "--escenario"],
+                              env=dict(env, DB_ENGINE="falso"), cwd=aqui).returncode
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
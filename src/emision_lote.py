@@ -0,0 +1,172 @@
+# src/emision_lote.py
+"""
+Emisión masiva de boletas para órdenes que quedaron sin boleta
+(importadas, o guardadas cuando la emisión falló).
+
+Todo se resuelve en SQL: las pendientes salen de un anti-join contra boletas,
+neto/IVA/total se calculan en la misma consulta agregada sobre orden_items y
+el INSERT ... SELECT numera el lote con un bloque contiguo BL- tomado con un
+solo UPDATE. Una transacción de escritura por lote (db.iniciar_escritura).
+
+    python src/emision_lote.py --simular
+    python src/emision_lote.py --chunk 1000
+"""
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from typing import Any, Dict, List, Optional
+
+try:
+    import cache
+    import db
+    import migraciones
+    import orden_compra as oc
+    import reportes
+    import secuencias as seq
+except ImportError:
+    from . import cache
+    from . import db
+    from . import migraciones
+    from . import orden_compra as oc
+    from . import reportes
+    from . import secuencias as seq
+
+CHUNK = 1000
+
+# Órdenes sin boleta (usa idx_boletas_numero_orden)
+_SQL_PENDIENTES = f"""
+    SELECT o.id
+    FROM ordenes_compra o
+    LEFT JOIN boletas b ON b.numero_orden = o.numero_orden
+    WHERE b.id IS NULL AND o.id > ?
+    ORDER BY o.id
+    {db.dialecto().limite()}
+"""
+
+# Mismo criterio que crear_boleta_para_orden: neto = suma de líneas salvo que
+# difiera del total guardado en la OC, en cuyo caso manda la OC.
+# Tabla derivada y no WITH: SQL Server no acepta un WITH dentro de INSERT ... SELECT
+# y Oracle no lo acepta antes del INSERT.
+_MONTOS = f"""(
+        SELECT base.*, ROUND(neto * {oc.IVA_RATE}, 2) AS iva
+        FROM (
+            SELECT o.id, o.numero_orden, o.user_id, o.cliente, o.direccion, o.telefono,
+                   o.comuna, o.region,
+                   COALESCE(SUM(i.cantidad), 0) AS total_items,
+                   CASE WHEN ABS(COALESCE(SUM(i.cantidad * i.precio), 0) - o.total) > 0.01
+                        THEN o.total ELSE COALESCE(SUM(i.cantidad * i.precio), 0) END AS neto
+            FROM ordenes_compra o
+            LEFT JOIN boletas b ON b.numero_orden = o.numero_orden
+            LEFT JOIN orden_items i ON i.orden_id = o.id
+            WHERE b.id IS NULL AND o.id BETWEEN ? AND ?
+            GROUP BY o.id, o.numero_orden, o.user_id, o.cliente, o.direccion, o.telefono,
+                     o.comuna, o.region, o.total
+        ) base
+    ) montos"""
+
+# Parámetros: prefijo, primer número del bloque, id desde, id hasta
+_SQL_INSERTAR = f"""
+    INSERT INTO boletas
+    (numero_boleta, numero_orden, user_id, cliente, direccion, telefono, comuna, region,
+     total_items, neto, iva, total)
+    SELECT {db.dialecto().numero_con_prefijo("?", "n")},
+           numero_orden, user_id, cliente, direccion, telefono, comuna, region,
+           total_items, neto, iva, ROUND(neto + iva, 2)
+    FROM (
+        SELECT montos.*, ? + ROW_NUMBER() OVER (ORDER BY id) - 1 AS n
+        FROM {_MONTOS}
+    ) numeradas
+    ORDER BY id
+"""
+
+_SQL_TOTALES = f"""
+    SELECT COUNT(*), COALESCE(SUM(neto), 0), COALESCE(SUM(iva), 0),
+           COALESCE(SUM(ROUND(neto + iva, 2)), 0)
+    FROM {_MONTOS}
+"""
+
+
+def _lote(cur, desde_id: int, chunk: int) -> List[int]:
+    cur.execute(_SQL_PENDIENTES, (desde_id, chunk))
+    return [r[0] for r in cur.fetchall()]
+
+
+def emitir_pendientes(chunk: int = CHUNK, simular: bool = False, limite: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Emite boletas para todas las órdenes que no tienen una.
+    Con `simular=True` solo calcula cuántas y por cuánto, sin escribir.
+    Retorna {"emitidas", "lotes", "neto", "iva", "total", "desde", "hasta",
+    "segundos", "boletas_s", "simulado"}; desde/hasta es el rango BL asignado.
+    """
+    t0 = time.perf_counter()
+    r: Dict[str, Any] = {"emitidas": 0, "lotes": 0, "neto": 0.0, "iva": 0.0, "total": 0.0,
+                         "desde": None, "hasta": None, "simulado": simular}
+    ultimo_id = 0
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        proximo = seq.actual(cur, oc._SEQ_BL) + 1
+        while limite is None or r["emitidas"] < limite:
+            n = chunk if limite is None else min(chunk, limite - r["emitidas"])
+            if not simular:
+                db.iniciar_escritura(cur)
+            ids = _lote(cur, ultimo_id, n)
+            if not ids:
+                conn.rollback()
+                break
+            rango = (ids[0], ids[-1])
+            cur.execute(_SQL_TOTALES, rango)
+            cant, neto, iva, total = cur.fetchone()
+            if simular:
+                primero = proximo
+                proximo += cant
+            else:
+                primero = seq.reservar_bloque(cur, oc._SEQ_BL, cant)
+                cur.execute(_SQL_INSERTAR, (oc._BL_PREFIX, primero) + rango)
+                reportes.acumular_boletas_numeros(
+                    cur, [seq.formatear(oc._BL_PREFIX, primero + k) for k in range(cant)])
+                conn.commit()
+
+            ultimo_id = ids[-1]
+            r["lotes"] += 1
+            r["emitidas"] += cant
+            r["neto"] += neto
+            r["iva"] += iva
+            r["total"] += total
+            r["desde"] = r["desde"] or seq.formatear(oc._BL_PREFIX, primero)
+            r["hasta"] = seq.formatear(oc._BL_PREFIX, primero + cant - 1)
+
+    if r["emitidas"] and not simular:
+        # buscar_ordenes ("ordenes") indexa también los números de boleta
+        cache.invalidar("ordenes", "boletas")
+    segundos = time.perf_counter() - t0
+    r.update({
+        "neto": round(r["neto"], 2), "iva": round(r["iva"], 2), "total": round(r["total"], 2),
+        "segundos": round(segundos, 3),
+        "boletas_s": round(r["emitidas"] / segundos, 1) if segundos > 0 else 0.0,
+    })
+    return r
+
+
+# ----------------- CLI -----------------
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--chunk", type=int, default=CHUNK, help="boletas por transacción")
+    ap.add_argument("--limite", type=int, help="emitir a lo más N boletas")
+    ap.add_argument("--simular", action="store_true", help="calcula sin escribir (dry-run)")
+    args = ap.parse_args(argv)
+
+    migraciones.asegurar_schema()
+    r = emitir_pendientes(args.chunk, args.simular, args.limite)
+    accion = "Se emitirían" if r["simulado"] else "Emitidas"
+    print(f"{accion}: {r['emitidas']} boletas en {r['lotes']} lotes "
+          f"({r['segundos']}s, {r['boletas_s']} boletas/s)")
+    if r["emitidas"]:
+        print(f"  Rango: {r['desde']} .. {r['hasta']}")
+        print(f"  Neto: {oc._fmt_chl(r['neto'])}  IVA: {oc._fmt_chl(r['iva'])}  Total: {oc._fmt_chl(r['total'])}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
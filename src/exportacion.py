@@ -0,0 +1,171 @@
+# src/exportacion.py
+"""
+Exportación en streaming del historial completo: órdenes, líneas de orden y boletas.
+
+Las filas se leen con fetchmany sobre un cursor abierto (SQLite avanza paso a
+paso; pyodbc/oracledb traen de a `arraysize`) y se escriben en trozos de CSV,
+así la memoria no depende del tamaño del historial.
+
+    python src/exportacion.py ordenes --desde 2025-01-01 --hasta 2025-12-31 -o ordenes.csv
+    python src/exportacion.py boletas --user-id 3 --excel -o boletas.csv
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import datetime as dt
+import io
+import sys
+import tempfile
+from typing import Any, BinaryIO, Dict, Iterator, List, Optional, Tuple
+
+try:
+    import db
+    import migraciones
+except ImportError:
+    from . import db
+    from . import migraciones
+
+CHUNK = 2000
+
+# tipo -> (encabezado, SELECT ... FROM ..., alias de la tabla filtrada, ORDER BY)
+EXPORTES: Dict[str, Tuple[Tuple[str, ...], str, str, str]] = {
+    "ordenes": (
+        ("numero_orden", "cliente", "direccion", "telefono", "comuna", "region",
+         "total", "creado_en", "user_id"),
+        """SELECT o.numero_orden, o.cliente, o.direccion, o.telefono, o.comuna, o.region,
+                  o.total, o.creado_en, o.user_id
+           FROM ordenes_compra o""",
+        "o", "o.creado_en, o.id",
+    ),
+    "lineas": (
+        ("numero_orden", "linea", "sku", "producto", "precio", "cantidad", "subtotal", "creado_en", "user_id"),
+        """SELECT o.numero_orden, i.linea, i.sku, i.producto, i.precio, i.cantidad,
+                  i.precio * i.cantidad, o.creado_en, o.user_id
+           FROM ordenes_compra o
+           JOIN orden_items i ON i.orden_id = o.id""",
+        "o", "o.creado_en, o.id, i.linea",
+    ),
+    "boletas": (
+        ("numero_boleta", "numero_orden", "cliente", "direccion", "telefono", "comuna", "region",
+         "total_items", "neto", "iva", "total", "creado_en", "user_id"),
+        """SELECT b.numero_boleta, b.numero_orden, b.cliente, b.direccion, b.telefono, b.comuna,
+                  b.region, b.total_items, b.neto, b.iva, b.total, b.creado_en, b.user_id
+           FROM boletas b""",
+        "b", "b.id",
+    ),
+}
+
+
+def _consulta(tipo: str, desde: Optional[dt.date], hasta: Optional[dt.date],
+              user_id: Optional[int]) -> Tuple[str, List[Any]]:
+    if tipo not in EXPORTES:
+        raise ValueError(f"Tipo de exportación no soportado: {tipo}")
+    _, base, t, orden = EXPORTES[tipo]
+    # Fechas en día local; creado_en puede estar en UTC (ver dialectos.inicio_dia)
+    d = db.dialecto()
+    cond, params = [], []
+    if desde:
+        cond.append(f"{t}.creado_en >= ?")
+        params.append(d.inicio_dia(desde))
+    if hasta:
+        # `hasta` es inclusivo: todo el día
+        cond.append(f"{t}.creado_en < ?")
+        params.append(d.inicio_dia(hasta + dt.timedelta(days=1)))
+    if user_id is not None:
+        cond.append(f"{t}.user_id = ?")
+        params.append(user_id)
+    where = f" WHERE {' AND '.join(cond)}" if cond else ""
+    return f"{base}{where} ORDER BY {orden}", params
+
+
+def filas(tipo: str, desde: Optional[dt.date] = None, hasta: Optional[dt.date] = None,
+          user_id: Optional[int] = None, chunk: int = CHUNK) -> Iterator[List[tuple]]:
+    """Genera lotes de a lo más `chunk` filas. La conexión vuelve al pool al agotarse o cerrarse."""
+    sql, params = _consulta(tipo, desde, hasta, user_id)
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        cur.arraysize = chunk
+        cur.execute(sql, params)
+        while True:
+            lote = cur.fetchmany(chunk)
+            if not lote:
+                break
+            yield lote
+
+
+def _valor_excel(v: Any) -> Any:
+    # Excel en español espera coma decimal
+    return str(v).replace(".", ",") if isinstance(v, float) else v
+
+
+def csv_chunks(tipo: str, desde: Optional[dt.date] = None, hasta: Optional[dt.date] = None,
+               user_id: Optional[int] = None, excel: bool = False, chunk: int = CHUNK) -> Iterator[bytes]:
+    """
+    Genera el CSV en trozos de bytes (encabezado primero).
+    `excel=True`: BOM UTF-8, separador ';' y coma decimal, para abrir directo en Excel.
+    """
+    if tipo not in EXPORTES:
+        raise ValueError(f"Tipo de exportación no soportado: {tipo}")
+    buf = io.StringIO()
+    w = csv.writer(buf, delimiter=";" if excel else ",")
+    w.writerow(EXPORTES[tipo][0])
+    yield buf.getvalue().encode("utf-8-sig" if excel else "utf-8")
+    for lote in filas(tipo, desde, hasta, user_id, chunk):
+        buf.seek(0)
+        buf.truncate()
+        if excel:
+            w.writerows([_valor_excel(v) for v in fila] for fila in lote)
+        else:
+            w.writerows(lote)
+        yield buf.getvalue().encode("utf-8")
+
+
+def escribir(destino: BinaryIO, tipo: str, **kwargs) -> int:
+    """Vuelca el CSV en `destino`; retorna los bytes escritos."""
+    n = 0
+    for trozo in csv_chunks(tipo, **kwargs):
+        destino.write(trozo)
+        n += len(trozo)
+    return n
+
+
+def a_archivo_temporal(tipo: str, **kwargs) -> BinaryIO:
+    """CSV completo en un archivo temporal (en disco pasado 1 MB), listo para leer desde el inicio."""
+    f = tempfile.SpooledTemporaryFile(max_size=1 << 20)
+    escribir(f, tipo, **kwargs)
+    f.seek(0)
+    return f
+
+
+def nombre_archivo(tipo: str, desde: Optional[dt.date] = None, hasta: Optional[dt.date] = None) -> str:
+    rango = "_".join(d.isoformat() for d in (desde, hasta) if d)
+    return f"{tipo}{'_' + rango if rango else ''}.csv"
+
+
+# ----------------- CLI -----------------
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("tipo", choices=list(EXPORTES))
+    ap.add_argument("--desde", type=dt.date.fromisoformat, help="AAAA-MM-DD (inclusive)")
+    ap.add_argument("--hasta", type=dt.date.fromisoformat, help="AAAA-MM-DD (inclusive)")
+    ap.add_argument("--user-id", type=int)
+    ap.add_argument("--excel", action="store_true", help="BOM, ';' y coma decimal")
+    ap.add_argument("--chunk", type=int, default=CHUNK)
+    ap.add_argument("-o", "--salida", help="archivo destino (por defecto stdout)")
+    args = ap.parse_args(argv)
+
+    migraciones.asegurar_schema()
+    kwargs = dict(desde=args.desde, hasta=args.hasta, user_id=args.user_id,
+                  excel=args.excel, chunk=args.chunk)
+    if args.salida:
+        with open(args.salida, "wb") as f:
+            n = escribir(f, args.tipo, **kwargs)
+        print(f"{args.salida}: {n} bytes", file=sys.stderr)
+    else:
+        escribir(sys.stdout.buffer, args.tipo, **kwargs)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
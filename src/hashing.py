@@ -0,0 +1,204 @@
+# src/hashing.py
+"""
+Hash de contraseñas con KDF de costo configurable (PBKDF2-SHA256 o scrypt, ambos de hashlib).
+
+El hash guardado describe cómo se calculó, así se puede cambiar el algoritmo o
+el costo sin migrar la tabla: los hashes viejos se siguen verificando y
+login.verify_login los recalcula con la configuración vigente al entrar.
+
+    pbkdf2_sha256$<iteraciones>$<salt>$<hex>
+    scrypt$<n>$<r>$<p>$<salt>$<hex>
+    <hex de 64>                        (legado: sha256(salt + password), salt en su columna)
+
+Costo: PASSWORD_HASHER (pbkdf2 | scrypt), PBKDF2_ITERACIONES, SCRYPT_N/SCRYPT_R/SCRYPT_P.
+bench/bench_login.py ayuda a elegirlo según la latencia objetivo.
+
+login.py no llama al KDF en el hilo de Streamlit sino vía ejecutar(): un pool
+acotado de HASH_HILOS hilos (hashlib suelta el GIL durante el KDF) con a lo más
+HASH_COLA tareas esperando y HASH_TIMEOUT segundos por tarea. Si el pool está
+lleno o no responde a tiempo se lanza HashOcupado en vez de encolar sin límite.
+"""
+from __future__ import annotations
+
+import hashlib
+import hmac
+import os
+import re
+import secrets
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FuturoTimeout
+from typing import Any, Callable, Dict, Optional
+
+ALGORITMO = os.getenv("PASSWORD_HASHER", "pbkdf2").lower()
+ALGORITMOS = ("pbkdf2", "scrypt")
+if ALGORITMO not in ALGORITMOS:
+    # Mejor fallar al arrancar que en cada login (necesita_rehash daría siempre True)
+    raise ValueError(f"PASSWORD_HASHER no soportado: {ALGORITMO!r} (usa {' o '.join(ALGORITMOS)})")
+PBKDF2_ITERACIONES = int(os.getenv("PBKDF2_ITERACIONES", "200000"))
+SCRYPT_N = int(os.getenv("SCRYPT_N", str(2 ** 14)))
+SCRYPT_R = int(os.getenv("SCRYPT_R", "8"))
+SCRYPT_P = int(os.getenv("SCRYPT_P", "1"))
+
+HASH_HILOS = int(os.getenv("HASH_HILOS", str(min(4, os.cpu_count() or 1))))
+HASH_COLA = int(os.getenv("HASH_COLA", "32"))
+HASH_TIMEOUT = float(os.getenv("HASH_TIMEOUT", "5"))
+
+_RE_LEGADO = re.compile(r"^[0-9a-f]{64}$")
+
+
+# ----------------- MOTORES -----------------
+def _pbkdf2(password: str, salt: str, iteraciones: int) -> str:
+    return hashlib.pbkdf2_hmac("sha256", password.encode("utf-8"), salt.encode("utf-8"), iteraciones).hex()
+
+
+def _scrypt(password: str, salt: str, n: int, r: int, p: int) -> str:
+    # maxmem holgado: el default de OpenSSL (32 MB) no alcanza para n=2**15, r=8
+    return hashlib.scrypt(password.encode("utf-8"), salt=salt.encode("utf-8"),
+                          n=n, r=r, p=p, maxmem=256 * n * r + (1 << 20), dklen=32).hex()
+
+
+def _legado(password: str, salt: str) -> str:
+    return hashlib.sha256((salt + password).encode("utf-8")).hexdigest()
+
+
+def hash_password(password: str, algoritmo: Optional[str] = None, salt: Optional[str] = None) -> str:
+    """Hash codificado con la configuración vigente (o la indicada)."""
+    algoritmo = (algoritmo or ALGORITMO).lower()
+    salt = salt or secrets.token_hex(16)
+    if algoritmo == "pbkdf2":
+        return f"pbkdf2_sha256${PBKDF2_ITERACIONES}${salt}${_pbkdf2(password, salt, PBKDF2_ITERACIONES)}"
+    if algoritmo == "scrypt":
+        return (f"scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${salt}$"
+                f"{_scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)}")
+    raise ValueError(f"Algoritmo de hash no soportado: {algoritmo}")
+
+
+def salt_de(almacenado: str) -> str:
+    """Salt embebido en un hash codificado (para llenar la columna `salt`)."""
+    partes = almacenado.split("$")
+    return partes[-2] if len(partes) >= 4 else ""
+
+
+# ----------------- VERIFICACIÓN -----------------
+def _recalcular(password: str, almacenado: str, salt_legado: str) -> Optional[str]:
+    partes = almacenado.split("$")
+    try:
+        if partes[0] == "pbkdf2_sha256" and len(partes) == 4:
+            return _pbkdf2(password, partes[2], int(partes[1]))
+        if partes[0] == "scrypt" and len(partes) == 6:
+            return _scrypt(password, partes[4], int(partes[1]), int(partes[2]), int(partes[3]))
+    except ValueError:
+        return None
+    if _RE_LEGADO.match(almacenado):
+        return _legado(password, salt_legado)
+    return None
+
+
+def verificar(password: str, almacenado: str, salt_legado: str = "") -> bool:
+    """Compara en tiempo constante. `salt_legado` solo se usa con hashes SHA-256 antiguos."""
+    calculado = _recalcular(password, almacenado or "", salt_legado or "")
+    if calculado is None:
+        return False
+    return hmac.compare_digest(calculado, almacenado.split("$")[-1])
+
+
+def necesita_rehash(almacenado: str) -> bool:
+    """True si el hash es legado o se calculó con otro algoritmo/costo que el vigente."""
+    partes = (almacenado or "").split("$")
+    if ALGORITMO == "pbkdf2":
+        return not (partes[0] == "pbkdf2_sha256" and len(partes) == 4
+                    and partes[1] == str(PBKDF2_ITERACIONES))
+    if ALGORITMO == "scrypt":
+        return not (partes[0] == "scrypt" and len(partes) == 6
+                    and partes[1:4] == [str(SCRYPT_N), str(SCRYPT_R), str(SCRYPT_P)])
+    return True
+
+
+# Hash de relleno para usuarios inexistentes: el login tarda lo mismo exista o no
+_FICTICIO = None
+
+
+def verificar_ficticio(password: str) -> bool:
+    global _FICTICIO
+    if _FICTICIO is None:
+        _FICTICIO = hash_password(secrets.token_hex(8))
+    verificar(password, _FICTICIO)
+    return False
+
+
+# ----------------- POOL DE HASHING -----------------
+class HashOcupado(Exception):
+    """El pool de hashing está lleno o no terminó a tiempo."""
+
+
+_pool: Optional[ThreadPoolExecutor] = None
+_cupos = threading.BoundedSemaphore(HASH_HILOS + HASH_COLA)
+_lock = threading.Lock()
+_met = {"en_cola": 0, "en_curso": 0, "max_cola": 0, "completadas": 0,
+        "rechazadas": 0, "timeouts": 0, "espera_total": 0.0, "calculo_total": 0.0}
+
+
+def _ejecutor() -> ThreadPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _lock:
+            if _pool is None:
+                _pool = ThreadPoolExecutor(max_workers=HASH_HILOS, thread_name_prefix="hash")
+    return _pool
+
+
+def _tarea(fn: Callable[..., Any], encolada: float, args: tuple) -> Any:
+    inicio = time.perf_counter()
+    with _lock:
+        _met["en_cola"] -= 1
+        _met["en_curso"] += 1
+        _met["espera_total"] += inicio - encolada
+    try:
+        return fn(*args)
+    finally:
+        with _lock:
+            _met["en_curso"] -= 1
+            _met["completadas"] += 1
+            _met["calculo_total"] += time.perf_counter() - inicio
+        _cupos.release()
+
+
+def ejecutar(fn: Callable[..., Any], *args: Any, timeout: Optional[float] = None) -> Any:
+    """Corre fn(*args) en el pool y espera el resultado; HashOcupado si no hay cupo o tarda demasiado."""
+    if not _cupos.acquire(blocking=False):
+        with _lock:
+            _met["rechazadas"] += 1
+        raise HashOcupado("Demasiados inicios de sesión simultáneos, intenta en unos segundos.")
+    with _lock:
+        _met["en_cola"] += 1
+        _met["max_cola"] = max(_met["max_cola"], _met["en_cola"])
+    try:
+        futuro = _ejecutor().submit(_tarea, fn, time.perf_counter(), args)
+    except Exception:
+        with _lock:
+            _met["en_cola"] -= 1
+        _cupos.release()
+        raise
+    try:
+        return futuro.result(timeout=HASH_TIMEOUT if timeout is None else timeout)
+    except FuturoTimeout:
+        # si aún no partió se descarta; si ya corre, termina y libera su cupo sola
+        if futuro.cancel():
+            with _lock:
+                _met["en_cola"] -= 1
+            _cupos.release()
+        with _lock:
+            _met["timeouts"] += 1
+        raise HashOcupado("El servidor está ocupado verificando contraseñas, intenta en unos segundos.")
+
+
+def metricas() -> Dict[str, Any]:
+    """Profundidad de cola y contadores del pool (para el panel de administración)."""
+    with _lock:
+        m = dict(_met)
+    n = m["completadas"]
+    m["espera_media_ms"] = round(1000 * m.pop("espera_total") / n, 1) if n else 0.0
+    m["calculo_medio_ms"] = round(1000 * m.pop("calculo_total") / n, 1) if n else 0.0
+    m.update(hilos=HASH_HILOS, capacidad_cola=HASH_COLA)
+    return m
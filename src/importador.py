@@ -0,0 +1,243 @@
+# src/importador.py
+"""
+Importación masiva de órdenes de compra desde CSV o JSONL.
+
+Lee el archivo en streaming, valida cada orden con las mismas reglas que
+orden_compra.agregar_orden y las inserta por lotes: una transacción de
+escritura por lote, un bloque contiguo de números OC tomado con un solo UPDATE y
+executemany para cabeceras y líneas.
+
+Formatos:
+  - JSONL: una orden por línea
+        {"cliente": ..., "direccion": ..., "telefono": ..., "comuna": ..., "region": ...,
+         "user_id": 3, "items": [{"producto": ..., "precio": ..., "cantidad": ..., "sku": ...}]}
+  - CSV: una línea de producto por fila, con encabezado
+        ref,cliente,direccion,telefono,comuna,region,user_id,producto,precio,cantidad[,sku]
+    Filas consecutivas con el mismo `ref` forman una orden (la cabecera se toma de la primera).
+    `sku` es opcional y enlaza la línea con el catálogo de productos. La importación
+    carga historial: no descuenta stock (ver inventario.py).
+
+    python src/importador.py ordenes.csv --chunk 500 --rechazos rechazos.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from typing import Any, Dict, Iterable, Iterator, List, Optional, TextIO, Tuple
+
+try:
+    import cache
+    import db
+    import migraciones
+    import orden_compra as oc
+    import reportes
+    import secuencias as seq
+except ImportError:
+    from . import cache
+    from . import db
+    from . import migraciones
+    from . import orden_compra as oc
+    from . import reportes
+    from . import secuencias as seq
+
+CHUNK = 500
+# Máximo de parámetros por IN (...): --chunk puede ser mayor que el límite del motor
+_LOTE_IN = 500
+_CAMPOS_CABECERA = ("cliente", "direccion", "telefono", "comuna", "region")
+
+
+# ----------------- LECTURA -----------------
+def _leer_jsonl(f: TextIO) -> Iterator[Tuple[int, Any]]:
+    for n, linea in enumerate(f, start=1):
+        if not linea.strip():
+            continue
+        try:
+            yield n, json.loads(linea)
+        except ValueError as e:
+            yield n, ValueError(f"JSON inválido: {e}")
+
+
+def _leer_csv(f: TextIO) -> Iterator[Tuple[int, Any]]:
+    actual: Optional[Dict[str, Any]] = None
+    inicio = 0
+    ref = None
+    for n, fila in enumerate(csv.DictReader(f), start=2):  # fila 1 = encabezado
+        item = {"producto": fila.get("producto"), "precio": fila.get("precio"),
+                "cantidad": fila.get("cantidad"), "sku": fila.get("sku")}
+        if actual is not None and fila.get("ref") == ref:
+            actual["items"].append(item)
+            continue
+        if actual is not None:
+            yield inicio, actual
+        ref, inicio = fila.get("ref"), n
+        actual = {k: fila.get(k) for k in _CAMPOS_CABECERA + ("user_id",)}
+        actual["items"] = [item]
+    if actual is not None:
+        yield inicio, actual
+
+
+def leer(f: TextIO, formato: str) -> Iterator[Tuple[int, Any]]:
+    """Genera (línea_de_origen, orden) sin cargar el archivo completo."""
+    if formato == "jsonl":
+        return _leer_jsonl(f)
+    if formato == "csv":
+        return _leer_csv(f)
+    raise ValueError(f"Formato no soportado: {formato}")
+
+
+# ----------------- VALIDACIÓN -----------------
+def _validar(registro: Any, user_id: Optional[int]) -> Tuple[Optional[Dict[str, Any]], str]:
+    if isinstance(registro, Exception):
+        return None, str(registro)
+    if not isinstance(registro, dict):
+        return None, "La orden debe ser un objeto"
+    cab = {k: str(registro.get(k) or "").strip() for k in _CAMPOS_CABECERA}
+    faltan = [k for k, v in cab.items() if not v]
+    if faltan:
+        return None, f"Campos obligatorios vacíos: {', '.join(faltan)}"
+    # Estructura primero, así el motivo distingue un JSON mal armado de un valor no numérico
+    items = registro.get("items") or []
+    if not isinstance(items, list):
+        return None, "items debe ser una lista de objetos"
+    for n, it in enumerate(items, start=1):
+        if not isinstance(it, dict):
+            return None, f"Ítem {n}: debe ser un objeto con producto, precio y cantidad"
+        malos = [k for k in ("producto", "sku") if it.get(k) is not None and not isinstance(it[k], str)]
+        if malos:
+            return None, f"Ítem {n}: {', '.join(malos)} debe ser texto"
+    clean_items, error = oc._validar_items(items)
+    if clean_items is None:
+        return None, error
+    uid = registro.get("user_id")
+    try:
+        cab["user_id"] = int(uid) if uid not in (None, "") else user_id
+    except (TypeError, ValueError):
+        return None, "user_id inválido"
+    cab["items"] = clean_items
+    cab["neto"] = oc._sumar_items(clean_items)[1]
+    return cab, ""
+
+
+# ----------------- ESCRITURA -----------------
+def _insertar_lote(lote: List[Dict[str, Any]]) -> List[str]:
+    """Inserta un lote en una transacción. Retorna los números de OC asignados."""
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        db.iniciar_escritura(cur)
+        primero = seq.reservar_bloque(cur, oc._SEQ_OC, len(lote))
+        numeros = [seq.formatear(oc._OC_PREFIX, primero + k) for k in range(len(lote))]
+        cur.executemany("""
+            INSERT INTO ordenes_compra
+            (numero_orden, cliente, direccion, telefono, comuna, region, total, user_id)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        """, [
+            (num, o["cliente"], o["direccion"], o["telefono"], o["comuna"], o["region"], o["neto"], o["user_id"])
+            for num, o in zip(numeros, lote)
+        ])
+        ids: Dict[str, int] = {}
+        for i in range(0, len(numeros), _LOTE_IN):
+            parte = numeros[i:i + _LOTE_IN]
+            cur.execute(f"SELECT numero_orden, id FROM ordenes_compra "
+                        f"WHERE numero_orden IN ({','.join('?' * len(parte))})", parte)
+            ids.update(cur.fetchall())
+        cur.executemany("""
+            INSERT INTO orden_items (orden_id, linea, producto, precio, cantidad, sku)
+            VALUES (?, ?, ?, ?, ?, ?)
+        """, [
+            (ids[num], n, it["producto"], it["precio"], it["cantidad"], it.get("sku"))
+            for num, o in zip(numeros, lote)
+            for n, it in enumerate(o["items"], start=1)
+        ])
+        reportes.acumular_ordenes_numeros(cur, numeros)
+        conn.commit()
+    return numeros
+
+
+def importar_registros(
+    registros: Iterable[Tuple[int, Any]], chunk: int = CHUNK, user_id: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Importa (línea, orden) ya leídos. Retorna un resumen:
+    {"leidas", "importadas", "rechazadas": [{"linea", "motivo"}], "segundos", "ordenes_s"}.
+    Un lote que falla al insertar se rechaza completo (se revierte su transacción).
+    """
+    t0 = time.perf_counter()
+    leidas = importadas = 0
+    rechazadas: List[Dict[str, Any]] = []
+    lote: List[Dict[str, Any]] = []
+    lineas: List[int] = []
+
+    def vaciar():
+        nonlocal importadas
+        if not lote:
+            return
+        try:
+            _insertar_lote(lote)
+            importadas += len(lote)
+        except Exception as e:
+            rechazadas.extend({"linea": n, "motivo": f"Error al insertar lote: {e}"} for n in lineas)
+        lote.clear()
+        lineas.clear()
+
+    for linea, registro in registros:
+        leidas += 1
+        orden, error = _validar(registro, user_id)
+        if orden is None:
+            rechazadas.append({"linea": linea, "motivo": error})
+            continue
+        lote.append(orden)
+        lineas.append(linea)
+        if len(lote) >= chunk:
+            vaciar()
+    vaciar()
+
+    if importadas:
+        cache.invalidar("ordenes")
+    segundos = time.perf_counter() - t0
+    return {
+        "leidas": leidas,
+        "importadas": importadas,
+        "rechazadas": rechazadas,
+        "segundos": round(segundos, 3),
+        "ordenes_s": round(importadas / segundos, 1) if segundos > 0 else 0.0,
+    }
+
+
+def importar(ruta: str, formato: Optional[str] = None, chunk: int = CHUNK,
+             user_id: Optional[int] = None) -> Dict[str, Any]:
+    """Importa un archivo CSV/JSONL; el formato se deduce de la extensión si no se indica."""
+    formato = (formato or os.path.splitext(ruta)[1].lstrip(".")).lower()
+    with open(ruta, newline="", encoding="utf-8") as f:
+        return importar_registros(leer(f, formato), chunk=chunk, user_id=user_id)
+
+
+# ----------------- CLI -----------------
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("archivo")
+    ap.add_argument("--formato", choices=["csv", "jsonl"])
+    ap.add_argument("--chunk", type=int, default=CHUNK, help="órdenes por transacción")
+    ap.add_argument("--user-id", type=int, help="user_id para filas que no lo traen")
+    ap.add_argument("--rechazos", help="escribe las filas rechazadas en este JSONL")
+    args = ap.parse_args(argv)
+
+    migraciones.asegurar_schema()
+    r = importar(args.archivo, args.formato, args.chunk, args.user_id)
+    print(f"Leídas: {r['leidas']}  Importadas: {r['importadas']}  "
+          f"Rechazadas: {len(r['rechazadas'])}  ({r['segundos']}s, {r['ordenes_s']} órdenes/s)")
+    if args.rechazos:
+        with open(args.rechazos, "w", encoding="utf-8") as f:
+            for rej in r["rechazadas"]:
+                f.write(json.dumps(rej, ensure_ascii=False) + "\n")
+    else:
+        for rej in r["rechazadas"][:20]:
+            print(f"  línea {rej['linea']}: {rej['motivo']}")
+    return 0 if not r["rechazadas"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
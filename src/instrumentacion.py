@@ -0,0 +1,259 @@
+# src/instrumentacion.py
+"""
+Medición de cada consulta a la BD: SQL, duración, filas y función que la llamó.
+
+db.get_conn envuelve las conexiones con ConexionInstrumentada (se apaga con
+DB_INSTRUMENTAR=0). Cada sentencia se cuenta desde execute() hasta que se
+terminan de leer sus filas, porque en SQLite buena parte del trabajo ocurre
+en fetch*. Se acumula por (función, SQL):
+
+  - llamadas, tiempo total/máximo, filas y errores
+  - histograma de latencias (cubetas fijas en ms)
+
+Las que pasan DB_LENTA_MS quedan en una bitácora en memoria (últimas
+DB_LENTAS_MAX) y se escriben al logger "ferreteria.sql". Los errores también
+se anotan aunque el llamador luego los convierta en (False, msg). Los
+parámetros nunca se guardan (pueden traer hashes o datos de clientes).
+"""
+from __future__ import annotations
+
+import bisect
+import functools
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+
+ACTIVA = os.getenv("DB_INSTRUMENTAR", "1") != "0"
+LENTA_MS = float(os.getenv("DB_LENTA_MS", "100"))
+LENTAS_MAX = int(os.getenv("DB_LENTAS_MAX", "200"))
+
+# Límite superior (ms) de cada cubeta; la última es "más de 1000"
+CUBETAS_MS = (0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+log = logging.getLogger("ferreteria.sql")
+
+# Archivos que no cuentan como "quien llamó"
+_PROPIOS = {"instrumentacion.py", "db.py", "dialectos.py", "cache.py", "contextlib.py"}
+_RE_ESPACIOS = re.compile(r"\s+")
+
+
+@functools.lru_cache(maxsize=1024)
+def _normalizar(sql: str) -> str:
+    return _RE_ESPACIOS.sub(" ", sql).strip()
+
+
+# code object -> "modulo.funcion" (None si es de _PROPIOS); evita tocar rutas en cada consulta
+_etiquetas: Dict[Any, Optional[str]] = {}
+
+
+def _etiqueta(code) -> Optional[str]:
+    archivo = os.path.basename(code.co_filename)
+    etiqueta = None if archivo in _PROPIOS else f"{os.path.splitext(archivo)[0]}.{code.co_name}"
+    _etiquetas[code] = etiqueta
+    return etiqueta
+
+
+def _llamador() -> str:
+    f = sys._getframe(1)
+    while f is not None:
+        code = f.f_code
+        etiqueta = _etiquetas[code] if code in _etiquetas else _etiqueta(code)
+        if etiqueta is not None:
+            return etiqueta
+        f = f.f_back
+    return "?"
+
+
+def _cubeta(ms: float) -> int:
+    return bisect.bisect_left(CUBETAS_MS, ms)
+
+
+# ----------------- REGISTRO -----------------
+class Registro:
+    """Agregados del proceso. Un solo lock: cada anotación es unas pocas sumas."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.limpiar()
+
+    def limpiar(self):
+        with self._lock:
+            self.por_consulta: Dict[Tuple[str, str], Dict[str, Any]] = {}
+            self.histograma = [0] * (len(CUBETAS_MS) + 1)
+            self.lentas: deque = deque(maxlen=LENTAS_MAX)
+            self.desde = time.time()
+
+    def anotar(self, llamador: str, sql: str, segundos: float, filas: int, error: Optional[str] = None):
+        _hilo.bd = getattr(_hilo, "bd", 0.0) + segundos
+        ms = 1000 * segundos
+        clave = (llamador, sql)
+        with self._lock:
+            e = self.por_consulta.get(clave)
+            if e is None:
+                e = self.por_consulta[clave] = {
+                    "llamadas": 0, "total_ms": 0.0, "max_ms": 0.0, "filas": 0, "errores": 0,
+                    "histograma": [0] * (len(CUBETAS_MS) + 1)}
+            e["llamadas"] += 1
+            e["total_ms"] += ms
+            if ms > e["max_ms"]:
+                e["max_ms"] = ms
+            e["filas"] += filas
+            e["errores"] += error is not None
+            b = _cubeta(ms)
+            e["histograma"][b] += 1
+            self.histograma[b] += 1
+            lenta = ms >= LENTA_MS
+            if lenta:
+                self.lentas.append({"momento": time.time(), "ms": round(ms, 2), "filas": filas,
+                                    "llamador": llamador, "sql": sql})
+        if error is not None:
+            log.warning("SQL con error en %s (%.1f ms): %s | %s", llamador, ms, error, sql[:300])
+        elif lenta:
+            log.warning("SQL lenta en %s: %.1f ms, %d filas | %s", llamador, ms, filas, sql[:300])
+
+    def top(self, n: int = 20, por: str = "total_ms") -> List[Dict[str, Any]]:
+        with self._lock:
+            filas = [dict(e, llamador=k[0], sql=k[1], histograma=list(e["histograma"]))
+                     for k, e in self.por_consulta.items()]
+        for f in filas:
+            f["media_ms"] = f["total_ms"] / f["llamadas"] if f["llamadas"] else 0.0
+        filas.sort(key=lambda f: f[por], reverse=True)
+        return filas[:n]
+
+    def resumen(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "desde": self.desde,
+                "consultas": sum(e["llamadas"] for e in self.por_consulta.values()),
+                "total_ms": sum(e["total_ms"] for e in self.por_consulta.values()),
+                "errores": sum(e["errores"] for e in self.por_consulta.values()),
+                "distintas": len(self.por_consulta),
+                "histograma": list(self.histograma),
+                "lentas": list(self.lentas),
+            }
+
+
+registro = Registro()
+# Tiempo en BD acumulado por hilo (perfilado.py lo resta antes/después de cada sección)
+_hilo = threading.local()
+
+
+def tiempo_bd() -> float:
+    """Segundos en consultas acumulados por el hilo actual desde que partió."""
+    return getattr(_hilo, "bd", 0.0)
+
+
+def etiquetas_cubetas() -> List[str]:
+    previo = ["0"] + [f"{c:g}" for c in CUBETAS_MS]
+    return [f"{a}–{b} ms" for a, b in zip(previo, CUBETAS_MS)] + [f"> {CUBETAS_MS[-1]:g} ms"]
+
+
+# ----------------- ENVOLTORIOS -----------------
+class CursorInstrumentado:
+    """Delegación al cursor real; la sentencia en curso se cierra al leer todo o al ejecutar otra."""
+
+    def __init__(self, cur):
+        self._cur = cur
+        self._actual = None  # [llamador, sql, segundos, filas]
+
+    def __getattr__(self, nombre):
+        return getattr(self._cur, nombre)
+
+    def _cerrar(self):
+        if self._actual is not None:
+            llamador, sql, seg, filas = self._actual
+            self._actual = None
+            registro.anotar(llamador, sql, seg, filas)
+
+    def _ejecutar(self, metodo, sql, *args):
+        self._cerrar()
+        llamador = _llamador()
+        t = time.perf_counter()
+        try:
+            getattr(self._cur, metodo)(sql, *args)
+        except Exception as e:
+            registro.anotar(llamador, _normalizar(sql), time.perf_counter() - t, 0, f"{type(e).__name__}: {e}")
+            raise
+        seg = time.perf_counter() - t
+        filas = self._cur.rowcount if self._cur.rowcount and self._cur.rowcount > 0 else 0
+        self._actual = [llamador, _normalizar(sql), seg, filas]
+        if self._cur.description is None:  # no devuelve filas: ya terminó
+            self._cerrar()
+        return self
+
+    def execute(self, sql, *args):
+        return self._ejecutar("execute", sql, *args)
+
+    def executemany(self, sql, *args):
+        return self._ejecutar("executemany", sql, *args)
+
+    def _leer(self, metodo, *args):
+        t = time.perf_counter()
+        res = getattr(self._cur, metodo)(*args)
+        if self._actual is not None:
+            self._actual[2] += time.perf_counter() - t
+            if metodo == "fetchone":
+                if res is None:
+                    self._cerrar()
+                else:
+                    self._actual[3] += 1
+            else:
+                self._actual[3] += len(res)
+                pedidas = args[0] if args else getattr(self._cur, "arraysize", 1)
+                if metodo == "fetchall" or len(res) < pedidas:
+                    self._cerrar()
+        return res
+
+    def fetchone(self):
+        return self._leer("fetchone")
+
+    def fetchmany(self, *args):
+        return self._leer("fetchmany", *args)
+
+    def fetchall(self):
+        return self._leer("fetchall")
+
+    def __iter__(self):
+        while True:
+            fila = self.fetchone()
+            if fila is None:
+                return
+            yield fila
+
+    def close(self):
+        self._cerrar()
+        self._cur.close()
+
+    def __del__(self):
+        try:
+            self._cerrar()
+        except Exception:
+            pass
+
+
+class ConexionInstrumentada:
+    """Conexión DB-API cuyos cursores (y conn.execute) pasan por CursorInstrumentado."""
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, nombre):
+        return getattr(self._conn, nombre)
+
+    def cursor(self, *args, **kwargs):
+        return CursorInstrumentado(self._conn.cursor(*args, **kwargs))
+
+    def execute(self, sql, *args):
+        return self.cursor().execute(sql, *args)
+
+    def executemany(self, sql, *args):
+        return self.cursor().executemany(sql, *args)
+
+
+def envolver(conn):
+    return ConexionInstrumentada(conn) if ACTIVA else conn
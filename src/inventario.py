@@ -0,0 +1,137 @@
+# src/inventario.py
+"""
+Inventario: stock actual por producto y libro de movimientos.
+
+`productos.stock` es el saldo vigente (una fila por SKU) y `movimientos_stock`
+registra cada cambio. El descuento de una orden corre dentro de la transacción
+que inserta la OC con un UPDATE condicionado por SKU:
+
+    UPDATE productos SET stock = stock - ? WHERE sku = ? AND stock >= ?
+
+si no afecta filas no hay stock suficiente y toda la orden se revierte. No hay
+una fila "global" que todos actualicen: dos órdenes solo compiten si venden el
+mismo SKU, y los SKU se bloquean siempre en el mismo orden (alfabético).
+"""
+from __future__ import annotations
+
+import sqlite3
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+try:
+    import cache
+    import db
+except ImportError:
+    from . import cache
+    from . import db
+
+
+class StockInsuficiente(Exception):
+    def __init__(self, sku: str, pedido: int, disponible: Optional[int]):
+        self.sku, self.pedido, self.disponible = sku, pedido, disponible
+        if disponible is None:
+            msg = f"El SKU {sku} no existe en el catálogo."
+        else:
+            msg = f"Stock insuficiente para {sku}: se piden {pedido}, hay {disponible}."
+        super().__init__(msg)
+
+
+def _por_sku(items: Iterable[Dict[str, Any]]) -> "OrderedDict[str, int]":
+    # Suma líneas repetidas del mismo SKU y fija un orden de bloqueo estable
+    total: Dict[str, int] = {}
+    for it in items:
+        if it.get("sku"):
+            total[it["sku"]] = total.get(it["sku"], 0) + int(it["cantidad"])
+    return OrderedDict(sorted(total.items()))
+
+
+# ----------------- ESCRITURA (dentro de la transacción del llamador) -----------------
+def descontar(cur: sqlite3.Cursor, items: List[Dict[str, Any]], orden_id: int):
+    """
+    Descuenta el stock de las líneas con SKU y las anota en el libro.
+    Lanza StockInsuficiente sin escribir el resto; el llamador revierte la transacción.
+    """
+    pedidos = _por_sku(items)
+    for sku, cantidad in pedidos.items():
+        cur.execute("UPDATE productos SET stock = stock - ? WHERE sku = ? AND stock >= ?",
+                    (cantidad, sku, cantidad))
+        if cur.rowcount == 0:
+            cur.execute("SELECT stock FROM productos WHERE sku = ?", (sku,))
+            row = cur.fetchone()
+            raise StockInsuficiente(sku, cantidad, row[0] if row else None)
+    cur.executemany(
+        "INSERT INTO movimientos_stock (sku, cantidad, motivo, orden_id) VALUES (?, ?, 'venta', ?)",
+        [(sku, -cantidad, orden_id) for sku, cantidad in pedidos.items()],
+    )
+
+
+def registrar_ajuste(cur: sqlite3.Cursor, sku: str, delta: int, motivo: str) -> bool:
+    """
+    Suma `delta` al stock de `sku` y lo anota en el libro, en la transacción de `cur`.
+    False sin escribir nada si el SKU no existe o el stock quedaría negativo.
+    """
+    cur.execute("UPDATE productos SET stock = stock + ? WHERE sku = ? AND stock + ? >= 0",
+                (delta, sku, delta))
+    if cur.rowcount == 0:
+        return False
+    cur.execute("INSERT INTO movimientos_stock (sku, cantidad, motivo) VALUES (?, ?, ?)",
+                (sku, delta, motivo))
+    return True
+
+
+def ajustar(sku: str, delta: int, motivo: str = "ajuste") -> Tuple[bool, str]:
+    """Suma (reposición) o resta (merma) stock de un SKU; nunca lo deja negativo."""
+    sku = (sku or "").strip().upper()
+    try:
+        delta = int(delta)
+    except (TypeError, ValueError):
+        return False, "La cantidad debe ser un número entero."
+    if not sku or delta == 0:
+        return False, "Indica SKU y una cantidad distinta de 0."
+    try:
+        with db.conexion() as conn:
+            cur = conn.cursor()
+            db.iniciar_escritura(cur)
+            if not registrar_ajuste(cur, sku, delta, motivo.strip() or "ajuste"):
+                cur.execute("SELECT stock FROM productos WHERE sku = ?", (sku,))
+                row = cur.fetchone()
+                conn.rollback()
+                if not row:
+                    return False, f"El SKU {sku} no existe en el catálogo."
+                return False, f"El ajuste dejaría stock negativo (hay {row[0]})."
+            cur.execute("SELECT stock FROM productos WHERE sku = ?", (sku,))
+            nuevo = cur.fetchone()[0]
+            conn.commit()
+        cache.invalidar("stock")
+        return True, f"Stock de {sku}: {nuevo}."
+    except Exception as e:
+        return False, f"Error al ajustar stock: {e}"
+
+
+# ----------------- LECTURA -----------------
+@cache.cacheado("stock")
+def stock_de(skus: Tuple[str, ...]) -> Dict[str, int]:
+    """Stock vigente de varios SKU (tupla, para que sea cacheable)."""
+    if not skus:
+        return {}
+    marcas = ",".join("?" * len(skus))
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(f"SELECT sku, stock FROM productos WHERE sku IN ({marcas})", skus)
+        return dict(cur.fetchall())
+
+
+@cache.cacheado("stock")
+def movimientos(sku: str, limit: int = 50) -> List[Dict[str, Any]]:
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT m.creado_en, m.cantidad, m.motivo, o.numero_orden
+            FROM movimientos_stock m
+            LEFT JOIN ordenes_compra o ON o.id = m.orden_id
+            WHERE m.sku = ?
+            ORDER BY m.id DESC
+            {db.dialecto().limite()}
+        """, ((sku or "").strip().upper(), int(limit)))
+        rows = cur.fetchall()
+    return [{"creado_en": r[0], "cantidad": r[1], "motivo": r[2], "numero_orden": r[3]} for r in rows]
@@ -1,133 +1,179 @@
 import os
-import sqlite3
-import hashlib
-import secrets
+import threading
+import time
+from collections import OrderedDict, deque
 from typing import Optional, Tuple, Dict, Any, List
 
-DB_PATH = os.path.abspath(os.path.join(
-    os.path.dirname(__file__), "..", "database", "proyecto.db"))
+try:
+    import cache
+    import db
+    import hashing
+    import migraciones
+    import sesiones
+except ImportError:
+    from . import cache
+    from . import db
+    from . import hashing
+    from . import migraciones
+    from . import sesiones
 
-def get_conn():
-    os.makedirs(os.path.dirname(DB_PATH), exist_ok=True)
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
+# Intentos fallidos permitidos dentro de la ventana (segundos), por usuario y por IP.
+# Por IP es más alto: varias cajas de la misma sucursal salen con la misma dirección.
+LOGIN_MAX_INTENTOS = int(os.getenv("LOGIN_MAX_INTENTOS", "5"))
+LOGIN_MAX_INTENTOS_IP = int(os.getenv("LOGIN_MAX_INTENTOS_IP", "20"))
+LOGIN_VENTANA = float(os.getenv("LOGIN_VENTANA", "300"))
 
-def _hash_password(password: str, salt: str) -> str:
-    return hashlib.sha256((salt + password).encode("utf-8")).hexdigest()
+def _hash_password(password: str) -> Tuple[str, str]:
+    # (password_hash, salt): el salt va embebido en el hash y se repite en su columna.
+    # El KDF corre en el pool de hashing, no en el hilo de la sesión.
+    pwd_hash = hashing.ejecutar(hashing.hash_password, password)
+    return pwd_hash, hashing.salt_de(pwd_hash)
 
-def _ensure_schema():
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS usuarios (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            username TEXT UNIQUE NOT NULL,
-            password_hash TEXT NOT NULL,
-            salt TEXT NOT NULL,
-            nombre TEXT,
-            role TEXT NOT NULL DEFAULT 'user'
-        );
-        """)
-        cols = [r[1] for r in cur.execute("PRAGMA table_info(usuarios);").fetchall()]
-        if "role" not in cols:
-            cur.execute("ALTER TABLE usuarios ADD COLUMN role TEXT NOT NULL DEFAULT 'user';")
-
-        cur.execute("""
-        CREATE TABLE IF NOT EXISTS ordenes_compra (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            numero_orden TEXT UNIQUE NOT NULL,
-            cliente TEXT NOT NULL,
-            direccion TEXT NOT NULL,
-            telefono TEXT NOT NULL,
-            comuna TEXT NOT NULL,
-            region TEXT NOT NULL,
-            items_json TEXT NOT NULL,
-            total REAL NOT NULL,
-            creado_en DATETIME DEFAULT CURRENT_TIMESTAMP
-        );
-        """)
-        cols_oc = [r[1] for r in cur.execute("PRAGMA table_info(ordenes_compra);").fetchall()]
-        if "user_id" not in cols_oc:
-            cur.execute("ALTER TABLE ordenes_compra ADD COLUMN user_id INTEGER;")
-
-        conn.commit()
+# ----------------- LIMITADOR DE INTENTOS -----------------
+class LimitadorIntentos:
+    """
+    Ventana deslizante de fallos por clave, en memoria del proceso.
+    Guarda a lo más `max_claves` claves (descarta las menos recientes).
+    """
+
+    def __init__(self, max_intentos: int, ventana: float, max_claves: int = 10000):
+        self.max_intentos, self.ventana, self.max_claves = max_intentos, ventana, max_claves
+        self._fallos: "OrderedDict[str, deque]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _vigentes(self, clave: str, ahora: float) -> Optional[deque]:
+        fallos = self._fallos.get(clave)
+        if fallos is None:
+            return None
+        while fallos and ahora - fallos[0] >= self.ventana:
+            fallos.popleft()
+        if not fallos:
+            del self._fallos[clave]
+            return None
+        return fallos
+
+    def espera(self, clave: Optional[str]) -> float:
+        """Segundos que faltan para poder reintentar (0 si no hay bloqueo)."""
+        if not clave:
+            return 0.0
+        ahora = time.monotonic()
+        with self._lock:
+            fallos = self._vigentes(clave, ahora)
+            if fallos is None or len(fallos) < self.max_intentos:
+                return 0.0
+            # deque con maxlen: fallos[0] es el más antiguo de los últimos max_intentos
+            return self.ventana - (ahora - fallos[0])
+
+    def fallo(self, clave: Optional[str]):
+        if not clave:
+            return
+        ahora = time.monotonic()
+        with self._lock:
+            fallos = self._vigentes(clave, ahora) or deque(maxlen=self.max_intentos)
+            fallos.append(ahora)
+            self._fallos[clave] = fallos
+            self._fallos.move_to_end(clave)
+            while len(self._fallos) > self.max_claves:
+                self._fallos.popitem(last=False)
+
+    def limpiar(self, clave: Optional[str]):
+        with self._lock:
+            self._fallos.pop(clave, None)
+
+    def perdonar(self, clave: Optional[str], n: int):
+        """Descarta hasta `n` de los fallos más recientes de `clave`."""
+        if not clave:
+            return
+        with self._lock:
+            fallos = self._vigentes(clave, time.monotonic())
+            if fallos is None:
+                return
+            for _ in range(min(n, len(fallos))):
+                fallos.pop()
+            if not fallos:
+                del self._fallos[clave]
+
+_intentos_usuario = LimitadorIntentos(LOGIN_MAX_INTENTOS, LOGIN_VENTANA)
+_intentos_ip = LimitadorIntentos(LOGIN_MAX_INTENTOS_IP, LOGIN_VENTANA)
+
+def _clave_usuario(username: str) -> str:
+    return (username or "").strip().lower()
+
+def espera_login(username: str, ip: Optional[str] = None) -> int:
+    """Segundos de bloqueo restantes para este usuario/IP (0 = puede intentar)."""
+    resto = max(_intentos_usuario.espera(_clave_usuario(username)), _intentos_ip.espera(ip))
+    return int(resto + 0.999)
 
+def _registrar_fallo(username: str, ip: Optional[str]):
+    _intentos_usuario.fallo(_clave_usuario(username))
+    _intentos_ip.fallo(ip)
+
+def _ensure_admin():
+    with db.conexion() as conn:
+        cur = conn.cursor()
         cur.execute("SELECT COUNT(1) FROM usuarios WHERE username=?", ("admin",))
         if cur.fetchone()[0] == 0:
-            salt = secrets.token_hex(16)
-            pwd_hash = _hash_password("admin123", salt)
+            pwd_hash, salt = _hash_password("admin123")
             cur.execute(
                 "INSERT INTO usuarios (username, password_hash, salt, nombre, role) VALUES (?, ?, ?, ?, ?)",
                 ("admin", pwd_hash, salt, "Administrador", "admin"),
             )
             conn.commit()
-    finally:
-        cur.close()
-        conn.close()
+
+_admin_ok = False
 
 def create_tables():
-    _ensure_schema()
+    # Una sola vez por proceso: Streamlit re-ejecuta app.py en cada interacción
+    global _admin_ok
+    migraciones.asegurar_schema()
+    if not _admin_ok:
+        _ensure_admin()
+        _admin_ok = True
 
 def get_user_by_username(username: str) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
+    with db.conexion() as conn:
+        cur = conn.cursor()
         cur.execute("SELECT id, username, password_hash, salt, nombre, role FROM usuarios WHERE username=?", (username,))
         row = cur.fetchone()
-        if not row:
-            return None
-        return {"id": row[0], "username": row[1], "password_hash": row[2], "salt": row[3], "nombre": row[4], "role": row[5]}
-    finally:
-        cur.close()
-        conn.close()
+    if not row:
+        return None
+    return {"id": row[0], "username": row[1], "password_hash": row[2], "salt": row[3], "nombre": row[4], "role": row[5]}
 
+@cache.cacheado("usuarios")
 def get_user_by_id(user_id: int) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
+    with db.conexion() as conn:
+        cur = conn.cursor()
         cur.execute("SELECT id, username, password_hash, salt, nombre, role FROM usuarios WHERE id=?", (user_id,))
         row = cur.fetchone()
-        if not row:
-            return None
-        return {"id": row[0], "username": row[1], "password_hash": row[2], "salt": row[3], "nombre": row[4], "role": row[5]}
-    finally:
-        cur.close()
-        conn.close()
+    if not row:
+        return None
+    return {"id": row[0], "username": row[1], "password_hash": row[2], "salt": row[3], "nombre": row[4], "role": row[5]}
 
+@cache.cacheado("usuarios")
 def list_users() -> List[Dict[str, Any]]:
-    conn = get_conn()
-    cur = conn.cursor()
-    try:
+    with db.conexion() as conn:
+        cur = conn.cursor()
         cur.execute("SELECT id, username, nombre, role FROM usuarios ORDER BY id ASC")
         return [{"id": r[0], "username": r[1], "nombre": r[2], "role": r[3]} for r in cur.fetchall()]
-    finally:
-        cur.close()
-        conn.close()
 
 def _create_user(username: str, password: str, nombre: Optional[str], role: str) -> Tuple[bool, str]:
     try:
-        conn = get_conn()
-        cur = conn.cursor()
-        salt = secrets.token_hex(16)
-        pwd_hash = _hash_password(password, salt)
-        cur.execute(
-            "INSERT INTO usuarios (username, password_hash, salt, nombre, role) VALUES (?, ?, ?, ?, ?)",
-            (username, pwd_hash, salt, nombre, role),
-        )
-        conn.commit()
+        pwd_hash, salt = _hash_password(password)
+        with db.conexion() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "INSERT INTO usuarios (username, password_hash, salt, nombre, role) VALUES (?, ?, ?, ?, ?)",
+                (username, pwd_hash, salt, nombre, role),
+            )
+            conn.commit()
+        cache.invalidar("usuarios")
         return True, "Usuario creado"
-    except sqlite3.IntegrityError:
+    except hashing.HashOcupado as e:
+        return False, str(e)
+    except db.ErrorIntegridad:
         return False, "El usuario ya existe"
     except Exception as e:
         return False, f"Error al crear usuario: {e}"
-    finally:
-        try:
-            cur.close()
-            conn.close()
-        except:
-            pass
 
 def create_user_admin(username: str, password: str, nombre: Optional[str], role: str = "user") -> Tuple[bool, str]:
     return _create_user(username, password, nombre, role)
@@ -135,61 +181,95 @@ def create_user_admin(username: str, password: str, nombre: Optional[str], role:
 def register_user(username: str, password: str, nombre: Optional[str]) -> Tuple[bool, str]:
     return _create_user(username, password, nombre, role="user")
 
-def verify_login(username: str, password: str) -> Optional[Dict[str, Any]]:
+def _rehash(user: Dict[str, Any], password: str):
+    # Hash legado o con otro costo: se reemplaza ahora que se conoce la contraseña.
+    # Si otro login ya lo cambió, el WHERE no calza y no pasa nada.
+    # El login ya se concedió: ni el pool lleno ni un error de la BD lo deben impedir
+    try:
+        pwd_hash, salt = _hash_password(password)
+        with db.conexion() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "UPDATE usuarios SET password_hash=?, salt=? WHERE id=? AND password_hash=?",
+                (pwd_hash, salt, user["id"], user["password_hash"]),
+            )
+            conn.commit()
+        cache.invalidar("usuarios")
+    except (db.ErrorBD, hashing.HashOcupado):
+        pass  # se reintenta en el próximo login
+
+def verify_login(username: str, password: str, ip: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Usuario {id, username, nombre, role} o None si las credenciales no calzan
+    o el usuario/IP está bloqueado (ver espera_login).
+    Lanza hashing.HashOcupado si el pool de hashing está saturado.
+    """
+    if espera_login(username, ip) > 0:
+        return None
     user = get_user_by_username(username)
     if not user:
+        hashing.ejecutar(hashing.verificar_ficticio, password)
+        _registrar_fallo(username, ip)
         return None
-    stored_hash, salt = user["password_hash"], user["salt"]
-    if stored_hash == _hash_password(password, salt):
-        return {k: user[k] for k in ("id", "username", "nombre", "role")}
-    return None
+    if not hashing.ejecutar(hashing.verificar, password, user["password_hash"], user["salt"]):
+        _registrar_fallo(username, ip)
+        return None
+    _intentos_usuario.limpiar(_clave_usuario(username))
+    # La IP no se limpia entera (una cuenta válida borraría el rastro de probar
+    # otras), pero un login correcto descuenta lo que un usuario puede fallar:
+    # así los errores de tipeo de las cajas de una sucursal no la bloquean.
+    _intentos_ip.perdonar(ip, LOGIN_MAX_INTENTOS)
+    if hashing.necesita_rehash(user["password_hash"]):
+        _rehash(user, password)
+    return {k: user[k] for k in ("id", "username", "nombre", "role")}
+
+def reanudar_sesion(token: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Usuario de una sesión abierta (token de sesiones.crear) sin verificar contraseña."""
+    user_id = sesiones.validar(token)
+    user = get_user_by_id(user_id) if user_id is not None else None
+    if not user:
+        return None
+    return {k: user[k] for k in ("id", "username", "nombre", "role")}
 
 def update_user(user_id: int, username: str, nombre: Optional[str], role: str) -> Tuple[bool, str]:
     try:
-        conn = get_conn()
-        cur = conn.cursor()
-        cur.execute(
-            "UPDATE usuarios SET username=?, nombre=?, role=? WHERE id=?",
-            (username, nombre, role, user_id),
-        )
-        if cur.rowcount == 0:
-            conn.rollback()
-            return False, "Usuario no encontrado"
-        conn.commit()
+        with db.conexion() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "UPDATE usuarios SET username=?, nombre=?, role=? WHERE id=?",
+                (username, nombre, role, user_id),
+            )
+            if cur.rowcount == 0:
+                conn.rollback()
+                return False, "Usuario no encontrado"
+            conn.commit()
+        cache.invalidar("usuarios")
         return True, "Usuario actualizado"
-    except sqlite3.IntegrityError:
+    except db.ErrorIntegridad:
         return False, "El nombre de usuario ya está en uso"
     except Exception as e:
         return False, f"Error al actualizar: {e}"
-    finally:
-        try:
-            cur.close()
-            conn.close()
-        except:
-            pass
 
 def reset_password(user_id: int, new_password: str) -> Tuple[bool, str]:
     if not new_password:
         return False, "La nueva contraseña no puede estar vacía"
     try:
-        conn = get_conn()
-        cur = conn.cursor()
-        salt = secrets.token_hex(16)
-        pwd_hash = _hash_password(new_password, salt)
-        cur.execute(
-            "UPDATE usuarios SET password_hash=?, salt=? WHERE id=?",
-            (pwd_hash, salt, user_id),
-        )
-        if cur.rowcount == 0:
-            conn.rollback()
-            return False, "Usuario no encontrado"
-        conn.commit()
+        pwd_hash, salt = _hash_password(new_password)
+        with db.conexion() as conn:
+            cur = conn.cursor()
+            cur.execute(
+                "UPDATE usuarios SET password_hash=?, salt=? WHERE id=?",
+                (pwd_hash, salt, user_id),
+            )
+            if cur.rowcount == 0:
+                conn.rollback()
+                return False, "Usuario no encontrado"
+            # con la clave cambiada, las sesiones abiertas dejan de valer
+            sesiones.cerrar_de_usuario(cur, user_id)
+            conn.commit()
+        cache.invalidar("usuarios")
         return True, "Contraseña actualizada"
+    except hashing.HashOcupado as e:
+        return False, str(e)
     except Exception as e:
         return False, f"Error al actualizar contraseña: {e}"
-    finally:
-        try:
-            cur.close()
-            conn.close()
-        except:
-            pass
@@ -1,13 +1,25 @@
 from __future__ import annotations
 import re
+import secrets
+import time
 from typing import List, Dict, Any
 import streamlit as st
 
 # Import robusto: primero absoluto; si falla, relativo
 try:
-    import orden_compra as oc  # si ejecutas: streamlit run src/app.py
+    import boleta_html
+    import catalogo  # si ejecutas: streamlit run src/app.py
+    import exportacion
+    import inventario
+    import orden_compra as oc
+    import perfilado
 except ImportError:
-    from . import orden_compra as oc  # si estás en paquete
+    from . import boleta_html
+    from . import catalogo  # si estás en paquete
+    from . import exportacion
+    from . import inventario
+    from . import orden_compra as oc
+    from . import perfilado
 
 # Estado inicial
 if "vista_actual" not in st.session_state:
@@ -36,12 +48,79 @@ def boton_volver():
         st.rerun()
 
 
+# ---------- Paginación por cursor (creado_en, id) ----------
+PAGE_SIZE = 50
+
+
+def pagina_ordenes(clave: str, user_id: int | None = None, page_size: int = PAGE_SIZE):
+    """
+    Página actual de OCs para la vista `clave`. En sesión se guarda la pila de
+    cursores visitados, así "Anterior" no necesita OFFSET ni recalcular nada.
+    Retorna (ordenes, cursor_siguiente).
+    """
+    pila = st.session_state.setdefault(f"{clave}_cursores", [None])
+    return oc.listar_ordenes_pagina(page_size, user_id=user_id, after=pila[-1])
+
+
+def controles_pagina(clave: str, siguiente):
+    pila = st.session_state.setdefault(f"{clave}_cursores", [None])
+    c1, c2, c3 = st.columns([1, 2, 1])
+    with c1:
+        if st.button("◀ Anterior", key=f"{clave}_prev", disabled=len(pila) <= 1, width="stretch"):
+            pila.pop()
+            st.rerun()
+    with c2:
+        st.caption(f"Página {len(pila)}")
+    with c3:
+        if st.button("Siguiente ▶", key=f"{clave}_next", disabled=siguiente is None, width="stretch"):
+            pila.append(siguiente)
+            st.rerun()
+
+
+@perfilado.medir()
 def home():
     st.header("🏠 Inicio — Ferretería-D")
     st.write("Bienvenido al sistema de gestión de **Órdenes de Compra**.")
     st.info("Usa el menú lateral para navegar por las secciones.")
 
 
+@perfilado.medir()
+def _selector_catalogo():
+    """Búsqueda en el catálogo (fuera del form, para reaccionar al escribir); agrega la fila con su precio."""
+    c1, c2, c3 = st.columns((2, 3, 1), vertical_alignment="bottom")
+    with c1:
+        q = st.text_input("Buscar en catálogo", key="cat_q", placeholder="Nombre o SKU").strip()
+    if not q:
+        return
+    resultados = catalogo.buscar(q, 10)
+    if not resultados:
+        with c2:
+            st.caption("Sin coincidencias en el catálogo.")
+        return
+    stock = inventario.stock_de(tuple(p["sku"] for p in resultados))
+    opciones = {
+        f"{p['nombre']} — {_formatea_miles(p['precio'])} ({p['sku']}, stock {stock.get(p['sku'], 0)})": p
+        for p in resultados
+    }
+    with c2:
+        etiqueta = st.selectbox("Producto", list(opciones), key="cat_sel")
+    with c3:
+        agregar = st.button("➕ Agregar", key="cat_add", width="stretch")
+    if agregar:
+        p = opciones[etiqueta]
+        filas = st.session_state["items_dyn"]
+        if len(filas) == 1 and not filas[0].get("producto"):
+            filas.clear()  # reemplaza la fila vacía inicial
+        i = len(filas)
+        filas.append({"producto": p["nombre"], "precio": p["precio"], "cantidad": 1, "sku": p["sku"]})
+        # sin estado previo, los widgets de la fila toman los valores del catálogo
+        for k in (f"prod_{i}", f"precio_{i}", f"cant_{i}", f"del_{i}"):
+            st.session_state.pop(k, None)
+        st.session_state.pop("cat_q", None)
+        st.rerun()
+
+
+@perfilado.medir()
 def registrar_orden():
     st.header("🧾 Registrar Orden de Compra")
 
@@ -49,16 +128,25 @@ def registrar_orden():
     if "items_dyn" not in st.session_state:
         st.session_state["items_dyn"] = [
             {"producto": "", "precio": 0.0, "cantidad": 1}]
-    if "numero_orden_ui" not in st.session_state:
+    # Número reservado para esta sesión: solo se pide a la BD cuando falta o está por vencer
+    if "sesion_oc" not in st.session_state:
+        st.session_state["sesion_oc"] = secrets.token_hex(16)
+    if ("numero_orden_ui" not in st.session_state
+            or st.session_state.get("numero_orden_expira", 0) - time.time() < 60):
         try:
-            st.session_state["numero_orden_ui"] = oc.generar_numero_orden()
+            nro, expira = oc.reservar_numero_orden(st.session_state["sesion_oc"])
+            st.session_state["numero_orden_ui"] = nro
+            st.session_state["numero_orden_expira"] = expira
         except Exception as e:
-            st.error(f"No fue posible generar número de orden: {e}")
+            st.error(f"No fue posible reservar número de orden: {e}")
             boton_volver()
             return
 
-    st.text_input("Número de orden",
-                  value=st.session_state["numero_orden_ui"], disabled=True, key="numero_orden_ro")
+    # el widget conserva su propio estado por key; se sincroniza con el número reservado
+    st.session_state["numero_orden_ro"] = st.session_state["numero_orden_ui"]
+    st.text_input("Número de orden", disabled=True, key="numero_orden_ro")
+
+    _selector_catalogo()
 
     with st.form("form_orden", clear_on_submit=False):
         st.subheader("Datos del Cliente")
@@ -100,11 +188,13 @@ def registrar_orden():
                 borrar = st.checkbox(
                     "🗑️", key=f"del_{i}", help="Eliminar este ítem")
 
+            # el SKU del catálogo se conserva mientras no se cambie el nombre
+            sku = it.get("sku") if prod == it.get("producto") else None
             st.session_state["items_dyn"][i] = {
-                "producto": prod, "precio": float(precio), "cantidad": int(cant)}
+                "producto": prod, "precio": float(precio), "cantidad": int(cant), "sku": sku}
             if prod:
                 items.append({"producto": prod, "precio": float(
-                    precio), "cantidad": int(cant)})
+                    precio), "cantidad": int(cant), "sku": sku})
                 total_items += int(cant)
                 total_monto += float(precio) * int(cant)
             if borrar:
@@ -147,60 +237,49 @@ def registrar_orden():
                 st.error("Todas las **Cantidades** deben ser > 0.")
             else:
                 try:
-                    # Guardar OC usando el número mostrado en UI
-                    ok, msg, nro = oc.agregar_orden(
+                    # Guardar OC + boleta en una sola transacción, consumiendo el número reservado
+                    ok, msg, boleta = oc.emitir_orden_con_boleta(
                         cliente=cliente, direccion=direccion, telefono=telefono,
                         comuna=comuna, region=region, items=items,
                         user_id=st.session_state.get("user_id"),
-                        numero_orden_preasignado=st.session_state["numero_orden_ui"]
+                        numero_orden_preasignado=st.session_state["numero_orden_ui"],
+                        sesion=st.session_state["sesion_oc"]
                     )
                     if ok:
                         st.success(msg)
 
-                        # ⬇️⬇️⬇️ AQUÍ VA EL BLOQUE DE LA BOLETA (con IVA y detalle) ⬇️⬇️⬇️
-                        bok, bmsg, bnum = oc.crear_boleta_para_orden(
-                            st.session_state["numero_orden_ui"])
-                        if bok:
-                            st.success(
-                                f"{bmsg} (OC: {st.session_state['numero_orden_ui']})")
-
-                            # Mostrar detalle de boleta con IVA
-                            boleta = oc.obtener_boleta_por_numero(bnum)
-                            if boleta:
-                                st.markdown("### 🧾 Detalle de Boleta")
-                                st.write(
-                                    f"**Boleta:** {boleta['numero_boleta']} — **Orden:** {boleta['numero_orden']}")
-                                st.write(f"**Cliente:** {boleta['cliente']}")
-                                st.write(
-                                    f"**Dirección:** {boleta['direccion']}, {boleta['comuna']}, {boleta['region']}")
-                                st.write(f"**Teléfono:** {boleta['telefono']}")
-
-                                # Detalle de productos
-                                lines = []
-                                for it in boleta["items"]:
-                                    lines.append(
-                                        f"- {it['producto']} — {int(it['cantidad'])} x ${int(it['precio']):,}".replace(",", "."))
-                                st.markdown("\n".join(lines))
-
-                                # Desglose de totales
-                                st.markdown("---")
-                                st.write(
-                                    f"**Total ítems:** {boleta['total_items']}")
-                                st.write(
-                                    f"**Neto:** ${int(round(boleta['neto'])):,}".replace(",", "."))
-                                st.write(
-                                    f"**IVA (19%):** ${int(round(boleta['iva'])):,}".replace(",", "."))
-                                st.write(
-                                    f"**Total a pagar:** ${int(round(boleta['total'])):,}".replace(",", "."))
-                        else:
-                            st.warning(f"No se pudo emitir boleta: {bmsg}")
-                        # ⬆️⬆️⬆️ FIN DEL BLOQUE DE BOLETA ⬆️⬆️⬆️
+                        # Mostrar detalle de boleta con IVA
+                        st.markdown("### 🧾 Detalle de Boleta")
+                        st.write(
+                            f"**Boleta:** {boleta['numero_boleta']} — **Orden:** {boleta['numero_orden']}")
+                        st.write(f"**Cliente:** {boleta['cliente']}")
+                        st.write(
+                            f"**Dirección:** {boleta['direccion']}, {boleta['comuna']}, {boleta['region']}")
+                        st.write(f"**Teléfono:** {boleta['telefono']}")
+
+                        # Detalle de productos
+                        lines = []
+                        for it in boleta["items"]:
+                            lines.append(
+                                f"- {it['producto']} — {int(it['cantidad'])} x ${int(it['precio']):,}".replace(",", "."))
+                        st.markdown("\n".join(lines))
+
+                        # Desglose de totales
+                        st.markdown("---")
+                        st.write(
+                            f"**Total ítems:** {boleta['total_items']}")
+                        st.write(
+                            f"**Neto:** ${int(round(boleta['neto'])):,}".replace(",", "."))
+                        st.write(
+                            f"**IVA (19%):** ${int(round(boleta['iva'])):,}".replace(",", "."))
+                        st.write(
+                            f"**Total a pagar:** ${int(round(boleta['total'])):,}".replace(",", "."))
 
                         # reset para nueva OC
                         st.session_state["items_dyn"] = [
                             {"producto": "", "precio": 0.0, "cantidad": 1}]
-                        st.session_state["numero_orden_ui"] = oc.generar_numero_orden(
-                        )
+                        # la próxima renderización reserva un número nuevo
+                        st.session_state.pop("numero_orden_ui", None)
                     else:
                         st.error(msg)
                 except Exception as e:
@@ -209,6 +288,7 @@ def registrar_orden():
     boton_volver()
 
 
+@perfilado.medir()
 def listar_ordenes(user_id: int | None = None):
     import pandas as pd
 
@@ -222,46 +302,66 @@ def listar_ordenes(user_id: int | None = None):
     titulo = "📚 Órdenes de Compra" if user_id is None else "🧾 Órdenes del usuario"
     st.header(titulo)
 
+    clave = "ordenes" if user_id is None else f"ordenes_u{user_id}"
+    busqueda = st.text_input(
+        "🔎 Buscar", key=f"{clave}_buscar",
+        placeholder="N° de orden o boleta, cliente, dirección, comuna o producto").strip()
     try:
-        data = oc.listar_ordenes(limit=200, user_id=user_id)
+        with perfilado.seccion("consulta"):
+            if busqueda:
+                data, siguiente = oc.buscar_ordenes(busqueda, limit=PAGE_SIZE, user_id=user_id), None
+            else:
+                data, siguiente = pagina_ordenes(clave, user_id=user_id)
     except Exception as e:
         st.error(f"No fue posible obtener órdenes: {e}")
         boton_volver()
         return
 
     if not data:
-        st.info(
-            "No hay órdenes registradas." if user_id is None else "Este usuario no tiene órdenes.")
+        if busqueda:
+            st.info("Ninguna orden coincide con la búsqueda.")
+        else:
+            st.info(
+                "No hay órdenes registradas." if user_id is None else "Este usuario no tiene órdenes.")
         boton_volver()
         return
 
     # ---------- Tabla de órdenes ----------
-    rows: list[dict[str, Any]] = []
-    for d in data:
-        items_txt = "; ".join(
-            f"{it.get('producto', '?')} x{int(it.get('cantidad', 0))} ({_fm(it.get('precio', 0))})"
-            for it in d.get("items", [])
-        )
-        rows.append(
-            {
-                "N° Orden": d.get("numero_orden"),
-                "Cliente": d.get("cliente"),
-                "Comuna": d.get("comuna"),
-                "Región": d.get("region"),
-                "Ítems": items_txt,
-                "Total (neto)": _fm(d.get("total", 0)),
-                "Creado en": d.get("creado_en"),
-            }
-        )
-
-    df = pd.DataFrame(rows, columns=[
-                      "N° Orden", "Cliente", "Comuna", "Región", "Ítems", "Total (neto)", "Creado en"])
-    st.dataframe(df, use_container_width=True, hide_index=True)
-
-    # Descargar CSV
-    csv = df.to_csv(index=False).encode("utf-8")
-    st.download_button("⬇️ Descargar CSV", data=csv,
+    with perfilado.seccion("dataframe"):
+        rows: list[dict[str, Any]] = []
+        for d in data:
+            items_txt = "; ".join(
+                f"{it.get('producto', '?')} x{int(it.get('cantidad', 0))} ({_fm(it.get('precio', 0))})"
+                for it in d.get("items", [])
+            )
+            rows.append(
+                {
+                    "N° Orden": d.get("numero_orden"),
+                    "Cliente": d.get("cliente"),
+                    "Comuna": d.get("comuna"),
+                    "Región": d.get("region"),
+                    "Ítems": items_txt,
+                    "Total (neto)": _fm(d.get("total", 0)),
+                    "Creado en": d.get("creado_en"),
+                }
+            )
+
+        df = pd.DataFrame(rows, columns=[
+                          "N° Orden", "Cliente", "Comuna", "Región", "Ítems", "Total (neto)", "Creado en"])
+    with perfilado.seccion("tabla"):
+        st.dataframe(df, width="stretch", hide_index=True)
+    if busqueda:
+        st.caption(f"{len(data)} resultado(s), del más al menos relevante.")
+    else:
+        controles_pagina(clave, siguiente)
+
+    # Descargar CSV (página actual)
+    with perfilado.seccion("csv"):
+        csv = df.to_csv(index=False).encode("utf-8")
+    st.download_button("⬇️ Descargar CSV (esta página)", data=csv,
                        file_name="ordenes_compra.csv", mime="text/csv")
+    with st.expander("📤 Exportar historial completo"):
+        exportar_historial(user_id=user_id, clave=clave)
 
     st.markdown("---")
     st.subheader("🧾 Boleta asociada")
@@ -283,7 +383,69 @@ def listar_ordenes(user_id: int | None = None):
     boton_volver()
 
 
+# ---------- Exportación del historial (streaming) ----------
+_TIPOS_EXPORT = {"Órdenes": "ordenes", "Líneas de orden": "lineas", "Boletas": "boletas"}
+
+
+@perfilado.medir()
+def exportar_historial(user_id: int | None = None, clave: str = "export"):
+    """
+    Filtros + botón de descarga. El CSV se genera recién al hacer clic (callable),
+    leyendo por trozos desde la BD; sin `user_id` se puede filtrar por usuario.
+    """
+    c1, c2, c3 = st.columns(3)
+    with c1:
+        tipo = _TIPOS_EXPORT[st.selectbox("Datos", list(_TIPOS_EXPORT), key=f"{clave}_exp_tipo")]
+    with c2:
+        desde = st.date_input("Desde", value=None, key=f"{clave}_exp_desde")
+    with c3:
+        hasta = st.date_input("Hasta", value=None, key=f"{clave}_exp_hasta")
+    if user_id is None:
+        uid_txt = st.text_input("ID de usuario (opcional)", key=f"{clave}_exp_uid").strip()
+        if uid_txt and not uid_txt.isdigit():
+            st.error("El ID de usuario debe ser numérico.")
+            return
+        user_id = int(uid_txt) if uid_txt else None
+    excel = st.checkbox("Formato Excel (';' y coma decimal)", key=f"{clave}_exp_excel")
+
+    if desde and hasta and desde > hasta:
+        st.error("La fecha **Desde** no puede ser posterior a **Hasta**.")
+        return
+
+    def generar():
+        return exportacion.a_archivo_temporal(
+            tipo, desde=desde, hasta=hasta, user_id=user_id, excel=excel)
+
+    st.download_button(
+        "⬇️ Descargar historial",
+        data=generar,
+        file_name=exportacion.nombre_archivo(tipo, desde, hasta),
+        mime="text/csv",
+        key=f"{clave}_exp_btn",
+    )
+
+
+@perfilado.medir()
+def imprimir_boletas_del_dia(clave: str = "lote"):
+    """Descarga un solo HTML con todas las boletas del día, una por hoja (cierre de caja)."""
+    import datetime as dt
+    dia = st.date_input("Día", value=dt.date.today(), key=f"{clave}_dia")
+
+    def generar():
+        return boleta_html.lote_del_dia(dia)[0].encode("utf-8")
+
+    st.download_button(
+        "🖨️ Boletas del día (HTML imprimible)",
+        data=generar,
+        file_name=f"boletas_{dia:%Y%m%d}.html",
+        mime="text/html",
+        key=f"{clave}_btn",
+        help="Ábrelo en el navegador e imprime (o guarda como PDF)",
+    )
+
+
 # ---------- Muestra boleta con detalle + IVA ----------
+@perfilado.medir()
 def _render_boleta_detalle(boleta: Dict[str, Any]):
     def _fm(n):
         try:
@@ -316,7 +478,7 @@ def _render_boleta_detalle(boleta: Dict[str, Any]):
 
     # 👉 Botón para imprimir la boleta
     try:
-        html = oc.boleta_a_html(boleta)
+        html = boleta_html.html_boleta(boleta["numero_boleta"])
         st.download_button(
             "🖨️ Imprimir / Descargar Boleta",
             data=html.encode("utf-8"),
@@ -0,0 +1,438 @@
+from __future__ import annotations
+
+import json
+import re
+import sqlite3
+import threading
+from typing import Callable, List, Tuple
+
+try:
+    import db
+except ImportError:
+    from . import db
+
+# Migraciones versionadas del esquema. Cada paso se aplica una sola vez por base
+# de datos (queda registrado en `schema_version`) y `asegurar_schema` se ejecuta
+# una sola vez por proceso, así las consultas normales no hacen DDL ni commits extra.
+# Los pasos 1-3 reproducen el esquema original y son idempotentes para bases que
+# ya existían antes de este registro.
+
+# ----------------- PASOS -----------------
+def _v1_usuarios(cur: sqlite3.Cursor):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS usuarios (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        username TEXT UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        salt TEXT NOT NULL,
+        nombre TEXT,
+        role TEXT NOT NULL DEFAULT 'user'
+    );
+    """)
+    if "role" not in _columnas(cur, "usuarios"):
+        cur.execute("ALTER TABLE usuarios ADD COLUMN role TEXT NOT NULL DEFAULT 'user';")
+
+def _v2_ordenes_compra(cur: sqlite3.Cursor):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ordenes_compra (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        numero_orden TEXT UNIQUE NOT NULL,
+        cliente TEXT NOT NULL,
+        direccion TEXT NOT NULL,
+        telefono TEXT NOT NULL,
+        comuna TEXT NOT NULL,
+        region TEXT NOT NULL,
+        items_json TEXT NOT NULL,
+        total REAL NOT NULL,
+        creado_en DATETIME DEFAULT CURRENT_TIMESTAMP,
+        user_id INTEGER
+    );
+    """)
+    if "user_id" not in _columnas(cur, "ordenes_compra"):
+        cur.execute("ALTER TABLE ordenes_compra ADD COLUMN user_id INTEGER;")
+
+def _v3_boletas(cur: sqlite3.Cursor):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS boletas (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        numero_boleta TEXT UNIQUE,
+        numero_orden TEXT
+    );
+    """)
+    # Columnas agregadas con el tiempo (ADD COLUMN es compatible y no borra datos)
+    cols = _columnas(cur, "boletas")
+    for col, decl in [
+        ("user_id", "INTEGER"), ("cliente", "TEXT"), ("direccion", "TEXT"),
+        ("telefono", "TEXT"), ("comuna", "TEXT"), ("region", "TEXT"),
+        ("items_json", "TEXT"), ("total_items", "INTEGER"), ("neto", "REAL"),
+        ("iva", "REAL"), ("total", "REAL"),
+        ("creado_en", "DATETIME DEFAULT CURRENT_TIMESTAMP"),
+    ]:
+        if col not in cols:
+            cur.execute(f"ALTER TABLE boletas ADD COLUMN {col} {decl};")
+
+# Numeradores tal como los definió el paso 4 (copia propia, no las constantes de
+# orden_compra/secuencias: un paso publicado no debe cambiar si cambia la app)
+_V4_NUMERADORES = (
+    ("ordenes_compra", "ordenes_compra", "numero_orden", re.compile(r"^OC-(\d{4,})$")),
+    ("boletas", "boletas", "numero_boleta", re.compile(r"^BL-(\d{4,})$")),
+)
+
+def _v4_secuencias(cur: sqlite3.Cursor):
+    # Un numerador por fila, partiendo del máximo número ya usado
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS secuencias (
+        nombre TEXT PRIMARY KEY,
+        valor INTEGER NOT NULL
+    );
+    """)
+    for nombre, tabla, campo, regex in _V4_NUMERADORES:
+        cur.execute("SELECT 1 FROM secuencias WHERE nombre = ?", (nombre,))
+        if cur.fetchone():
+            continue
+        max_n = 0
+        cur.execute(f"SELECT {campo} FROM {tabla}")
+        for (code,) in cur.fetchall():
+            m = regex.match(code or "")
+            if m:
+                max_n = max(max_n, int(m.group(1)))
+        cur.execute("INSERT INTO secuencias (nombre, valor) VALUES (?, ?)", (nombre, max_n))
+
+def _v5_orden_items(cur: sqlite3.Cursor):
+    # Líneas normalizadas: reemplazan los blobs items_json de OC y boletas
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS orden_items (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        orden_id INTEGER NOT NULL REFERENCES ordenes_compra(id) ON DELETE CASCADE,
+        linea INTEGER NOT NULL,
+        producto TEXT NOT NULL,
+        precio REAL NOT NULL,
+        cantidad INTEGER NOT NULL,
+        UNIQUE (orden_id, linea)
+    );
+    """)
+    if "items_json" not in _columnas(cur, "ordenes_compra"):
+        return
+
+    # Backfill desde el JSON de cada OC. Una OC cuyo JSON no se puede leer
+    # detiene la migración: borrar la columna perdería ese detalle para siempre.
+    cur.execute("SELECT id, numero_orden, items_json FROM ordenes_compra")
+    filas, lineas, malas = [], {}, []
+    for orden_id, numero_orden, items_json in cur.fetchall():
+        try:
+            items = json.loads(items_json) if items_json else []
+            if not isinstance(items, list):
+                raise ValueError("no es una lista")
+            nuevas = []
+            for n, it in enumerate(items, start=1):
+                producto = (it.get("producto") or "").strip()
+                if not producto:
+                    raise ValueError(f"línea {n} sin producto")
+                nuevas.append((orden_id, n, producto, float(it["precio"]), int(it["cantidad"])))
+        except (AttributeError, KeyError, TypeError, ValueError, OverflowError) as e:
+            malas.append(f"{numero_orden or orden_id} ({'falta ' if isinstance(e, KeyError) else ''}{e})")
+            continue
+        filas += nuevas
+        lineas[orden_id] = len(nuevas)
+    if malas:
+        raise RuntimeError(f"OC con items_json ilegible (corregir antes de migrar): {'; '.join(malas)}")
+    cur.executemany("""
+        INSERT INTO orden_items (orden_id, linea, producto, precio, cantidad)
+        VALUES (?, ?, ?, ?, ?)
+    """, filas)
+
+    # La columna se borra solo si cada OC quedó con todas sus líneas
+    cur.execute("SELECT orden_id, COUNT(*) FROM orden_items GROUP BY orden_id")
+    copiadas = dict(cur.fetchall())
+    distintas = [str(i) for i, n in lineas.items() if copiadas.get(i, 0) != n]
+    if distintas:
+        raise RuntimeError(f"Backfill de orden_items incompleto para las OC id {', '.join(distintas)}")
+
+    # Las boletas leen sus líneas desde la OC; una boleta sin OC perdería su
+    # detalle al borrar la columna, así que en ese caso la migración se detiene.
+    if "items_json" in _columnas(cur, "boletas"):
+        cur.execute("""
+            SELECT b.numero_boleta FROM boletas b
+            LEFT JOIN ordenes_compra o ON o.numero_orden = b.numero_orden
+            WHERE o.id IS NULL AND COALESCE(b.items_json, '') NOT IN ('', '[]')
+        """)
+        huerfanas = [r[0] for r in cur.fetchall()]
+        if huerfanas:
+            raise RuntimeError(f"Boletas sin OC con detalle propio: {', '.join(huerfanas)}")
+        cur.execute("ALTER TABLE boletas DROP COLUMN items_json;")
+    cur.execute("ALTER TABLE ordenes_compra DROP COLUMN items_json;")
+
+def _v6_indices(cur: sqlite3.Cursor):
+    # Listados por usuario / globales ordenados por fecha y búsqueda de boleta por OC
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_oc_user_creado ON ordenes_compra (user_id, creado_en DESC, id DESC);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_oc_creado ON ordenes_compra (creado_en DESC, id DESC);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_boletas_numero_orden ON boletas (numero_orden, id);")
+
+def _v7_reservas_numero(cur: sqlite3.Cursor):
+    # Números de OC reservados por sesión del formulario (ver orden_compra.reservar_numero_orden)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS reservas_numero (
+        numero_orden TEXT PRIMARY KEY,
+        sesion TEXT NOT NULL,
+        expira_en REAL NOT NULL
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reservas_sesion ON reservas_numero (sesion);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_reservas_expira ON reservas_numero (expira_en);")
+
+# Llenado de ventas_diarias desde las tablas base. Copia propia de la consulta
+# (no reportes.reconstruir): un paso publicado no debe cambiar si cambia la app.
+_ROLLUP_ORDENES = """
+    INSERT INTO ventas_diarias (dia, region, comuna, user_id, ordenes, neto_ordenes)
+    SELECT COALESCE({dia}, ''), COALESCE(region, ''), COALESCE(comuna, ''), COALESCE(user_id, 0),
+           COUNT(*), TOTAL(total)
+    FROM ordenes_compra
+    GROUP BY 1, 2, 3, 4
+"""
+_ROLLUP_BOLETAS = """
+    INSERT INTO ventas_diarias (dia, region, comuna, user_id, boletas, neto, iva, total)
+    SELECT COALESCE({dia}, ''), COALESCE(region, ''), COALESCE(comuna, ''), COALESCE(user_id, 0),
+           COUNT(*), TOTAL(neto), TOTAL(iva), TOTAL(total)
+    FROM boletas
+    WHERE 1 = 1
+    GROUP BY 1, 2, 3, 4
+    ON CONFLICT (dia, region, comuna, user_id) DO UPDATE SET
+        boletas = excluded.boletas, neto = excluded.neto, iva = excluded.iva, total = excluded.total
+"""
+
+def _llenar_ventas_diarias(cur: sqlite3.Cursor, dia: str):
+    cur.execute("DELETE FROM ventas_diarias")
+    cur.execute(_ROLLUP_ORDENES.format(dia=dia))
+    cur.execute(_ROLLUP_BOLETAS.format(dia=dia))
+
+def _v8_ventas_diarias(cur: sqlite3.Cursor):
+    # Rollup del panel de reportes (ver reportes.py); se llena con el historial existente
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS ventas_diarias (
+        dia TEXT NOT NULL,
+        region TEXT NOT NULL,
+        comuna TEXT NOT NULL,
+        user_id INTEGER NOT NULL,
+        ordenes INTEGER NOT NULL DEFAULT 0,
+        neto_ordenes REAL NOT NULL DEFAULT 0,
+        boletas INTEGER NOT NULL DEFAULT 0,
+        neto REAL NOT NULL DEFAULT 0,
+        iva REAL NOT NULL DEFAULT 0,
+        total REAL NOT NULL DEFAULT 0,
+        PRIMARY KEY (dia, region, comuna, user_id)
+    );
+    """)
+    # creado_en está en UTC: se agrupa por día local, como Dialecto.dia en reportes.py
+    _llenar_ventas_diarias(cur, "date(creado_en, 'localtime')")
+
+def _v9_productos(cur: sqlite3.Cursor):
+    # Catálogo de productos (ver catalogo.py). El índice NOCASE sirve la búsqueda
+    # por prefijo (LIKE 'abc%'); la de subcadena la resuelve el índice de trigramas en memoria.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS productos (
+        sku TEXT PRIMARY KEY,
+        nombre TEXT NOT NULL,
+        precio REAL NOT NULL CHECK (precio > 0),
+        stock INTEGER NOT NULL DEFAULT 0,
+        actualizado_en DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_productos_nombre ON productos (nombre COLLATE NOCASE);")
+    # Líneas de OC tomadas del catálogo guardan su SKU (NULL para texto libre)
+    if "sku" not in _columnas(cur, "orden_items"):
+        cur.execute("ALTER TABLE orden_items ADD COLUMN sku TEXT;")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_orden_items_sku ON orden_items (sku);")
+    # Versión del catálogo: sube con cada cambio para que los procesos refresquen su índice
+    cur.execute("INSERT OR IGNORE INTO secuencias (nombre, valor) VALUES ('catalogo', 0)")
+
+# Texto indexado por OC: productos (con SKU) y boletas se concatenan desde sus tablas
+_FTS_PRODUCTOS = """(SELECT group_concat(producto || COALESCE(' ' || sku, ''), ' ')
+                       FROM orden_items WHERE orden_id = {id})"""
+_FTS_BOLETAS = """(SELECT group_concat(numero_boleta, ' ') FROM boletas WHERE numero_orden = {num})"""
+
+def _v10_busqueda(cur: sqlite3.Cursor):
+    # Índice FTS5 de órdenes (ver orden_compra.buscar_ordenes), rowid = ordenes_compra.id.
+    # Los triggers lo mantienen al día en la misma transacción de cada escritura.
+    cur.execute("""
+    CREATE VIRTUAL TABLE IF NOT EXISTS ordenes_fts USING fts5(
+        numero_orden, cliente, direccion, comuna, productos, boletas,
+        tokenize = 'unicode61 remove_diacritics 2'
+    );
+    """)
+    triggers = {
+        "trg_fts_oc_ins": f"""
+            AFTER INSERT ON ordenes_compra BEGIN
+                INSERT INTO ordenes_fts (rowid, numero_orden, cliente, direccion, comuna, productos, boletas)
+                VALUES (new.id, new.numero_orden, new.cliente, new.direccion, new.comuna,
+                        {_FTS_PRODUCTOS.format(id="new.id")}, {_FTS_BOLETAS.format(num="new.numero_orden")});
+            END""",
+        "trg_fts_oc_upd": """
+            AFTER UPDATE OF numero_orden, cliente, direccion, comuna ON ordenes_compra BEGIN
+                UPDATE ordenes_fts SET numero_orden = new.numero_orden, cliente = new.cliente,
+                       direccion = new.direccion, comuna = new.comuna
+                WHERE rowid = new.id;
+            END""",
+        "trg_fts_oc_del": """
+            AFTER DELETE ON ordenes_compra BEGIN
+                DELETE FROM ordenes_fts WHERE rowid = old.id;
+            END""",
+        # Al insertar basta con agregar al final (más barato que recalcular con group_concat)
+        "trg_fts_item_ins": """
+            AFTER INSERT ON orden_items BEGIN
+                UPDATE ordenes_fts
+                SET productos = COALESCE(productos || ' ', '') || new.producto || COALESCE(' ' || new.sku, '')
+                WHERE rowid = new.orden_id;
+            END""",
+        "trg_fts_item_upd": f"""
+            AFTER UPDATE OF producto, sku ON orden_items BEGIN
+                UPDATE ordenes_fts SET productos = {_FTS_PRODUCTOS.format(id="new.orden_id")}
+                WHERE rowid = new.orden_id;
+            END""",
+        "trg_fts_item_del": f"""
+            AFTER DELETE ON orden_items BEGIN
+                UPDATE ordenes_fts SET productos = {_FTS_PRODUCTOS.format(id="old.orden_id")}
+                WHERE rowid = old.orden_id;
+            END""",
+        "trg_fts_bol_ins": f"""
+            AFTER INSERT ON boletas BEGIN
+                UPDATE ordenes_fts SET boletas = {_FTS_BOLETAS.format(num="new.numero_orden")}
+                WHERE rowid = (SELECT id FROM ordenes_compra WHERE numero_orden = new.numero_orden);
+            END""",
+        "trg_fts_bol_del": f"""
+            AFTER DELETE ON boletas BEGIN
+                UPDATE ordenes_fts SET boletas = {_FTS_BOLETAS.format(num="old.numero_orden")}
+                WHERE rowid = (SELECT id FROM ordenes_compra WHERE numero_orden = old.numero_orden);
+            END""",
+    }
+    for nombre, cuerpo in triggers.items():
+        cur.execute(f"CREATE TRIGGER IF NOT EXISTS {nombre} {cuerpo};")
+    cur.execute("DELETE FROM ordenes_fts;")
+    cur.execute(f"""
+    INSERT INTO ordenes_fts (rowid, numero_orden, cliente, direccion, comuna, productos, boletas)
+    SELECT o.id, o.numero_orden, o.cliente, o.direccion, o.comuna,
+           {_FTS_PRODUCTOS.format(id="o.id")}, {_FTS_BOLETAS.format(num="o.numero_orden")}
+    FROM ordenes_compra o;
+    """)
+
+def _v11_movimientos_stock(cur: sqlite3.Cursor):
+    # Libro de movimientos de inventario (ver inventario.py); el saldo vive en productos.stock
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS movimientos_stock (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        sku TEXT NOT NULL,
+        cantidad INTEGER NOT NULL,
+        motivo TEXT NOT NULL,
+        orden_id INTEGER REFERENCES ordenes_compra(id) ON DELETE SET NULL,
+        creado_en DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_movimientos_sku ON movimientos_stock (sku, id);")
+
+def _v12_sesiones(cur: sqlite3.Cursor):
+    # Sesiones de login persistentes (ver sesiones.py); solo se guarda el hash del token
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS sesiones (
+        token_hash TEXT PRIMARY KEY,
+        user_id INTEGER NOT NULL REFERENCES usuarios(id) ON DELETE CASCADE,
+        creada_en REAL NOT NULL,
+        expira_en REAL NOT NULL
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sesiones_usuario ON sesiones (user_id);")
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_sesiones_expira ON sesiones (expira_en);")
+
+def _v13_boletas_html(cur: sqlite3.Cursor):
+    # HTML ya renderizado de cada boleta (ver boleta_html.py) e índice para el lote del día
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS boletas_html (
+        numero_boleta TEXT PRIMARY KEY,
+        version INTEGER NOT NULL,
+        cuerpo TEXT NOT NULL
+    );
+    """)
+    cur.execute("CREATE INDEX IF NOT EXISTS idx_boletas_creado ON boletas (creado_en, id);")
+
+# Orden estricto: nunca reordenar ni renumerar pasos ya publicados, solo agregar al final.
+MIGRACIONES: List[Tuple[int, str, Callable[[sqlite3.Cursor], None]]] = [
+    (1, "tabla usuarios", _v1_usuarios),
+    (2, "tabla ordenes_compra", _v2_ordenes_compra),
+    (3, "tabla boletas", _v3_boletas),
+    (4, "numeradores OC/BL", _v4_secuencias),
+    (5, "líneas de OC normalizadas (orden_items)", _v5_orden_items),
+    (6, "índices de listados y búsqueda de boletas", _v6_indices),
+    (7, "reservas de número de OC", _v7_reservas_numero),
+    (8, "agregados de ventas diarias", _v8_ventas_diarias),
+    (9, "catálogo de productos y SKU en líneas de OC", _v9_productos),
+    (10, "búsqueda de texto completo en órdenes (FTS5)", _v10_busqueda),
+    (11, "movimientos de stock", _v11_movimientos_stock),
+    (12, "sesiones de login", _v12_sesiones),
+    (13, "caché de boletas renderizadas", _v13_boletas_html),
+]
+
+# ----------------- MOTOR -----------------
+def _columnas(cur: sqlite3.Cursor, tabla: str) -> set:
+    return db.dialecto().columnas(cur, tabla)
+
+def version_actual(cur: sqlite3.Cursor) -> int:
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        descripcion TEXT NOT NULL,
+        aplicado_en DATETIME DEFAULT CURRENT_TIMESTAMP
+    );
+    """)
+    cur.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version")
+    return int(cur.fetchone()[0])
+
+def migrar(conn: sqlite3.Connection) -> List[int]:
+    """
+    Aplica en orden los pasos pendientes, cada uno en su propia transacción.
+    BEGIN IMMEDIATE serializa a otros procesos que migren a la vez: la versión
+    se relee ya con el lock tomado. Retorna las versiones aplicadas.
+    """
+    cur = conn.cursor()
+    aplicadas: List[int] = []
+    try:
+        if version_actual(cur) >= MIGRACIONES[-1][0]:
+            return aplicadas
+        for version, descripcion, paso in MIGRACIONES:
+            cur.execute("BEGIN IMMEDIATE;")
+            try:
+                if version_actual(cur) >= version:
+                    conn.rollback()
+                    continue
+                paso(cur)
+                cur.execute(
+                    "INSERT INTO schema_version (version, descripcion) VALUES (?, ?)",
+                    (version, descripcion),
+                )
+                conn.commit()
+                aplicadas.append(version)
+            except Exception:
+                conn.rollback()
+                raise
+    finally:
+        cur.close()
+    return aplicadas
+
+_lock = threading.Lock()
+_listo = False
+
+def asegurar_schema() -> List[int]:
+    """
+    Migra la base una vez por proceso; las llamadas siguientes no tocan la BD.
+    Los pasos son DDL de SQLite: en SQL Server/Oracle (y con el driver falso)
+    el esquema se administra aparte y aquí no se toca.
+    """
+    global _listo
+    if _listo:
+        return []
+    with _lock:
+        if _listo:
+            return []
+        aplicadas: List[int] = []
+        if db.dialecto().migra_esquema:
+            with db.conexion() as conn:
+                aplicadas = migrar(conn)
+        _listo = True
+        return aplicadas
@@ -1,108 +1,122 @@
 from __future__ import annotations
 
-import json
+import math
+import os
 import re
-import time
 import sqlite3
+import time
 from typing import List, Dict, Any, Tuple, Optional
 
-DB_PATH = __import__("os").path.abspath(__import__("os").path.join(
-    __import__("os").path.dirname(__file__), "..", "database", "proyecto.db"))
+try:
+    import cache
+    import db
+    import inventario
+    import reportes
+    import secuencias as seq
+except ImportError:
+    from . import cache
+    from . import db
+    from . import inventario
+    from . import reportes
+    from . import secuencias as seq
 
 _OC_PREFIX = "OC-"
 _OC_RE = re.compile(r"^OC-(\d{4,})$")
 _BL_PREFIX = "BL-"
 _BL_RE = re.compile(r"^BL-(\d{4,})$")
+_SEQ_OC = "ordenes_compra"
+_SEQ_BL = "boletas"
 
 IVA_RATE = 0.19 
 
-def get_conn():
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
-    conn.execute("PRAGMA foreign_keys = ON;")
-    return conn
-
-# ----------------- SCHEMA -----------------
-def _ensure_oc_schema(cur: sqlite3.Cursor):
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS ordenes_compra (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        numero_orden TEXT UNIQUE NOT NULL,
-        cliente TEXT NOT NULL,
-        direccion TEXT NOT NULL,
-        telefono TEXT NOT NULL,
-        comuna TEXT NOT NULL,
-        region TEXT NOT NULL,
-        items_json TEXT NOT NULL,
-        total REAL NOT NULL,
-        creado_en DATETIME DEFAULT CURRENT_TIMESTAMP,
-        user_id INTEGER
-    );
-    """)
-
-def _ensure_boleta_schema(cur: sqlite3.Cursor):
-    # Asegura existencia de la tabla (si no existía)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS boletas (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        numero_boleta TEXT UNIQUE,
-        numero_orden TEXT
-    );
-    """)
-    # Migra columnas faltantes (ADD COLUMN es compatible y no borra datos)
-    cur.execute("PRAGMA table_info(boletas);")
-    cols = {r[1] for r in cur.fetchall()}
-
-    def add(col, decl):
-        if col not in cols:
-            cur.execute(f"ALTER TABLE boletas ADD COLUMN {col} {decl};")
-
-    add("user_id", "INTEGER")
-    add("cliente", "TEXT")
-    add("direccion", "TEXT")
-    add("telefono", "TEXT")
-    add("comuna", "TEXT")
-    add("region", "TEXT")
-    add("items_json", "TEXT")
-    add("total_items", "INTEGER")
-    add("neto", "REAL")
-    add("iva", "REAL")
-    add("total", "REAL")
-    add("creado_en", "DATETIME DEFAULT CURRENT_TIMESTAMP")
-
-def _ensure_schema(conn: sqlite3.Connection):
-    cur = conn.cursor()
-    _ensure_oc_schema(cur)
-    _ensure_boleta_schema(cur)
-    conn.commit()
+# Vida de una reserva de número de OC (segundos); al vencer, el número se recicla
+RESERVA_TTL = float(os.getenv("OC_RESERVA_TTL", "900"))
 
 # ----------------- NUMERADORES -----------------
-def _next_code(cur: sqlite3.Cursor, tabla: str, campo: str, pref: str, regex: re.Pattern) -> str:
-    cur.execute(f"SELECT {campo} FROM {tabla}")
-    max_n = 0
-    for (code,) in cur.fetchall():
-        if not code: 
-            continue
-        m = regex.match(code)
-        if m:
-            try:
-                n = int(m.group(1))
-                if n > max_n:
-                    max_n = n
-            except:
-                pass
-    return f"{pref}{(max_n + 1):04d}"
-
 def generar_numero_orden() -> str:
-    conn = get_conn()
-    try:
-        _ensure_schema(conn)
+    """
+    Número que recibiría la próxima OC (solo consulta, no lo consume). Se
+    mantiene por compatibilidad: sin caché, porque el numerador cambia con
+    cada OC; para el formulario usar reservar_numero_orden.
+    """
+    with db.conexion() as conn:
         cur = conn.cursor()
-        return _next_code(cur, "ordenes_compra", "numero_orden", _OC_PREFIX, _OC_RE)
-    finally:
-        conn.close()
+        return seq.formatear(_OC_PREFIX, seq.actual(cur, _SEQ_OC) + 1)
+
+_SQL_RESERVA_VENCIDA = f"""
+    SELECT numero_orden FROM reservas_numero
+    WHERE expira_en < ?
+    ORDER BY expira_en
+    {db.dialecto().limite()}
+"""
+
+def reservar_numero_orden(sesion: str, ttl: float = RESERVA_TTL) -> Tuple[str, float]:
+    """
+    Reserva un número de OC para `sesion` hasta `expira_en` (epoch). Retorna (numero, expira_en).
+    Si la sesión ya tiene uno (vencido o no, mientras nadie lo haya reciclado) se
+    renueva ese mismo; si no, se recicla el vencido más antiguo o se toma uno nuevo.
+    Dos sesiones nunca reciben el mismo número vigente.
+    """
+    ahora = time.time()
+    expira = ahora + ttl
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        db.iniciar_escritura(cur)
+        cur.execute("SELECT numero_orden FROM reservas_numero WHERE sesion = ?", (sesion,))
+        row = cur.fetchone()
+        if row:
+            cur.execute(
+                "UPDATE reservas_numero SET expira_en = ? WHERE numero_orden = ?",
+                (expira, row[0]),
+            )
+        else:
+            cur.execute(_SQL_RESERVA_VENCIDA, (ahora, 1))
+            row = cur.fetchone()
+            if row:
+                # Sin BEGIN IMMEDIATE (motores de servidor) otra sesión pudo tomarla
+                # entre el SELECT y aquí: solo se recicla si sigue vencida
+                cur.execute(
+                    "UPDATE reservas_numero SET sesion = ?, expira_en = ? WHERE numero_orden = ? AND expira_en < ?",
+                    (sesion, expira, row[0], ahora),
+                )
+                if cur.rowcount == 0:
+                    row = None
+        if row:
+            numero = row[0]
+        else:
+            numero = seq.formatear(_OC_PREFIX, seq.siguiente(cur, _SEQ_OC))
+            cur.execute(
+                "INSERT INTO reservas_numero (numero_orden, sesion, expira_en) VALUES (?, ?, ?)",
+                (numero, sesion, expira),
+            )
+        conn.commit()
+    return numero, expira
+
+def liberar_reserva(sesion: str):
+    """Devuelve el número reservado por `sesion` para que otra lo recicle de inmediato."""
+    with db.conexion() as conn:
+        conn.execute("UPDATE reservas_numero SET expira_en = 0 WHERE sesion = ?", (sesion,))
+        conn.commit()
+
+def _tomar_numero_orden(cur: sqlite3.Cursor, preasignado: Optional[str], sesion: Optional[str] = None) -> str:
+    if not preasignado:
+        return seq.formatear(_OC_PREFIX, seq.siguiente(cur, _SEQ_OC))
+    if sesion is not None:
+        # Consumir la reserva; si otra sesión la recicló tras vencer, se usa un número nuevo
+        cur.execute(
+            "DELETE FROM reservas_numero WHERE numero_orden = ? AND sesion = ?",
+            (preasignado, sesion),
+        )
+        if cur.rowcount == 0:
+            return seq.formatear(_OC_PREFIX, seq.siguiente(cur, _SEQ_OC))
+        return preasignado
+    n = seq.parsear(_OC_RE, preasignado)
+    if n is not None:
+        seq.ajustar_minimo(cur, _SEQ_OC, n)
+    return preasignado
 
 def _generar_numero_boleta(cur: sqlite3.Cursor) -> str:
-    return _next_code(cur, "boletas", "numero_boleta", _BL_PREFIX, _BL_RE)
+    return seq.formatear(_BL_PREFIX, seq.siguiente(cur, _SEQ_BL))
 
 # ----------------- HELPERS -----------------
 def _sumar_items(items: List[Dict[str, Any]]) -> Tuple[int, float]:
@@ -115,301 +129,419 @@ def _sumar_items(items: List[Dict[str, Any]]) -> Tuple[int, float]:
         neto += q * p
     return total_items, neto
 
+# ----------------- LÍNEAS (orden_items) -----------------
+# Columnas de cabecera de OC + líneas en una sola consulta (LEFT JOIN): cada OC
+# ocupa filas consecutivas, una por línea, que se agrupan sin decodificar JSON.
+_COLS_OC = "o.id, o.numero_orden, o.cliente, o.direccion, o.telefono, o.comuna, o.region, o.total, o.creado_en, o.user_id"
+_COLS_ITEM = "i.producto, i.precio, i.cantidad"
+
+def _insertar_items(cur: sqlite3.Cursor, orden_id: int, items: List[Dict[str, Any]]):
+    cur.executemany("""
+        INSERT INTO orden_items (orden_id, linea, producto, precio, cantidad, sku)
+        VALUES (?, ?, ?, ?, ?, ?)
+    """, [
+        (orden_id, n, it["producto"], it["precio"], it["cantidad"], it.get("sku"))
+        for n, it in enumerate(items, start=1)
+    ])
+
+def _agrupar_ordenes(rows) -> List[Dict[str, Any]]:
+    out: List[Dict[str, Any]] = []
+    for r in rows:
+        if not out or out[-1]["id"] != r[0]:
+            out.append({
+                "id": r[0], "numero_orden": r[1], "cliente": r[2], "direccion": r[3],
+                "telefono": r[4], "comuna": r[5], "region": r[6],
+                "items": [], "total": float(r[7]), "creado_en": r[8], "user_id": r[9],
+            })
+        if r[10] is not None:
+            out[-1]["items"].append({"producto": r[10], "precio": float(r[11]), "cantidad": int(r[12])})
+    return out
+
 # ----------------- CRUD OC -----------------
+def _validar_items(items: List[Dict[str, Any]]) -> Tuple[Optional[List[Dict[str, Any]]], str]:
+    """Valida y normaliza ítems. Retorna (items_limpios, "") o (None, mensaje_error)."""
+    if not items:
+        return None, "Debes agregar al menos 1 producto."
+    clean_items: List[Dict[str, Any]] = []
+    for it in items:
+        nombre = (it.get("producto") or "").strip()
+        try:
+            precio = float(it.get("precio", 0))
+            cant = int(it.get("cantidad", 0))
+        except (TypeError, ValueError, OverflowError):
+            return None, "Precio o cantidad no numéricos."
+        # NaN pasa cualquier comparación (NaN <= 0 es falso) e inf no es un monto
+        if not nombre or not math.isfinite(precio) or precio <= 0 or cant <= 0:
+            return None, "Cada ítem debe tener nombre, precio>0 y cantidad>0."
+        limpio = {"producto": nombre, "precio": precio, "cantidad": cant}
+        sku = (it.get("sku") or "").strip()
+        if sku:  # ítem tomado del catálogo
+            limpio["sku"] = sku
+        clean_items.append(limpio)
+    return clean_items, ""
+
+def _insertar_orden(
+    cur: sqlite3.Cursor, cliente: str, direccion: str, telefono: str, comuna: str, region: str,
+    clean_items: List[Dict[str, Any]], neto: float, user_id: Optional[int],
+    numero_orden_preasignado: Optional[str], sesion: Optional[str]
+) -> str:
+    """
+    Inserta cabecera + líneas dentro de la transacción de `cur` y descuenta stock
+    de las líneas con SKU (inventario.StockInsuficiente si no alcanza). Retorna el número usado.
+    """
+    numero_orden = _tomar_numero_orden(cur, numero_orden_preasignado, sesion)
+    orden_id = db.dialecto().insertar_con_id(cur, """
+        INSERT INTO ordenes_compra
+        (numero_orden, cliente, direccion, telefono, comuna, region, total, user_id)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        numero_orden, cliente.strip(), direccion.strip(), telefono.strip(),
+        comuna.strip(), region.strip(), neto, user_id
+    ))
+    _insertar_items(cur, orden_id, clean_items)
+    inventario.descontar(cur, clean_items, orden_id)
+    reportes.acumular_ordenes(cur, orden_id)
+    return numero_orden
+
 def agregar_orden(
     cliente: str, direccion: str, telefono: str, comuna: str, region: str,
     items: List[Dict[str, Any]], user_id: Optional[int] = None,
-    numero_orden_preasignado: Optional[str] = None
+    numero_orden_preasignado: Optional[str] = None, sesion: Optional[str] = None
 ) -> Tuple[bool, str, Optional[str]]:
     """
-    Inserta una OC. Retorna (ok, mensaje, numero_orden).
+    Inserta una OC y sus líneas. Retorna (ok, mensaje, numero_orden).
     total = NETO (sin IVA). La boleta hará el desglose con IVA.
+    Con `sesion`, `numero_orden_preasignado` es el que entregó reservar_numero_orden.
     """
-    if not items:
-        return False, "Debes agregar al menos 1 producto.", None
-
-    # Validación + normalización
-    clean_items: List[Dict[str, Any]] = []
-    for it in items:
-        nombre = (it.get("producto") or "").strip()
-        precio = float(it.get("precio", 0))
-        cant = int(it.get("cantidad", 0))
-        if not nombre or precio <= 0 or cant <= 0:
-            return False, "Cada ítem debe tener nombre, precio>0 y cantidad>0.", None
-        clean_items.append({"producto": nombre, "precio": precio, "cantidad": cant})
+    clean_items, error = _validar_items(items)
+    if clean_items is None:
+        return False, error, None
 
     # Neto de la OC (sin IVA)
     _, neto = _sumar_items(clean_items)
 
-    attempts = 3
-    for i in range(attempts):
-        conn = get_conn()
-        try:
-            _ensure_schema(conn)
+    try:
+        with db.conexion() as conn:
             cur = conn.cursor()
-            cur.execute("BEGIN IMMEDIATE;")
-            numero_orden = numero_orden_preasignado or _next_code(cur, "ordenes_compra", "numero_orden", _OC_PREFIX, _OC_RE)
-            cur.execute("""
-                INSERT INTO ordenes_compra
-                (numero_orden, cliente, direccion, telefono, comuna, region, items_json, total, user_id)
-                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            """, (
-                numero_orden, cliente.strip(), direccion.strip(), telefono.strip(),
-                comuna.strip(), region.strip(), json.dumps(clean_items, ensure_ascii=False),
-                neto, user_id
-            ))
+            db.iniciar_escritura(cur)
+            numero_orden = _insertar_orden(
+                cur, cliente, direccion, telefono, comuna, region,
+                clean_items, neto, user_id, numero_orden_preasignado, sesion)
             conn.commit()
-            return True, f"Orden {numero_orden} registrada correctamente", numero_orden
-        except sqlite3.IntegrityError as e:
-            try: conn.rollback()
-            except: pass
-            if "unique" in str(e).lower() and i < attempts - 1:
-                time.sleep(0.05); continue
-            return False, "Colisión de número de orden; intenta nuevamente.", None
-        except Exception as e:
-            try: conn.rollback()
-            except: pass
-            return False, f"Error al registrar orden: {e}", None
-        finally:
-            try: conn.close()
-            except: pass
-    return False, "No fue posible generar un número de orden único.", None
-
-def listar_ordenes(limit: int = 100, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
-    conn = get_conn()
+        cache.invalidar("ordenes", "stock")
+        return True, f"Orden {numero_orden} registrada correctamente", numero_orden
+    except inventario.StockInsuficiente as e:
+        return False, str(e), None
+    except db.ErrorIntegridad:
+        # Solo puede ocurrir con un número preasignado que otro ya usó
+        return False, "Colisión de número de orden; intenta nuevamente.", None
+    except Exception as e:
+        return False, f"Error al registrar orden: {e}", None
+
+def emitir_orden_con_boleta(
+    cliente: str, direccion: str, telefono: str, comuna: str, region: str,
+    items: List[Dict[str, Any]], user_id: Optional[int] = None,
+    numero_orden_preasignado: Optional[str] = None, sesion: Optional[str] = None
+) -> Tuple[bool, str, Optional[Dict[str, Any]]]:
+    """
+    Inserta la OC, sus líneas y su boleta en una sola transacción (una conexión,
+    sin releer la OC). Nunca queda una OC sin boleta a medio camino.
+    Retorna (ok, mensaje, boleta) con la boleta completa, igual que obtener_boleta_por_numero.
+    """
+    clean_items, error = _validar_items(items)
+    if clean_items is None:
+        return False, error, None
+
+    total_items, neto = _sumar_items(clean_items)
+
     try:
-        _ensure_schema(conn)
+        with db.conexion() as conn:
+            cur = conn.cursor()
+            db.iniciar_escritura(cur)
+            numero_orden = _insertar_orden(
+                cur, cliente, direccion, telefono, comuna, region,
+                clean_items, neto, user_id, numero_orden_preasignado, sesion)
+            boleta = _insertar_boleta(
+                cur, numero_orden, user_id, cliente.strip(), direccion.strip(), telefono.strip(),
+                comuna.strip(), region.strip(), total_items, neto)
+            conn.commit()
+        cache.invalidar("ordenes", "boletas", "stock")
+        boleta["items"] = clean_items
+        return True, f"Orden {numero_orden} registrada y boleta {boleta['numero_boleta']} emitida.", boleta
+    except inventario.StockInsuficiente as e:
+        return False, str(e), None
+    except db.ErrorIntegridad:
+        return False, "Colisión de número de orden; intenta nuevamente.", None
+    except Exception as e:
+        return False, f"Error al registrar orden: {e}", None
+
+# Consultas de lectura frecuentes. plan_consultas.py revisa su EXPLAIN QUERY PLAN,
+# por eso viven como constantes y no se arman inline.
+def _sql_listar(por_usuario: bool, con_cursor: bool = False) -> str:
+    # La página se elige primero sobre el índice (user_id, creado_en, id) y luego se unen sus líneas.
+    # Paginación por cursor: (creado_en, id) < último visto, sin OFFSET.
+    dialecto = db.dialecto()
+    cond = (["user_id = ?"] if por_usuario else []) + ([dialecto.tupla_menor(("creado_en", "id"))] if con_cursor else [])
+    where = ("WHERE " + " AND ".join(cond)) if cond else ""
+    return f"""
+        WITH pagina AS (
+            SELECT id FROM ordenes_compra
+            {where}
+            ORDER BY creado_en DESC, id DESC
+            {dialecto.limite()}
+        )
+        SELECT {_COLS_OC}, {_COLS_ITEM}
+        FROM pagina
+        JOIN ordenes_compra o ON o.id = pagina.id
+        LEFT JOIN orden_items i ON i.orden_id = o.id
+        ORDER BY o.creado_en DESC, o.id DESC, i.linea
+    """
+
+_SQL_LISTAR = _sql_listar(False)
+_SQL_LISTAR_USUARIO = _sql_listar(True)
+_SQL_LISTAR_DESDE = _sql_listar(False, con_cursor=True)
+_SQL_LISTAR_USUARIO_DESDE = _sql_listar(True, con_cursor=True)
+
+_SQL_ORDEN_POR_NUMERO = f"""
+    SELECT {_COLS_OC}, {_COLS_ITEM}
+    FROM ordenes_compra o
+    LEFT JOIN orden_items i ON i.orden_id = o.id
+    WHERE o.numero_orden = ?
+    ORDER BY i.linea
+"""
+
+@cache.cacheado("ordenes")
+def listar_ordenes(
+    limit: int = 100, user_id: Optional[int] = None,
+    after: Optional[Tuple[str, int]] = None
+) -> List[Dict[str, Any]]:
+    """
+    OCs más recientes primero. `after=(creado_en, id)` de la última OC ya vista
+    continúa desde ahí: cada página cuesta lo mismo sin importar cuán atrás esté.
+    """
+    params: List[Any] = [] if user_id is None else [int(user_id)]
+    if after is not None:
+        params += db.dialecto().params_tupla((after[0], int(after[1])))
+    params.append(int(limit))
+    sql = {
+        (False, False): _SQL_LISTAR, (True, False): _SQL_LISTAR_USUARIO,
+        (False, True): _SQL_LISTAR_DESDE, (True, True): _SQL_LISTAR_USUARIO_DESDE,
+    }[(user_id is not None, after is not None)]
+    with db.conexion() as conn:
         cur = conn.cursor()
-        if user_id is None:
-            cur.execute("""
-                SELECT id, numero_orden, cliente, direccion, telefono, comuna, region, items_json, total, creado_en, user_id
-                FROM ordenes_compra
-                ORDER BY creado_en DESC, id DESC
-                LIMIT ?
-            """, (int(limit),))
-        else:
-            cur.execute("""
-                SELECT id, numero_orden, cliente, direccion, telefono, comuna, region, items_json, total, creado_en, user_id
-                FROM ordenes_compra
-                WHERE user_id = ?
-                ORDER BY creado_en DESC, id DESC
-                LIMIT ?
-            """, (int(user_id), int(limit)))
+        cur.execute(sql, params)
         rows = cur.fetchall()
-        out: List[Dict[str, Any]] = []
-        for r in rows:
-            try:
-                items = json.loads(r[7]) if r[7] else []
-            except:
-                items = []
-            out.append({
-                "id": r[0], "numero_orden": r[1], "cliente": r[2], "direccion": r[3],
-                "telefono": r[4], "comuna": r[5], "region": r[6],
-                "items": items, "total": float(r[8]), "creado_en": r[9], "user_id": r[10],
-            })
-        return out
-    finally:
-        try: conn.close()
-        except: pass
+    return _agrupar_ordenes(rows)
+
+def listar_ordenes_pagina(
+    page_size: int = 50, user_id: Optional[int] = None,
+    after: Optional[Tuple[str, int]] = None
+) -> Tuple[List[Dict[str, Any]], Optional[Tuple[str, int]]]:
+    """Retorna (ordenes, cursor_siguiente); el cursor es None en la última página."""
+    ordenes = listar_ordenes(limit=page_size + 1, user_id=user_id, after=after)
+    if len(ordenes) <= page_size:
+        return ordenes, None
+    ordenes = ordenes[:page_size]
+    return ordenes, (ordenes[-1]["creado_en"], ordenes[-1]["id"])
 
+@cache.cacheado("ordenes")
 def obtener_orden_por_numero(numero_orden: str) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    try:
-        _ensure_schema(conn)
+    with db.conexion() as conn:
         cur = conn.cursor()
-        cur.execute("""
-            SELECT id, numero_orden, cliente, direccion, telefono, comuna, region, items_json, total, creado_en, user_id
-            FROM ordenes_compra
-            WHERE numero_orden = ?
-        """, (numero_orden,))
-        r = cur.fetchone()
-        if not r:
-            return None
-        try:
-            items = json.loads(r[7]) if r[7] else []
-        except:
-            items = []
-        return {
-            "id": r[0], "numero_orden": r[1], "cliente": r[2], "direccion": r[3],
-            "telefono": r[4], "comuna": r[5], "region": r[6],
-            "items": items, "total": float(r[8]), "creado_en": r[9], "user_id": r[10],
-        }
-    finally:
-        try: conn.close()
-        except: pass
+        cur.execute(_SQL_ORDEN_POR_NUMERO, (numero_orden,))
+        rows = cur.fetchall()
+    ordenes = _agrupar_ordenes(rows)
+    return ordenes[0] if ordenes else None
+
+# ----------------- BÚSQUEDA (FTS5, tabla ordenes_fts) -----------------
+def _sql_buscar(por_usuario: bool) -> str:
+    # Primero los `limit` mejores aciertos (bm25), después sus líneas
+    filtro = "AND o.user_id = ?" if por_usuario else ""
+    dialecto = db.dialecto()
+    if dialecto.texto_completo:
+        hits = f"""
+            SELECT f.rowid AS id, f.rank AS rank
+            FROM ordenes_fts f
+            JOIN ordenes_compra o ON o.id = f.rowid
+            WHERE ordenes_fts MATCH ? {filtro}
+            ORDER BY f.rank
+            {dialecto.limite()}"""
+    else:
+        # Sin FTS5 (SQL Server/Oracle): el texto como subcadena de número de OC o cliente,
+        # las más recientes primero
+        hits = f"""
+            SELECT o.id AS id, -o.id AS rank
+            FROM ordenes_compra o
+            WHERE (UPPER(o.numero_orden) LIKE ? OR UPPER(o.cliente) LIKE ?) {filtro}
+            ORDER BY o.id DESC
+            {dialecto.limite()}"""
+    return f"""
+        WITH hits AS ({hits}
+        )
+        SELECT {_COLS_OC}, {_COLS_ITEM}
+        FROM hits
+        JOIN ordenes_compra o ON o.id = hits.id
+        LEFT JOIN orden_items i ON i.orden_id = o.id
+        ORDER BY hits.rank, o.id, i.linea
+    """
+
+_SQL_BUSCAR = _sql_buscar(False)
+_SQL_BUSCAR_USUARIO = _sql_buscar(True)
+
+def _consulta_fts(texto: str) -> str:
+    """
+    Texto libre -> expresión MATCH segura: cada palabra es una frase con prefijo
+    en su último token ("oc-00"* calza OC-0012), todas obligatorias.
+    """
+    palabras = [p.replace('"', " ").strip() for p in (texto or "").split()]
+    return " ".join(f'"{p}"*' for p in palabras if p)
+
+@cache.cacheado("ordenes")
+def buscar_ordenes(query: str, limit: int = 50, user_id: Optional[int] = None) -> List[Dict[str, Any]]:
+    """
+    Órdenes que calzan con `query` en número de OC o boleta, cliente, dirección,
+    comuna o productos (sin distinguir tildes), de más a menos relevante.
+    """
+    expr = _consulta_fts(query)
+    if not expr:
+        return []
+    if db.dialecto().texto_completo:
+        params: List[Any] = [expr]
+    else:
+        params = [f"%{query.strip().upper()}%"] * 2
+    if user_id is not None:
+        params.append(user_id)
+    params.append(int(limit))
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(_SQL_BUSCAR if user_id is None else _SQL_BUSCAR_USUARIO, params)
+        rows = cur.fetchall()
+    return _agrupar_ordenes(rows)
 
 # ----------------- BOLETA (con IVA) -----------------
+_SQL_DATOS_BOLETA = """
+    SELECT o.cliente, o.direccion, o.telefono, o.comuna, o.region, o.total, o.user_id,
+           COALESCE(SUM(i.cantidad), 0), COALESCE(SUM(i.cantidad * i.precio), 0)
+    FROM ordenes_compra o
+    LEFT JOIN orden_items i ON i.orden_id = o.id
+    WHERE o.numero_orden = ?
+    GROUP BY o.id
+"""
+
+def _insertar_boleta(
+    cur: sqlite3.Cursor, numero_orden: str, user_id: Optional[int], cliente: str, direccion: str,
+    telefono: str, comuna: str, region: str, total_items: int, neto: float
+) -> Dict[str, Any]:
+    """Calcula IVA/total e inserta la boleta dentro de la transacción de `cur` (sin ítems)."""
+    iva = round(neto * IVA_RATE, 2)
+    total = round(neto + iva, 2)
+
+    numero_boleta = _generar_numero_boleta(cur)
+    boleta_id = db.dialecto().insertar_con_id(cur, """
+        INSERT INTO boletas
+        (numero_boleta, numero_orden, user_id, cliente, direccion, telefono, comuna, region,
+         total_items, neto, iva, total)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """, (
+        numero_boleta, numero_orden, user_id, cliente, direccion, telefono, comuna, region,
+        total_items, neto, iva, total
+    ))
+    reportes.acumular_boletas(cur, boleta_id)
+    cur.execute("SELECT creado_en FROM boletas WHERE id = ?", (boleta_id,))
+    return {
+        "numero_boleta": numero_boleta, "numero_orden": numero_orden, "user_id": user_id,
+        "cliente": cliente, "direccion": direccion, "telefono": telefono, "comuna": comuna,
+        "region": region, "items": [], "total_items": total_items, "neto": neto, "iva": iva,
+        "total": total, "creado_en": cur.fetchone()[0],
+    }
+
 def crear_boleta_para_orden(numero_orden: str) -> Tuple[bool, str, Optional[str]]:
     """
     Crea boleta (BL-####) con desglose NETO, IVA (19%) y TOTAL.
-    Copia datos de cliente y detalle de la OC.
+    Copia datos de cliente de la OC; el detalle se lee de sus líneas.
     Retorna (ok, msg, numero_boleta).
     """
-    conn = get_conn()
     try:
-        _ensure_schema(conn)
-        cur = conn.cursor()
-        cur.execute("BEGIN IMMEDIATE;")
+        with db.conexion() as conn:
+            cur = conn.cursor()
+            db.iniciar_escritura(cur)
 
-        cur.execute("""
-            SELECT cliente, direccion, telefono, comuna, region, items_json, total, user_id
-            FROM ordenes_compra
-            WHERE numero_orden = ?
-        """, (numero_orden,))
-        row = cur.fetchone()
-        if not row:
-            conn.rollback()
-            return False, "Orden no encontrada para emitir boleta.", None
-
-        cliente, direccion, telefono, comuna, region, items_json, neto_oc, user_id = row
-        # Aseguramos cálculo desde items por consistencia
-        items = json.loads(items_json) if items_json else []
-        total_items, neto = _sumar_items(items)
-        # Si por alguna razón difiere del guardado en OC, usamos el calculado
-        if abs(neto - float(neto_oc)) > 0.01:
-            neto = float(neto_oc)
-
-        iva = round(neto * IVA_RATE, 2)
-        total = round(neto + iva, 2)
-
-        numero_boleta = _generar_numero_boleta(cur)
-        cur.execute("""
-            INSERT INTO boletas
-            (numero_boleta, numero_orden, user_id, cliente, direccion, telefono, comuna, region,
-             items_json, total_items, neto, iva, total)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        """, (
-            numero_boleta, numero_orden, user_id, cliente, direccion, telefono, comuna, region,
-            items_json, total_items, neto, iva, total
-        ))
-        conn.commit()
-        return True, f"Boleta {numero_boleta} emitida.", numero_boleta
-    except sqlite3.IntegrityError:
-        try: conn.rollback()
-        except: pass
+            cur.execute(_SQL_DATOS_BOLETA, (numero_orden,))
+            row = cur.fetchone()
+            if not row:
+                conn.rollback()
+                return False, "Orden no encontrada para emitir boleta.", None
+
+            cliente, direccion, telefono, comuna, region, neto_oc, user_id, total_items, neto = row
+            # Si por alguna razón difiere del guardado en OC, usamos el de la OC
+            if abs(neto - float(neto_oc)) > 0.01:
+                neto = float(neto_oc)
+
+            boleta = _insertar_boleta(
+                cur, numero_orden, user_id, cliente, direccion, telefono, comuna, region,
+                total_items, neto)
+            conn.commit()
+        # buscar_ordenes ("ordenes") indexa también los números de boleta
+        cache.invalidar("ordenes", "boletas")
+        return True, f"Boleta {boleta['numero_boleta']} emitida.", boleta["numero_boleta"]
+    except db.ErrorIntegridad:
         return False, "Ya existe una boleta con ese número.", None
     except Exception as e:
-        try: conn.rollback()
-        except: pass
         return False, f"Error al emitir boleta: {e}", None
-    finally:
-        try: conn.close()
-        except: pass
 
+# Boleta + líneas de su OC en una sola consulta
+_SQL_BOLETA = f"""
+    SELECT b.numero_boleta, b.numero_orden, b.user_id, b.cliente, b.direccion, b.telefono,
+           b.comuna, b.region, b.total_items, b.neto, b.iva, b.total, b.creado_en, {_COLS_ITEM}
+    FROM boletas b
+    LEFT JOIN ordenes_compra o ON o.numero_orden = b.numero_orden
+    LEFT JOIN orden_items i ON i.orden_id = o.id
+"""
+_SQL_BOLETA_POR_NUMERO = _SQL_BOLETA + """
+    WHERE b.numero_boleta = ?
+    ORDER BY i.linea
+"""
+# Si hubiera más de una, toma la última emitida
+_SQL_BOLETA_POR_ORDEN = _SQL_BOLETA + """
+    WHERE b.id = (SELECT MAX(id) FROM boletas WHERE numero_orden = ?)
+    ORDER BY i.linea
+"""
+
+def _boleta_desde_filas(rows) -> Optional[Dict[str, Any]]:
+    if not rows:
+        return None
+    r = rows[0]
+    return {
+        "numero_boleta": r[0], "numero_orden": r[1], "user_id": r[2],
+        "cliente": r[3], "direccion": r[4], "telefono": r[5], "comuna": r[6], "region": r[7],
+        "items": [
+            {"producto": x[13], "precio": float(x[14]), "cantidad": int(x[15])}
+            for x in rows if x[13] is not None
+        ],
+        "total_items": r[8], "neto": r[9], "iva": r[10], "total": r[11], "creado_en": r[12],
+    }
+
+@cache.cacheado("boletas")
 def obtener_boleta_por_numero(numero_boleta: str) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    try:
-        _ensure_schema(conn)
+    with db.conexion() as conn:
         cur = conn.cursor()
-        cur.execute("""
-            SELECT numero_boleta, numero_orden, user_id, cliente, direccion, telefono, comuna, region,
-                   items_json, total_items, neto, iva, total, creado_en
-            FROM boletas
-            WHERE numero_boleta = ?
-        """, (numero_boleta,))
-        r = cur.fetchone()
-        if not r:
-            return None
-        try:
-            items = json.loads(r[8]) if r[8] else []
-        except:
-            items = []
-        return {
-            "numero_boleta": r[0], "numero_orden": r[1], "user_id": r[2],
-            "cliente": r[3], "direccion": r[4], "telefono": r[5], "comuna": r[6], "region": r[7],
-            "items": items, "total_items": r[9], "neto": r[10], "iva": r[11],
-            "total": r[12], "creado_en": r[13],
-        }
-    finally:
-        try: conn.close()
-        except: pass
+        cur.execute(_SQL_BOLETA_POR_NUMERO, (numero_boleta,))
+        rows = cur.fetchall()
+    return _boleta_desde_filas(rows)
+
+@cache.cacheado("boletas")
 def obtener_boleta_por_orden(numero_orden: str) -> Optional[Dict[str, Any]]:
-    conn = get_conn()
-    try:
-        _ensure_schema(conn)
+    with db.conexion() as conn:
         cur = conn.cursor()
-        # Si hubiera más de una, toma la última emitida
-        cur.execute("""
-            SELECT numero_boleta, numero_orden, user_id, cliente, direccion, telefono, comuna, region,
-                   items_json, total_items, neto, iva, total, creado_en
-            FROM boletas
-            WHERE numero_orden = ?
-            ORDER BY id DESC
-            LIMIT 1
-        """, (numero_orden,))
-        r = cur.fetchone()
-        if not r:
-            return None
-        try:
-            items = json.loads(r[8]) if r[8] else []
-        except:
-            items = []
-        return {
-            "numero_boleta": r[0], "numero_orden": r[1], "user_id": r[2],
-            "cliente": r[3], "direccion": r[4], "telefono": r[5], "comuna": r[6], "region": r[7],
-            "items": items, "total_items": r[9], "neto": r[10], "iva": r[11],
-            "total": r[12], "creado_en": r[13],
-        }
-    finally:
-        try: conn.close()
-        except: pass
+        cur.execute(_SQL_BOLETA_POR_ORDEN, (numero_orden,))
+        rows = cur.fetchall()
+    return _boleta_desde_filas(rows)
 
 # ===========================
-# BOLETA → HTML imprimible
+# Formato de montos (la boleta imprimible está en boleta_html.py)
 # ===========================
-from typing import Dict
-
 def _fmt_chl(n: float) -> str:
     try:
         return f"${int(round(float(n))):,}".replace(",", ".")
     except Exception:
         return str(n)
-
-def boleta_a_html(boleta: Dict[str, any]) -> str:
-    # cuerpo de la tabla de ítems
-    rows = []
-    for it in boleta.get("items", []):
-        producto = it.get("producto", "")
-        cant = int(it.get("cantidad", 0))
-        precio = float(it.get("precio", 0))
-        rows.append(
-            f"<tr><td>{producto}</td>"
-            f"<td style='text-align:right'>{cant}</td>"
-            f"<td style='text-align:right'>{_fmt_chl(precio)}</td></tr>"
-        )
-    rows_html = "\n".join(rows) or "<tr><td colspan='3'>(Sin ítems)</td></tr>"
-
-    html = f"""<!doctype html>
-<html><head>
-<meta charset="utf-8">
-<title>Boleta {boleta['numero_boleta']}</title>
-<style>
-  body {{ font-family: Arial, sans-serif; margin: 24px; }}
-  h1 {{ margin-bottom: 4px; }}
-  .small {{ color: #555; }}
-  table {{ width: 100%; border-collapse: collapse; margin-top: 16px; }}
-  th, td {{ border-bottom: 1px solid #eee; padding: 8px; }}
-  tfoot td {{ border-top: 2px solid #333; font-weight: bold; }}
-</style>
-</head><body>
-  <h1>Boleta {boleta['numero_boleta']}</h1>
-  <div class="small">Orden: {boleta['numero_orden']} &nbsp;&nbsp;|&nbsp;&nbsp; Fecha: {boleta['creado_en']}</div>
-  <p><strong>Cliente:</strong> {boleta['cliente']}<br>
-     <strong>Dirección:</strong> {boleta['direccion']}, {boleta['comuna']}, {boleta['region']}<br>
-     <strong>Teléfono:</strong> {boleta['telefono']}</p>
-
-  <table>
-    <thead>
-      <tr><th>Producto</th><th style="text-align:right">Cant.</th><th style="text-align:right">Precio</th></tr>
-    </thead>
-    <tbody>
-      {rows_html}
-    </tbody>
-    <tfoot>
-      <tr><td colspan="2" style="text-align:right">Neto</td><td style="text-align:right">{_fmt_chl(boleta['neto'])}</td></tr>
-      <tr><td colspan="2" style="text-align:right">IVA 19%</td><td style="text-align:right">{_fmt_chl(boleta['iva'])}</td></tr>
-      <tr><td colspan="2" style="text-align:right">Total a pagar</td><td style="text-align:right">{_fmt_chl(boleta['total'])}</td></tr>
-    </tfoot>
-  </table>
-</body></html>"""
-    return html
\ No newline at end of file
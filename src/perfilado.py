@@ -0,0 +1,143 @@
+# src/perfilado.py
+"""
+Perfilado opcional de cada rerun de Streamlit (APP_PERFILAR=1).
+
+app.py envuelve el rerun completo con rerun(vista) y las vistas/funciones de
+menú se marcan con @medir() o `with seccion("nombre"):`. Cada sección anota su
+tiempo total y cuánto de ese tiempo fue BD (instrumentacion.tiempo_bd, si la
+medición de consultas está activa); el resto es Python/pandas/widgets.
+
+Se acumula por proceso, por (vista, sección): llamadas, media, p50/p95 y máximo
+de los últimos MUESTRAS reruns. Con APP_PERFIL_ARCHIVO cada rerun se agrega
+como una línea JSON a ese archivo. Apagado, @medir devuelve la función tal cual
+y seccion() no hace nada.
+"""
+from __future__ import annotations
+
+import contextlib
+import functools
+import json
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+try:
+    import instrumentacion
+except ImportError:
+    from . import instrumentacion
+
+ACTIVO = os.getenv("APP_PERFILAR", "0") == "1"
+ARCHIVO = os.getenv("APP_PERFIL_ARCHIVO") or None
+MUESTRAS = 200
+
+_hilo = threading.local()
+_lock = threading.Lock()
+# (vista, sección) -> {"n", "total", "bd", "max", "ultimos": deque}
+_agregado: Dict[Tuple[str, str], Dict[str, Any]] = {}
+_NADA = contextlib.nullcontext()
+
+
+def _anotar(vista: str, ruta: str, seg: float, bd: float):
+    with _lock:
+        e = _agregado.get((vista, ruta))
+        if e is None:
+            e = _agregado[(vista, ruta)] = {"n": 0, "total": 0.0, "bd": 0.0, "max": 0.0,
+                                            "ultimos": deque(maxlen=MUESTRAS)}
+        e["n"] += 1
+        e["total"] += seg
+        e["bd"] += bd
+        e["max"] = max(e["max"], seg)
+        e["ultimos"].append(seg)
+
+
+@contextlib.contextmanager
+def _medir_seccion(nombre: str):
+    pila = getattr(_hilo, "pila", None)
+    if pila is None:  # fuera de un rerun (CLI, benchmarks): no se anota
+        yield
+        return
+    pila.append(nombre)
+    ruta = "/".join(pila)
+    bd0, t0 = instrumentacion.tiempo_bd(), time.perf_counter()
+    try:
+        yield
+    finally:
+        seg, bd = time.perf_counter() - t0, instrumentacion.tiempo_bd() - bd0
+        pila.pop()
+        _hilo.secciones.append({"seccion": ruta, "ms": round(1000 * seg, 2), "bd_ms": round(1000 * bd, 2)})
+        _anotar(_hilo.vista, ruta, seg, bd)
+
+
+def seccion(nombre: str):
+    """Context manager que mide un tramo de la vista en curso."""
+    return _medir_seccion(nombre) if ACTIVO else _NADA
+
+
+def medir(nombre: Optional[str] = None) -> Callable:
+    """Decorador: mide cada llamada como una sección (por defecto 'modulo.funcion')."""
+    def deco(fn):
+        if not ACTIVO:
+            return fn
+        # por archivo y no por __module__: Streamlit ejecuta app.py como __main__
+        modulo = os.path.splitext(os.path.basename(fn.__code__.co_filename))[0]
+        etiqueta = nombre or f"{modulo}.{fn.__name__}"
+
+        @functools.wraps(fn)
+        def envoltura(*args, **kwargs):
+            with _medir_seccion(etiqueta):
+                return fn(*args, **kwargs)
+        return envoltura
+    return deco
+
+
+@contextlib.contextmanager
+def rerun(vista: str, ultimo: Optional[Dict[str, Any]] = None):
+    """
+    Mide un rerun completo de la `vista`. Al salir (aunque sea por st.rerun/st.stop)
+    llena `ultimo` con {"vista", "ms", "bd_ms", "secciones"}.
+    """
+    if not ACTIVO:
+        yield
+        return
+    _hilo.pila, _hilo.secciones, _hilo.vista = [], [], vista
+    bd0, t0 = instrumentacion.tiempo_bd(), time.perf_counter()
+    try:
+        yield
+    finally:
+        seg, bd = time.perf_counter() - t0, instrumentacion.tiempo_bd() - bd0
+        _anotar(vista, "(rerun)", seg, bd)
+        r = {"momento": time.time(), "vista": vista, "ms": round(1000 * seg, 2),
+             "bd_ms": round(1000 * bd, 2), "secciones": _hilo.secciones}
+        _hilo.pila = None
+        if ultimo is not None:
+            ultimo.clear()
+            ultimo.update(r)
+        if ARCHIVO:
+            try:
+                with open(ARCHIVO, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(r, ensure_ascii=False) + "\n")
+            except OSError:
+                pass
+
+
+def resumen() -> List[Dict[str, Any]]:
+    """Agregado por (vista, sección), ordenado por tiempo total."""
+    with _lock:
+        filas = [(k, dict(e, ultimos=sorted(e["ultimos"]))) for k, e in _agregado.items()]
+    out = []
+    for (vista, ruta), e in filas:
+        u = e["ultimos"]
+        p = lambda q: 1000 * u[min(len(u) - 1, int(len(u) * q))] if u else 0.0
+        out.append({"vista": vista, "seccion": ruta, "llamadas": e["n"],
+                    "media_ms": 1000 * e["total"] / e["n"], "p50_ms": p(0.5), "p95_ms": p(0.95),
+                    "max_ms": 1000 * e["max"], "bd_pct": 100 * e["bd"] / e["total"] if e["total"] else 0.0,
+                    "total_ms": 1000 * e["total"]})
+    out.sort(key=lambda r: r["total_ms"], reverse=True)
+    return out
+
+
+def limpiar():
+    with _lock:
+        _agregado.clear()
@@ -0,0 +1,101 @@
+# src/plan_consultas.py
+"""
+Revisa el EXPLAIN QUERY PLAN de las consultas frecuentes de orden_compra.py y
+falla si alguna recorre una tabla completa (SCAN sin índice).
+
+    python src/plan_consultas.py        # código de salida 1 si hay regresiones
+"""
+from __future__ import annotations
+
+import re
+import sys
+from typing import Any, Dict, List, Tuple
+
+try:
+    import boleta_html
+    import db
+    import emision_lote
+    import migraciones
+    import orden_compra as oc
+except ImportError:
+    from . import boleta_html
+    from . import db
+    from . import emision_lote
+    from . import migraciones
+    from . import orden_compra as oc
+
+# nombre -> (sql, parámetros de ejemplo, índices que se pueden recorrer en orden).
+# Los valores de los parámetros no importan, solo el plan. Un SCAN sobre un índice
+# solo se acepta cuando ese recorrido ordenado + LIMIT es justamente el plan buscado.
+CONSULTAS: Dict[str, Tuple[str, Tuple[Any, ...], Tuple[str, ...]]] = {
+    "listar_ordenes": (oc._SQL_LISTAR, (200,), ("idx_oc_creado",)),
+    "listar_ordenes_usuario": (oc._SQL_LISTAR_USUARIO, (1, 200), ()),
+    "listar_ordenes_desde": (oc._SQL_LISTAR_DESDE, ("2025-01-01 00:00:00", 1, 50), ()),
+    "listar_ordenes_usuario_desde": (oc._SQL_LISTAR_USUARIO_DESDE, (1, "2025-01-01 00:00:00", 1, 50), ()),
+    "obtener_orden_por_numero": (oc._SQL_ORDEN_POR_NUMERO, ("OC-0001",), ()),
+    "datos_boleta": (oc._SQL_DATOS_BOLETA, ("OC-0001",), ()),
+    "obtener_boleta_por_numero": (oc._SQL_BOLETA_POR_NUMERO, ("BL-0001",), ()),
+    "obtener_boleta_por_orden": (oc._SQL_BOLETA_POR_ORDEN, ("OC-0001",), ()),
+    "buscar_ordenes": (oc._SQL_BUSCAR, ('"ferreteria"*', 50), ()),
+    "buscar_ordenes_usuario": (oc._SQL_BUSCAR_USUARIO, ('"ferreteria"*', 1, 50), ()),
+    "boletas_pendientes": (emision_lote._SQL_PENDIENTES, (0, 1000), ()),
+    "montos_boletas_pendientes": (emision_lote._SQL_TOTALES, (1, 1000), ()),
+    "boletas_del_dia": (boleta_html._SQL_NUMEROS_DIA, ("2025-01-01 00:00:00", "2025-01-02 00:00:00"), ()),
+    "boletas_del_dia_detalle": (boleta_html._SQL_BOLETAS_DIA, ("2025-01-01 00:00:00", "2025-01-02 00:00:00"), ()),
+}
+
+_RE_SCAN = re.compile(r"^SCAN (\w+)(?: USING (?:COVERING )?INDEX (\w+))?")
+_RE_SEARCH_SIN_INDICE = re.compile(r"^SEARCH (\w+)$")
+# Búsqueda FTS5 resuelta por su índice (":M" = MATCH), no un recorrido de la tabla
+_RE_FTS_MATCH = re.compile(r"^SCAN \w+ VIRTUAL TABLE INDEX \d+:M")
+_RE_SUBCONSULTA = re.compile(r"^(?:CO-ROUTINE|MATERIALIZE) (\w+)")
+
+
+def plan(cur, sql: str, params: Tuple[Any, ...]) -> List[str]:
+    cur.execute("EXPLAIN QUERY PLAN " + sql, params)
+    return [r[3] for r in cur.fetchall()]
+
+
+def escaneos(detalles: List[str], indices_ok: Tuple[str, ...] = ()) -> List[str]:
+    """
+    Líneas que recorren una tabla real: SCAN (los CTE/subconsultas no cuentan)
+    y SEARCH sin índice, que SQLite usa p. ej. para MAX(id) con filtro no indexado.
+    """
+    subconsultas = {m.group(1) for d in detalles if (m := _RE_SUBCONSULTA.match(d))}
+    malos = []
+    for d in detalles:
+        m = _RE_SCAN.match(d)
+        if _RE_FTS_MATCH.match(d):
+            continue
+        if m and m.group(1) not in subconsultas and m.group(2) not in indices_ok:
+            malos.append(d)
+        elif _RE_SEARCH_SIN_INDICE.match(d):
+            malos.append(d)
+    return malos
+
+
+def verificar() -> Dict[str, List[str]]:
+    """Retorna {consulta: [líneas SCAN]} solo para las consultas con regresión."""
+    migraciones.asegurar_schema()
+    fallas: Dict[str, List[str]] = {}
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        for nombre, (sql, params, indices_ok) in CONSULTAS.items():
+            malos = escaneos(plan(cur, sql, params), indices_ok)
+            if malos:
+                fallas[nombre] = malos
+    return fallas
+
+
+def main() -> int:
+    fallas = verificar()
+    for nombre in CONSULTAS:
+        estado = "SCAN" if nombre in fallas else "ok"
+        print(f"{estado:<5} {nombre}")
+        for d in fallas.get(nombre, []):
+            print(f"        {d}")
+    return 1 if fallas else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
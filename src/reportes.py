@@ -0,0 +1,176 @@
+# src/reportes.py
+"""
+Agregados de ventas mantenidos en línea para el panel de reportes.
+
+`ventas_diarias` guarda una fila por (día local, región, comuna, usuario) con el conteo
+y neto de órdenes y el conteo/neto/IVA/total de boletas. Cada escritura suma su
+aporte dentro de la misma transacción que inserta la orden o la boleta (upsert
+sobre la clave), así el panel solo lee este rollup y no recorre el historial.
+
+Si alguna vez se desalinea (edición manual de la BD), se rehace desde las tablas base:
+
+    python src/reportes.py --reconstruir
+"""
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import sqlite3
+import sys
+from typing import Any, Dict, List, Optional
+
+try:
+    import db
+except ImportError:
+    from . import db
+
+# Órdenes/boletas sin usuario se agrupan bajo 0 (NULL no sirve en la clave primaria);
+# suma() (TOTAL en SQLite) y no SUM() a secas porque boletas antiguas tienen montos NULL
+SIN_USUARIO = 0
+
+# Máximo de parámetros por IN (...)
+_LOTE_IN = 500
+
+_CLAVE = ("dia", "region", "comuna", "user_id")
+_d = db.dialecto()
+_GRUPO = (f"COALESCE({_d.dia('creado_en')}, '') AS dia, COALESCE(region, '') AS region, "
+          f"COALESCE(comuna, '') AS comuna, COALESCE(user_id, 0) AS user_id")
+_GRUPO_POR = f"COALESCE({_d.dia('creado_en')}, ''), COALESCE(region, ''), COALESCE(comuna, ''), COALESCE(user_id, 0)"
+
+_SQL_ACUMULAR_ORDENES = _d.upsert(
+    "ventas_diarias", _CLAVE + ("ordenes", "neto_ordenes"), _CLAVE,
+    {"ordenes": "{actual}.ordenes + {nuevo}.ordenes",
+     "neto_ordenes": "{actual}.neto_ordenes + {nuevo}.neto_ordenes"},
+    origen=f"""
+    SELECT {_GRUPO}, COUNT(*) AS ordenes, {_d.suma('total')} AS neto_ordenes
+    FROM ordenes_compra
+    WHERE {{filtro}}
+    GROUP BY {_GRUPO_POR}
+""")
+
+_SQL_ACUMULAR_BOLETAS = _d.upsert(
+    "ventas_diarias", _CLAVE + ("boletas", "neto", "iva", "total"), _CLAVE,
+    {"boletas": "{actual}.boletas + {nuevo}.boletas", "neto": "{actual}.neto + {nuevo}.neto",
+     "iva": "{actual}.iva + {nuevo}.iva", "total": "{actual}.total + {nuevo}.total"},
+    origen=f"""
+    SELECT {_GRUPO}, COUNT(*) AS boletas, {_d.suma('neto')} AS neto,
+           {_d.suma('iva')} AS iva, {_d.suma('total')} AS total
+    FROM boletas
+    WHERE {{filtro}}
+    GROUP BY {_GRUPO_POR}
+""")
+
+
+# ----------------- MANTENCIÓN (dentro de la transacción del llamador) -----------------
+def acumular_ordenes(cur: sqlite3.Cursor, id_desde: int, id_hasta: Optional[int] = None):
+    """Suma al rollup las órdenes con id entre `id_desde` e `id_hasta` recién insertadas."""
+    cur.execute(_SQL_ACUMULAR_ORDENES.format(filtro="id BETWEEN ? AND ?"),
+                (id_desde, id_desde if id_hasta is None else id_hasta))
+
+
+def acumular_boletas(cur: sqlite3.Cursor, id_desde: int, id_hasta: Optional[int] = None):
+    """Suma al rollup las boletas con id entre `id_desde` e `id_hasta` recién insertadas."""
+    cur.execute(_SQL_ACUMULAR_BOLETAS.format(filtro="id BETWEEN ? AND ?"),
+                (id_desde, id_desde if id_hasta is None else id_hasta))
+
+
+# Los lotes (importador, emision_lote) se suman por número y no por rango de id:
+# fuera de SQLite no hay lock que garantice que sus ids salgan contiguos.
+def _acumular_por_numero(cur: sqlite3.Cursor, sql: str, columna: str, numeros: List[str]):
+    for i in range(0, len(numeros), _LOTE_IN):
+        parte = numeros[i:i + _LOTE_IN]
+        cur.execute(sql.format(filtro=f"{columna} IN ({','.join('?' * len(parte))})"), parte)
+
+
+def acumular_ordenes_numeros(cur: sqlite3.Cursor, numeros: List[str]):
+    """Suma al rollup las órdenes recién insertadas con esos números de OC."""
+    _acumular_por_numero(cur, _SQL_ACUMULAR_ORDENES, "numero_orden", numeros)
+
+
+def acumular_boletas_numeros(cur: sqlite3.Cursor, numeros: List[str]):
+    """Suma al rollup las boletas recién insertadas con esos números BL."""
+    _acumular_por_numero(cur, _SQL_ACUMULAR_BOLETAS, "numero_boleta", numeros)
+
+
+def reconstruir(cur: sqlite3.Cursor):
+    """Rehace el rollup completo desde ordenes_compra y boletas (recorre todo el historial)."""
+    cur.execute("DELETE FROM ventas_diarias")
+    cur.execute(_SQL_ACUMULAR_ORDENES.format(filtro="1 = 1"))
+    cur.execute(_SQL_ACUMULAR_BOLETAS.format(filtro="1 = 1"))
+
+
+# ----------------- LECTURA (solo el rollup) -----------------
+DIMENSIONES = ("dia", "region", "comuna", "user_id")
+
+
+def _rango(desde: Optional[dt.date], hasta: Optional[dt.date]):
+    cond, params = [], []
+    if desde:
+        cond.append("dia >= ?")
+        params.append(desde.isoformat())
+    if hasta:
+        cond.append("dia <= ?")
+        params.append(hasta.isoformat())
+    return (f"WHERE {' AND '.join(cond)}" if cond else ""), params
+
+
+def resumen(desde: Optional[dt.date] = None, hasta: Optional[dt.date] = None) -> Dict[str, Any]:
+    where, params = _rango(desde, hasta)
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT COALESCE(SUM(ordenes), 0), COALESCE(SUM(neto_ordenes), 0),
+                   COALESCE(SUM(boletas), 0), COALESCE(SUM(neto), 0),
+                   COALESCE(SUM(iva), 0), COALESCE(SUM(total), 0)
+            FROM ventas_diarias {where}
+        """, params)
+        r = cur.fetchone()
+    return dict(zip(("ordenes", "neto_ordenes", "boletas", "neto", "iva", "total"), r))
+
+
+def agrupado(dimension: str, desde: Optional[dt.date] = None,
+             hasta: Optional[dt.date] = None) -> List[Dict[str, Any]]:
+    """Totales por `dimension` (dia, region, comuna o user_id), de mayor a menor venta; por día en orden cronológico."""
+    if dimension not in DIMENSIONES:
+        raise ValueError(f"Dimensión no soportada: {dimension}")
+    where, params = _rango(desde, hasta)
+    orden = "dia" if dimension == "dia" else "SUM(total) DESC, SUM(neto_ordenes) DESC"
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        cur.execute(f"""
+            SELECT {dimension}, SUM(ordenes), SUM(neto_ordenes), SUM(boletas),
+                   SUM(neto), SUM(iva), SUM(total)
+            FROM ventas_diarias {where}
+            GROUP BY {dimension}
+            ORDER BY {orden}
+        """, params)
+        rows = cur.fetchall()
+    claves = (dimension, "ordenes", "neto_ordenes", "boletas", "neto", "iva", "total")
+    return [dict(zip(claves, r)) for r in rows]
+
+
+# ----------------- CLI -----------------
+def main(argv: Optional[List[str]] = None) -> int:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--reconstruir", action="store_true", help="rehace ventas_diarias desde cero")
+    args = ap.parse_args(argv)
+
+    try:
+        import migraciones
+    except ImportError:
+        from . import migraciones
+    migraciones.asegurar_schema()
+    if args.reconstruir:
+        with db.conexion() as conn:
+            cur = conn.cursor()
+            db.iniciar_escritura(cur)
+            reconstruir(cur)
+            conn.commit()
+    r = resumen()
+    print(f"Órdenes: {r['ordenes']}  Boletas: {r['boletas']}  "
+          f"Neto: {r['neto']:.0f}  IVA: {r['iva']:.0f}  Total: {r['total']:.0f}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
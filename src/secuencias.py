@@ -0,0 +1,45 @@
+from __future__ import annotations
+
+import re
+import sqlite3
+from typing import Optional
+
+# Numeradores correlativos (OC-####, BL-####) respaldados por la tabla `secuencias`.
+# Cada numerador es una fila: tomar el siguiente valor es un UPDATE por clave
+# primaria, O(1) sin importar cuántas órdenes o boletas existan. La tabla y sus
+# valores iniciales los crea el paso 4 de migraciones.py.
+
+def actual(cur: sqlite3.Cursor, nombre: str) -> int:
+    cur.execute("SELECT valor FROM secuencias WHERE nombre = ?", (nombre,))
+    row = cur.fetchone()
+    return int(row[0]) if row else 0
+
+def siguiente(cur: sqlite3.Cursor, nombre: str) -> int:
+    """
+    Toma el siguiente valor. Debe llamarse dentro de la transacción que usa el
+    número: el UPDATE bloquea la fila hasta el commit, así dos escritores
+    concurrentes nunca reciben el mismo valor.
+    """
+    cur.execute("UPDATE secuencias SET valor = valor + 1 WHERE nombre = ?", (nombre,))
+    if cur.rowcount == 0:
+        raise RuntimeError(f"Secuencia no inicializada: {nombre}")
+    return actual(cur, nombre)
+
+def reservar_bloque(cur: sqlite3.Cursor, nombre: str, cantidad: int) -> int:
+    """Toma `cantidad` valores contiguos en un solo UPDATE. Retorna el primero."""
+    cur.execute("UPDATE secuencias SET valor = valor + ? WHERE nombre = ?", (int(cantidad), nombre))
+    if cur.rowcount == 0:
+        raise RuntimeError(f"Secuencia no inicializada: {nombre}")
+    return actual(cur, nombre) - int(cantidad) + 1
+
+def ajustar_minimo(cur: sqlite3.Cursor, nombre: str, valor: int):
+    """Garantiza que el numerador no entregue valores <= `valor` (números asignados a mano)."""
+    cur.execute("UPDATE secuencias SET valor = ? WHERE nombre = ? AND valor < ?",
+                (int(valor), nombre, int(valor)))
+
+def formatear(pref: str, n: int) -> str:
+    return f"{pref}{n:04d}"
+
+def parsear(regex: re.Pattern, code: Optional[str]) -> Optional[int]:
+    m = regex.match(code or "")
+    return int(m.group(1)) if m else None
@@ -0,0 +1,115 @@
+# src/sesiones.py
+"""
+Sesiones de login del lado del servidor.
+
+Al ingresar se entrega un token aleatorio (app.py lo guarda en una cookie
+SameSite=Strict, nunca en la URL) y en la tabla `sesiones` se guarda solo su SHA-256: el token ya tiene 256 bits de azar, no
+necesita un KDF lento. Con el token, un refresco del navegador recupera la
+sesión sin volver a verificar la contraseña.
+
+Delante de la tabla hay un LRU en memoria (token_hash -> user_id, expira_en);
+una entrada se vuelve a confirmar contra la BD a lo más cada SESION_REVALIDAR
+segundos, así un cierre de sesión hecho en otro proceso se nota pronto.
+"""
+from __future__ import annotations
+
+import hashlib
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+try:
+    import db
+except ImportError:
+    from . import db
+
+SESION_TTL = float(os.getenv("SESION_TTL", str(12 * 3600)))
+SESION_LRU = int(os.getenv("SESION_LRU", "1024"))
+SESION_REVALIDAR = float(os.getenv("SESION_REVALIDAR", "60"))
+
+# token_hash -> (user_id, expira_en, revisar_en)
+_lru: "OrderedDict[str, Tuple[int, float, float]]" = OrderedDict()
+_lock = threading.Lock()
+
+
+def _hash(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _recordar(token_hash: str, user_id: int, expira: float, ahora: float):
+    with _lock:
+        _lru[token_hash] = (user_id, expira, ahora + SESION_REVALIDAR)
+        _lru.move_to_end(token_hash)
+        while len(_lru) > SESION_LRU:
+            _lru.popitem(last=False)
+
+
+def _olvidar(token_hash: str):
+    with _lock:
+        _lru.pop(token_hash, None)
+
+
+def crear(user_id: int) -> str:
+    """Abre una sesión y retorna el token (solo el cliente lo conoce en claro)."""
+    token = secrets.token_urlsafe(32)
+    token_hash, ahora = _hash(token), time.time()
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        # de paso se barren las vencidas (índice por expira_en)
+        cur.execute("DELETE FROM sesiones WHERE expira_en < ?", (ahora,))
+        cur.execute(
+            "INSERT INTO sesiones (token_hash, user_id, creada_en, expira_en) VALUES (?, ?, ?, ?)",
+            (token_hash, user_id, ahora, ahora + SESION_TTL),
+        )
+        conn.commit()
+    _recordar(token_hash, user_id, ahora + SESION_TTL, ahora)
+    return token
+
+
+def validar(token: Optional[str]) -> Optional[int]:
+    """user_id de la sesión o None si el token no existe o venció."""
+    if not token:
+        return None
+    token_hash, ahora = _hash(token), time.time()
+    with _lock:
+        en_memoria = _lru.get(token_hash)
+        if en_memoria is not None:
+            _lru.move_to_end(token_hash)
+    if en_memoria is not None:
+        user_id, expira, revisar_en = en_memoria
+        if expira <= ahora:
+            _olvidar(token_hash)
+            return None
+        if ahora < revisar_en:
+            return user_id
+    with db.conexion() as conn:
+        cur = conn.cursor()
+        cur.execute("SELECT user_id, expira_en FROM sesiones WHERE token_hash = ? AND expira_en > ?",
+                    (token_hash, ahora))
+        row = cur.fetchone()
+    if not row:
+        _olvidar(token_hash)
+        return None
+    _recordar(token_hash, row[0], row[1], ahora)
+    return row[0]
+
+
+def cerrar(token: Optional[str]):
+    if not token:
+        return
+    token_hash = _hash(token)
+    with db.conexion() as conn:
+        conn.execute("DELETE FROM sesiones WHERE token_hash = ?", (token_hash,))
+        conn.commit()
+    _olvidar(token_hash)
+
+
+def cerrar_de_usuario(cur, user_id: int):
+    """Cierra todas las sesiones de un usuario (dentro de la transacción del llamador)."""
+    cur.execute("DELETE FROM sesiones WHERE user_id = ?", (user_id,))
+    with _lock:
+        for h in [h for h, v in _lru.items() if v[0] == user_id]:
+            del _lru[h]
@@ -0,0 +1,128 @@
+# tests/test_integracion.py
+"""
+Pruebas de integración de la capa de datos. Cada una corre en un proceso
+aparte sobre una copia temporal de la base (DB_SQLITE_PATH), porque db.py y
+los dialectos leen su configuración al importarse:
+
+  - migraciones 1..N sobre la base poblada del repositorio (database/proyecto.db)
+  - el recorrido de driver_falso.py (la app con sintaxis de servidor)
+  - plan_consultas.py (ninguna consulta frecuente recorre una tabla completa)
+
+    python -m pytest -q tests
+"""
+from __future__ import annotations
+
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import sys
+
+import pytest
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SRC = os.path.join(RAIZ, "src")
+BASE = os.path.join(RAIZ, "database", "proyecto.db")
+
+# v5 borra items_json con ALTER TABLE ... DROP COLUMN (SQLite 3.35+)
+requiere_drop_column = pytest.mark.skipif(
+    sqlite3.sqlite_version_info < (3, 35), reason="DROP COLUMN requiere SQLite >= 3.35")
+
+
+def _correr(args, ruta_db, **env):
+    entorno = dict(os.environ, DB_SQLITE_PATH=str(ruta_db), DB_ENGINE="sqlite", PYTHONPATH=SRC, **env)
+    return subprocess.run([sys.executable, *args], cwd=SRC, env=entorno,
+                          capture_output=True, text=True, timeout=300)
+
+
+def _migrar(ruta_db):
+    return _correr(["-c", "import migraciones; print(migraciones.asegurar_schema())"], ruta_db)
+
+
+def _columnas(conn, tabla):
+    return {r[1] for r in conn.execute(f"PRAGMA table_info({tabla})")}
+
+
+@pytest.fixture
+def base(tmp_path):
+    """Copia de la base poblada del repositorio, todavía sin migrar."""
+    ruta = tmp_path / "proyecto.db"
+    shutil.copyfile(BASE, ruta)
+    return ruta
+
+
+# ----------------- MIGRACIONES -----------------
+@requiere_drop_column
+def test_migraciones_sobre_base_poblada(base):
+    with sqlite3.connect(base) as conn:
+        lineas_json = {
+            numero: json.loads(items or "[]")
+            for numero, items in conn.execute("SELECT numero_orden, items_json FROM ordenes_compra")
+        }
+        boletas = conn.execute("SELECT COUNT(*) FROM boletas").fetchone()[0]
+
+    r = _migrar(base)
+    assert r.returncode == 0, r.stderr
+
+    r = _correr(["-c", "import migraciones; print(migraciones.MIGRACIONES[-1][0])"], base)
+    ultima = int(r.stdout)
+
+    with sqlite3.connect(base) as conn:
+        assert conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] == ultima
+        # v5: el detalle pasa completo a orden_items y recién entonces se borra items_json
+        assert "items_json" not in _columnas(conn, "ordenes_compra")
+        assert "items_json" not in _columnas(conn, "boletas")
+        copiadas = {}
+        for numero, producto, precio, cantidad in conn.execute("""
+            SELECT o.numero_orden, i.producto, i.precio, i.cantidad
+            FROM orden_items i JOIN ordenes_compra o ON o.id = i.orden_id
+            ORDER BY o.numero_orden, i.linea
+        """):
+            copiadas.setdefault(numero, []).append((producto, precio, cantidad))
+        esperadas = {
+            numero: [(it["producto"].strip(), float(it["precio"]), int(it["cantidad"])) for it in items]
+            for numero, items in lineas_json.items() if items
+        }
+        assert copiadas == esperadas
+        # v4: los numeradores parten del máximo ya usado
+        valores = dict(conn.execute("SELECT nombre, valor FROM secuencias"))
+        assert valores["boletas"] >= boletas
+        # v8: el rollup cuadra con las tablas base
+        ordenes, total = conn.execute("SELECT SUM(ordenes), SUM(boletas) FROM ventas_diarias").fetchone()
+        assert ordenes == len(lineas_json) and total == boletas
+
+    # Una segunda pasada no aplica nada
+    r = _migrar(base)
+    assert r.returncode == 0 and r.stdout.strip() == "[]", (r.stdout, r.stderr)
+
+
+@requiere_drop_column
+def test_migracion_v5_se_detiene_con_items_ilegibles(base):
+    with sqlite3.connect(base) as conn:
+        numero = conn.execute("SELECT MIN(numero_orden) FROM ordenes_compra").fetchone()[0]
+        conn.execute("UPDATE ordenes_compra SET items_json = '{roto' WHERE numero_orden = ?", (numero,))
+
+    r = _migrar(base)
+    assert r.returncode != 0 and numero in r.stderr
+
+    with sqlite3.connect(base) as conn:
+        assert conn.execute("SELECT MAX(version) FROM schema_version").fetchone()[0] == 4
+        assert "items_json" in _columnas(conn, "ordenes_compra")
+        assert conn.execute("SELECT items_json FROM ordenes_compra WHERE numero_orden = ?",
+                            (numero,)).fetchone()[0] == "{roto"
+
+
+# ----------------- DIALECTOS Y PLANES -----------------
+@pytest.mark.parametrize("con_base", [False, True], ids=["vacia", "poblada"])
+def test_driver_falso(tmp_path, con_base):
+    args = [os.path.join(SRC, "driver_falso.py")] + (["--base", BASE] if con_base else [])
+    r = _correr(args, tmp_path / "no_se_usa.db")
+    assert r.returncode == 0, r.stdout + r.stderr
+    assert "FALLA" not in r.stdout
+
+
+@requiere_drop_column
+def test_plan_consultas(base):
+    r = _correr([os.path.join(SRC, "plan_consultas.py")], base)
+    assert r.returncode == 0, r.stdout + r.stderr